@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'investment_manager_main.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -54,7 +56,7 @@ ROOT_URLCONF = 'investment_manager.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'investment_manager_main.metrics.InstrumentedDjangoTemplates',
         'DIRS': [BASE_DIR / "investment_manager_main/templates"],  # Explicit path
         'APP_DIRS': True,
         'OPTIONS': {
@@ -125,4 +127,16 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 LOGIN_REDIRECT_URL = 'dashboard'  
-LOGOUT_REDIRECT_URL = 'home'  
+LOGOUT_REDIRECT_URL = 'home'
+
+# When enabled, mock trades are queued as MockOrder rows and settled by the
+# process_mock_orders command instead of inside the request.
+MOCK_TRADE_QUEUE = os.getenv("MOCK_TRADE_QUEUE", "").lower() in ("1", "true", "yes")
+
+# Per-request metrics, served at /metrics. Set METRICS_TOKEN to require it as
+# a bearer token. Without a token, only staff users and requests from
+# localhost can read it (behind a local reverse proxy every request looks
+# local, so set a token there). METRICS_SERVER_TIMING adds a Server-Timing
+# response header.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+METRICS_SERVER_TIMING = os.getenv("METRICS_SERVER_TIMING", "true").lower() in ("1", "true", "yes")
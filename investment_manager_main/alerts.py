@@ -0,0 +1,140 @@
+"""
+Stock alert evaluation.
+
+Active alerts are held in memory as one sorted ladder of target prices per
+symbol. An alert fires when the price moves onto or across its target, so
+each update takes the targets between the previous and the new price with
+two bisections: O(log n + k) for k fired alerts. Fired alerts are
+deactivated together with a single UPDATE.
+
+Alerts saved or deleted in this process are picked up immediately through
+model signals; sync() reconciles changes made by other processes.
+"""
+
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from django.db.models.signals import post_delete, post_save
+from django.utils import timezone
+
+from .models import StockAlert
+from .triggers import PriceLadder
+
+
+class FiredAlert(NamedTuple):
+    alert_id: int
+    symbol: str
+    target_price: float
+    price: float
+
+    def __str__(self):
+        return f"Alert {self.alert_id} for {self.symbol} at {self.target_price} fired at {self.price}."
+
+
+class AlertEvaluator:
+    """
+    In-memory index of active stock alerts.
+
+    Args:
+        on_fired (Optional[Callable]): Called with the alerts deactivated by
+            each fire_pending() call, e.g. to send notifications.
+    """
+
+    def __init__(self, on_fired: Optional[Callable[[List[FiredAlert]], None]] = None):
+        self.on_fired = on_fired
+        self._ladders: Dict[str, PriceLadder] = defaultdict(PriceLadder)
+        self._alerts: Dict[int, tuple] = {}
+        self._last_prices: Dict[str, float] = {}
+        self._pending: List[FiredAlert] = []
+        self._lock = threading.Lock()
+        post_save.connect(self._on_save, sender=StockAlert)
+        post_delete.connect(self._on_delete, sender=StockAlert)
+
+    def __len__(self) -> int:
+        return len(self._alerts)
+
+    def symbols(self) -> List[str]:
+        with self._lock:
+            return sorted({symbol for symbol, _ in self._alerts.values()})
+
+    def add(self, alert_id: int, symbol: str, target_price: float) -> None:
+        symbol = symbol.upper()
+        with self._lock:
+            if self._alerts.get(alert_id) == (symbol, target_price):
+                return
+            self._discard(alert_id)
+            self._alerts[alert_id] = (symbol, target_price)
+            self._ladders[symbol].add(target_price, alert_id)
+
+    def discard(self, alert_id: int) -> None:
+        with self._lock:
+            self._discard(alert_id)
+
+    def _discard(self, alert_id: int) -> None:
+        entry = self._alerts.pop(alert_id, None)
+        if entry is not None:
+            symbol, target_price = entry
+            self._ladders[symbol].remove(target_price, alert_id)
+
+    def load(self) -> None:
+        """
+        Reconcile with the database: add alerts activated elsewhere and drop those deactivated or deleted.
+
+        Only the ids of active alerts are read unless there are new ones to add.
+        """
+        active = set(StockAlert.objects.filter(is_active=True).values_list("id", flat=True))
+        with self._lock:
+            for alert_id in set(self._alerts) - active:
+                self._discard(alert_id)
+            new = active - set(self._alerts)
+        if not new:
+            return
+
+        rows = StockAlert.objects.filter(is_active=True)
+        if len(new) < len(active):
+            rows = rows.filter(id__in=new)
+        for alert_id, symbol, target_price in rows.values_list("id", "symbol", "target_price").iterator(chunk_size=5000):
+            self.add(alert_id, symbol, target_price)
+
+    def check(self, symbol: str, price: float) -> List[FiredAlert]:
+        """
+        Remove and queue the alerts whose target lies between the last price seen for symbol and this one.
+
+        The first price seen for a symbol only fires alerts set exactly at it.
+        """
+        symbol = symbol.upper()
+        with self._lock:
+            previous = self._last_prices.get(symbol, price)
+            self._last_prices[symbol] = price
+            ladder = self._ladders.get(symbol)
+            if ladder is None:
+                return []
+            taken = ladder.take_between(min(previous, price), max(previous, price))
+            fired = [FiredAlert(alert_id, symbol, target_price, price) for target_price, alert_id in taken]
+            for alert in fired:
+                del self._alerts[alert.alert_id]
+            self._pending.extend(fired)
+        return fired
+
+    def fire_pending(self) -> int:
+        """Deactivate every queued alert with one UPDATE. Returns how many were deactivated."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return 0
+        StockAlert.objects.filter(id__in=[alert.alert_id for alert in pending]).update(
+            is_active=False, triggered_at=timezone.now()
+        )
+        if self.on_fired is not None:
+            self.on_fired(pending)
+        return len(pending)
+
+    def _on_save(self, sender, instance, **kwargs) -> None:
+        if instance.is_active:
+            self.add(instance.id, instance.symbol, instance.target_price)
+        else:
+            self.discard(instance.id)
+
+    def _on_delete(self, sender, instance, **kwargs) -> None:
+        self.discard(instance.id)
@@ -3,28 +3,632 @@ Alpaca API Utility Functions
 Documentation:
 - API Reference: https://alpaca.markets/docs/api-documentation/api-v2/
 - GitHub SDK: https://github.com/alpacahq/alpaca-py
+
+Data comes from the active market-data provider (see providers.py); by
+default that is AlpacaProvider below. Importing this module is cheap: the REST client (and with it
+alpaca_trade_api) is created on first use, and pandas is only imported by the
+functions that return DataFrames. models.py imports this module, so anything
+added at module level here is paid by every manage.py command and test run.
 """
 
+from __future__ import annotations
+
+import asyncio
 import os
-from alpaca_trade_api import REST
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
 from dotenv import load_dotenv
-import pandas as pd
-from typing import Optional, Dict, Any, List
+from typing import (
+    TYPE_CHECKING, Optional, Dict, Any, List, Iterable, Iterator, AsyncIterator, Callable, Tuple, NamedTuple, Awaitable,
+)
 from datetime import datetime, timedelta
 import pytz
 
+from .metrics import record_queue_wait, track_upstream, upstream_queue_depth, upstream_rejected
+from .providers import Asset, MarketDataProvider, get_provider
+from .resilience import (
+    BATCH, INTERACTIVE, PRIORITY_NAMES, CircuitBreaker, CircuitOpenError, PriorityRateLimiter, RateLimitTimeout,
+    SingleFlight,
+)
+
+if TYPE_CHECKING:
+    import pandas as pd
+
 load_dotenv()
 API_KEY = os.getenv("ALPACA_API_KEY")
 SECRET_KEY = os.getenv("ALPACA_SECRET_KEY")
 BASE_URL = os.getenv("ALPACA_BASE_URL", "https://paper-api.alpaca.markets") 
 VALID_TIMEFRAMES = {"1Min", "5Min", "15Min", "1Hour", "1Day"}
 
+# Quote cache tuning. Set ALPACA_QUOTE_CACHE_TTL to 0 to disable caching, and
+# ALPACA_QUOTE_CACHE_ALIAS to a Django cache alias to share quotes between workers.
+QUOTE_CACHE_TTL = float(os.getenv("ALPACA_QUOTE_CACHE_TTL", "15"))
+QUOTE_CACHE_STALE_TTL = float(os.getenv("ALPACA_QUOTE_CACHE_STALE_TTL", "60"))
+QUOTE_CACHE_NEGATIVE_TTL = float(os.getenv("ALPACA_QUOTE_CACHE_NEGATIVE_TTL", "300"))
+QUOTE_CACHE_MAX_SIZE = int(os.getenv("ALPACA_QUOTE_CACHE_MAX_SIZE", "1024"))
+QUOTE_CACHE_ALIAS = os.getenv("ALPACA_QUOTE_CACHE_ALIAS")
+# How old a cached quote may be and still be served when upstream is failing.
+QUOTE_CACHE_FALLBACK_TTL = float(os.getenv("ALPACA_QUOTE_CACHE_FALLBACK_TTL", "86400"))
+
+# Price book filled by the run_price_feed command. Point ALPACA_PRICE_BOOK_ALIAS
+# at a Django cache shared with the feed process so web workers can read it.
+PRICE_BOOK_MAX_AGE = float(os.getenv("ALPACA_PRICE_BOOK_MAX_AGE", "60"))
+PRICE_BOOK_ALIAS = os.getenv("ALPACA_PRICE_BOOK_ALIAS")
+
+# Async client settings.
+DATA_URL = os.getenv("ALPACA_DATA_URL", "https://data.alpaca.markets")
+ASYNC_POOL_SIZE = int(os.getenv("ALPACA_ASYNC_POOL_SIZE", "20"))
+ASYNC_TIMEOUT = float(os.getenv("ALPACA_ASYNC_TIMEOUT", "10"))
+
+# Requests to Alpaca per minute. The limiter is per process: Alpaca allows 200
+# a minute per account, so keep (web and feed processes x ALPACA_RATE_LIMIT)
+# + (concurrent batch commands x ALPACA_BATCH_RATE_LIMIT) under that. Batch
+# commands call use_batch_budget() to switch to the smaller budget. Calls
+# over the limit queue for up to ALPACA_RATE_MAX_WAIT seconds, interactive
+# ones ahead of batch work within a process. Set ALPACA_RATE_LIMIT to 0 to
+# turn the limiter off.
+RATE_LIMIT = float(os.getenv("ALPACA_RATE_LIMIT", "150"))
+BATCH_RATE_LIMIT = float(os.getenv("ALPACA_BATCH_RATE_LIMIT", "30"))
+RATE_BURST = float(os.getenv("ALPACA_RATE_BURST", "10"))
+RATE_MAX_WAIT = float(os.getenv("ALPACA_RATE_MAX_WAIT", "60"))
+
+# Upstream protection: concurrent fetches of the same quote or bar range share
+# one call, and a circuit breaker per endpoint fails fast while errors spike.
+# Callers waiting on another caller's fetch wait at least as long as that
+# fetch may queue for the rate limiter and then take.
+SINGLE_FLIGHT_TIMEOUT = max(float(os.getenv("ALPACA_SINGLE_FLIGHT_TIMEOUT", "15")), RATE_MAX_WAIT + ASYNC_TIMEOUT)
+BREAKER_FAILURE_RATIO = float(os.getenv("ALPACA_BREAKER_FAILURE_RATIO", "0.5"))
+BREAKER_MIN_CALLS = int(os.getenv("ALPACA_BREAKER_MIN_CALLS", "5"))
+BREAKER_WINDOW = float(os.getenv("ALPACA_BREAKER_WINDOW", "30"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("ALPACA_BREAKER_RESET_TIMEOUT", "30"))
+
+_client_lock = threading.Lock()
+
+
+def __getattr__(name: str):
+    # `api` and `REST` are resolved on first access rather than at import time.
+    if name == "api":
+        return get_client()
+    if name == "REST":
+        from alpaca_trade_api import REST
+
+        return REST
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def get_client():
+    """
+    Get the shared REST client, creating it on first use.
+
+    The client is stored as the module attribute ``api``, so patching
+    ``alpaca_api.api`` or ``alpaca_api.REST`` still takes effect.
+    """
+    client = globals().get("api")
+    if client is None:
+        with _client_lock:
+            client = globals().get("api")
+            if client is None:
+                rest = globals().get("REST") or __getattr__("REST")
+                client = globals()["api"] = rest(API_KEY, SECRET_KEY, BASE_URL)
+    return client
+
+
+def reset_client() -> None:
+    """Drop the shared REST client so the next call builds a new one, e.g. after rotating keys."""
+    with _client_lock:
+        globals().pop("api", None)
+
+PriceFetcher = Callable[[List[str]], Dict[str, Optional[float]]]
+AsyncPriceFetcher = Callable[[List[str]], Awaitable[Dict[str, Optional[float]]]]
+
+
+class Quote(NamedTuple):
+    price: Optional[float]
+    as_of: datetime
+
+
+class QuoteCache:
+    """
+    Cache of latest trade prices keyed by symbol.
+
+    Entries younger than ``ttl`` are served as-is. Entries within the following
+    ``stale_ttl`` seconds are still served, but a background thread refreshes
+    them (stale-while-revalidate). Symbols Alpaca does not know are cached as
+    None for ``negative_ttl`` seconds. Entries live in an in-process LRU of
+    ``max_size`` symbols unless ``cache_alias`` names a Django cache, in which
+    case every worker shares them and eviction is left to that backend.
+
+    When a fetch fails for a symbol, its last price is served instead as long
+    as it is younger than ``fallback_ttl``, with its original fetch time.
+
+    Fetchers receive a list of symbols and return a dict with a price, or None
+    for unknown symbols. Symbols missing from the result failed to fetch and
+    are not cached.
+    """
+
+    key_prefix = "alpaca:quote:"
+
+    def __init__(self, ttl: float, stale_ttl: float = 0, negative_ttl: float = 0,
+                 max_size: int = 1024, cache_alias: Optional[str] = None, fallback_ttl: float = 0):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.negative_ttl = negative_ttl
+        self.fallback_ttl = fallback_ttl
+        self.max_size = max_size
+        self.cache_alias = cache_alias
+        self._entries: "OrderedDict[str, Tuple[Optional[float], float]]" = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    def get_many(self, symbols: List[str], fetch: PriceFetcher) -> Dict[str, Optional[float]]:
+        """
+        Get prices for symbols, calling fetch once for every symbol not in the cache.
+
+        Returns:
+            Dict[str, Optional[float]]: Prices for the symbols that were cached or fetched.
+        """
+        return {symbol: price for symbol, (price, _) in self.get_entries(symbols, fetch).items()}
+
+    def get_entries(self, symbols: List[str], fetch: PriceFetcher) -> Dict[str, Tuple[Optional[float], float]]:
+        """
+        Like get_many, but also return the epoch time each price was fetched at.
+
+        Returns:
+            Dict[str, Tuple[Optional[float], float]]: (price, fetched_at) for the
+            symbols that were cached or fetched.
+        """
+        if self.ttl <= 0:
+            return self._stamp(fetch(symbols))
+
+        found, missing, stale, expired = self._partition(symbols)
+        if stale:
+            self._revalidate(stale, fetch)
+        if missing:
+            fetched = fetch(missing)
+            self._store(fetched)
+            found.update(self._stamp(fetched))
+            found.update(self._fall_back(missing, fetched, expired))
+        return found
+
+    async def aget_entries(self, symbols: List[str], afetch: AsyncPriceFetcher,
+                           fetch: PriceFetcher) -> Dict[str, Tuple[Optional[float], float]]:
+        """
+        Async version of get_entries. Misses are fetched by awaiting afetch; stale
+        entries are still refreshed on a background thread with fetch, so the
+        refresh outlives the event loop of a single request.
+        """
+        if self.ttl <= 0:
+            return self._stamp(await afetch(symbols))
+
+        found, missing, stale, expired = self._partition(symbols)
+        if stale:
+            self._revalidate(stale, fetch)
+        if missing:
+            fetched = await afetch(missing)
+            self._store(fetched)
+            found.update(self._stamp(fetched))
+            found.update(self._fall_back(missing, fetched, expired))
+        return found
+
+    def _partition(self, symbols: List[str]):
+        """
+        Split symbols into usable cached entries, symbols to fetch now and
+        symbols to refresh, plus the expired prices to fall back on.
+        """
+        now = time.time()
+        entries = self._load(symbols)
+        found: Dict[str, Tuple[Optional[float], float]] = {}
+        expired: Dict[str, Tuple[Optional[float], float]] = {}
+        missing, stale = [], []
+        for symbol in symbols:
+            entry = entries.get(symbol)
+            if entry is None:
+                missing.append(symbol)
+                continue
+            price, fetched_at = entry
+            age = now - fetched_at
+            if price is None:
+                if age < self.negative_ttl:
+                    found[symbol] = entry
+                else:
+                    missing.append(symbol)
+            elif age < self.ttl:
+                found[symbol] = entry
+            elif age < self.ttl + self.stale_ttl:
+                found[symbol] = entry
+                stale.append(symbol)
+            else:
+                missing.append(symbol)
+                if age < self.fallback_ttl:
+                    expired[symbol] = entry
+        return found, missing, stale, expired
+
+    @staticmethod
+    def _fall_back(missing: List[str], fetched: Dict[str, Optional[float]],
+                   expired: Dict[str, Tuple[Optional[float], float]]) -> Dict[str, Tuple[Optional[float], float]]:
+        return {symbol: expired[symbol] for symbol in missing if symbol not in fetched and symbol in expired}
+
+    @staticmethod
+    def _stamp(prices: Dict[str, Optional[float]]) -> Dict[str, Tuple[Optional[float], float]]:
+        now = time.time()
+        return {symbol: (price, now) for symbol, price in prices.items()}
+
+    def clear(self) -> None:
+        """Drop every entry held in this process. Shared Django cache entries expire on their own."""
+        with self._lock:
+            self._entries.clear()
+
+    def _key(self, symbol: str) -> str:
+        return f"{self.key_prefix}{symbol}"
+
+    def _load(self, symbols: List[str]) -> Dict[str, Tuple[Optional[float], float]]:
+        if self.cache_alias:
+            from django.core.cache import caches
+
+            found = caches[self.cache_alias].get_many([self._key(s) for s in symbols])
+            return {s: found[self._key(s)] for s in symbols if self._key(s) in found}
+
+        entries = {}
+        with self._lock:
+            for symbol in symbols:
+                if symbol in self._entries:
+                    self._entries.move_to_end(symbol)
+                    entries[symbol] = self._entries[symbol]
+        return entries
+
+    def _store(self, prices: Dict[str, Optional[float]]) -> None:
+        now = time.time()
+        if self.cache_alias:
+            from django.core.cache import caches
+
+            cache = caches[self.cache_alias]
+            found = {self._key(s): (p, now) for s, p in prices.items() if p is not None}
+            unknown = {self._key(s): (p, now) for s, p in prices.items() if p is None}
+            if found:
+                cache.set_many(found, timeout=max(self.ttl + self.stale_ttl, self.fallback_ttl))
+            if unknown and self.negative_ttl > 0:
+                cache.set_many(unknown, timeout=self.negative_ttl)
+            return
+
+        with self._lock:
+            for symbol, price in prices.items():
+                self._entries[symbol] = (price, now)
+                self._entries.move_to_end(symbol)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _revalidate(self, symbols: List[str], fetch: PriceFetcher) -> None:
+        with self._lock:
+            symbols = [s for s in symbols if s not in self._refreshing]
+            self._refreshing.update(symbols)
+        if not symbols:
+            return
+
+        def refresh():
+            try:
+                self._store(fetch(symbols))
+            finally:
+                with self._lock:
+                    self._refreshing.difference_update(symbols)
+                if self.cache_alias:
+                    from django.db import connections
+
+                    connections.close_all()
+
+        threading.Thread(target=refresh, name="quote-cache-refresh", daemon=True).start()
+
+
+quote_cache = QuoteCache(
+    ttl=QUOTE_CACHE_TTL,
+    stale_ttl=QUOTE_CACHE_STALE_TTL,
+    negative_ttl=QUOTE_CACHE_NEGATIVE_TTL,
+    max_size=QUOTE_CACHE_MAX_SIZE,
+    cache_alias=QUOTE_CACHE_ALIAS,
+    fallback_ttl=QUOTE_CACHE_FALLBACK_TTL,
+)
+
+quote_flight = SingleFlight(timeout=SINGLE_FLIGHT_TIMEOUT)
+bar_flight = SingleFlight(timeout=SINGLE_FLIGHT_TIMEOUT)
+quote_breaker = CircuitBreaker("quotes", failure_ratio=BREAKER_FAILURE_RATIO, min_calls=BREAKER_MIN_CALLS,
+                               window=BREAKER_WINDOW, reset_timeout=BREAKER_RESET_TIMEOUT)
+bar_breaker = CircuitBreaker("bars", failure_ratio=BREAKER_FAILURE_RATIO, min_calls=BREAKER_MIN_CALLS,
+                             window=BREAKER_WINDOW, reset_timeout=BREAKER_RESET_TIMEOUT)
+
+
+class PriceBook:
+    """
+    Latest streamed trade price per symbol, written by the run_price_feed command.
+
+    Prices older than ``max_age`` seconds are ignored, so a stopped feed falls
+    back to REST lookups instead of serving old prices. Entries live in this
+    process unless ``cache_alias`` names a Django cache shared with the feed.
+    """
+
+    key_prefix = "alpaca:book:"
+
+    def __init__(self, max_age: float = 60, cache_alias: Optional[str] = None):
+        self.max_age = max_age
+        self.cache_alias = cache_alias
+        self._entries: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def update_many(self, prices: Dict[str, Tuple[float, float]]) -> None:
+        """Record (price, epoch timestamp) pairs keyed by symbol."""
+        if self.cache_alias:
+            from django.core.cache import caches
+
+            caches[self.cache_alias].set_many(
+                {self.key_prefix + symbol: entry for symbol, entry in prices.items()},
+                timeout=self.max_age,
+            )
+            return
+        with self._lock:
+            self._entries.update(prices)
+
+    def get_entries(self, symbols: List[str]) -> Dict[str, Tuple[float, float]]:
+        """Get (price, epoch timestamp) for the symbols with a recent enough price."""
+        if self.cache_alias:
+            from django.core.cache import caches
+
+            found = caches[self.cache_alias].get_many([self.key_prefix + s for s in symbols])
+            entries = {key[len(self.key_prefix):]: entry for key, entry in found.items()}
+        else:
+            with self._lock:
+                entries = {s: self._entries[s] for s in symbols if s in self._entries}
+        oldest = time.time() - self.max_age
+        return {s: entry for s, entry in entries.items() if entry[1] >= oldest}
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+price_book = PriceBook(max_age=PRICE_BOOK_MAX_AGE, cache_alias=PRICE_BOOK_ALIAS)
+
+
+# Every request AlpacaProvider sends takes a slot from upstream_limiter first.
+# _upstream_call takes it before the circuit breaker and the latency timer, so
+# time spent queued is not reported as upstream latency and a RateLimitTimeout
+# never counts against the breaker; the request inside then uses that slot.
+# Further requests (extra pages, calls made outside _upstream_call) take
+# their own. Calls run at INTERACTIVE priority unless wrapped in
+# upstream_priority(), or the process has switched its default with
+# set_default_priority(); batch commands do that, since threads they start do
+# not inherit context variables.
+
+upstream_limiter = PriorityRateLimiter(RATE_LIMIT / 60, burst=RATE_BURST, max_wait=RATE_MAX_WAIT)
+upstream_queue_depth.collect = lambda: {
+    (PRIORITY_NAMES.get(priority, str(priority)),): depth for priority, depth in upstream_limiter.depths().items()
+}
+
+_priority: ContextVar[Optional[int]] = ContextVar("upstream_priority", default=None)
+_prepaid_slots: ContextVar[Optional[List[bool]]] = ContextVar("upstream_prepaid_slots", default=None)
+_default_priority = INTERACTIVE
+
+
+@contextmanager
+def upstream_priority(priority: int) -> Iterator[None]:
+    """Make the Alpaca calls inside the block queue at `priority` (INTERACTIVE or BATCH)."""
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def set_default_priority(priority: int) -> None:
+    """Set the priority of Alpaca calls made outside upstream_priority() for the whole process."""
+    global _default_priority
+    _default_priority = priority
+
+
+def use_batch_budget() -> None:
+    """
+    Switch this process to batch work: calls default to BATCH priority and
+    share the ALPACA_BATCH_RATE_LIMIT budget instead of ALPACA_RATE_LIMIT.
+    """
+    set_default_priority(BATCH)
+    if BATCH_RATE_LIMIT > 0:
+        upstream_limiter.configure(BATCH_RATE_LIMIT / 60, burst=min(RATE_BURST, BATCH_RATE_LIMIT))
+
+
+def current_priority() -> int:
+    priority = _priority.get()
+    return _default_priority if priority is None else priority
+
+
+def _take_prepaid_slot() -> bool:
+    prepaid = _prepaid_slots.get()
+    if prepaid:
+        prepaid.pop()
+        return True
+    return False
+
+
+def _acquire_slot() -> None:
+    priority = current_priority()
+    record_queue_wait(PRIORITY_NAMES.get(priority, str(priority)), upstream_limiter.acquire(priority))
+
+
+async def _aacquire_slot() -> None:
+    priority = current_priority()
+    record_queue_wait(PRIORITY_NAMES.get(priority, str(priority)), await upstream_limiter.aacquire(priority))
+
+
+def _wait_for_slot() -> None:
+    if not _take_prepaid_slot():
+        _acquire_slot()
+
+
+async def _await_slot() -> None:
+    if not _take_prepaid_slot():
+        await _aacquire_slot()
+
+
+def _rest_call(method: str, *args, **kwargs):
+    """Call a REST client method once the rate limiter allows it."""
+    _wait_for_slot()
+    try:
+        return getattr(get_client(), method)(*args, **kwargs)
+    except Exception as e:
+        if getattr(e, "status_code", None) == 429:
+            upstream_limiter.drain()
+        raise
+
+
+class AlpacaProvider(MarketDataProvider):
+    """Alpaca market data: the REST client for sync calls, a pooled aiohttp session for async ones."""
+
+    rate_limited = True
+
+    def latest_trade(self, symbol: str) -> Optional[float]:
+        try:
+            trade = _rest_call("get_latest_trade", symbol)
+        except Exception as e:
+            # Alpaca answers unknown symbols with 404/422; those are worth caching.
+            if getattr(e, "status_code", None) in (404, 422):
+                print(f"Unknown symbol {symbol}: {e}")
+                return None
+            raise
+        return trade.price if hasattr(trade, "price") else None
+
+    def latest_trades(self, symbols: List[str]) -> Dict[str, Optional[float]]:
+        trades = _rest_call("get_latest_trades", symbols)
+        return {symbol: getattr(trades.get(symbol), "price", None) for symbol in symbols}
+
+    def bars(self, symbol: str, start: datetime, end: datetime, timeframe: str = "1Day") -> pd.DataFrame:
+        return _rest_call(
+            "get_bars",
+            symbol,
+            timeframe,
+            start=start.isoformat(),
+            end=end.isoformat(),
+            feed='iex'
+        ).df
+
+    def assets(self) -> List[Asset]:
+        return [
+            Asset(asset.symbol, asset.name, asset.exchange, bool(asset.tradable))
+            for asset in _rest_call("list_assets", status="active", asset_class="us_equity")
+        ]
+
+    async def alatest_trades(self, symbols: List[str]) -> Dict[str, Optional[float]]:
+        payload = await _get_json("/v2/stocks/trades/latest", {"symbols": ",".join(symbols), "feed": "iex"})
+        trades = payload.get("trades") or {}
+        return {symbol: (trades.get(symbol) or {}).get("p") for symbol in symbols}
+
+    async def abars(self, symbol: str, start: datetime, end: datetime, timeframe: str = "1Day") -> pd.DataFrame:
+        params = {
+            "timeframe": timeframe,
+            "start": _rfc3339(start),
+            "end": _rfc3339(end),
+            "feed": "iex",
+            "adjustment": "raw",
+            "limit": 10000,
+        }
+        bars = []
+        while True:
+            payload = await _get_json(f"/v2/stocks/{symbol}/bars", params)
+            bars.extend(payload.get("bars") or [])
+            if not payload.get("next_page_token"):
+                return _bars_frame(bars)
+            params["page_token"] = payload["next_page_token"]
+
+
+@contextmanager
+def _guarded_call(breaker: CircuitBreaker, endpoint: str, prepaid: bool) -> Iterator[None]:
+    token = _prepaid_slots.set([True] if prepaid else [])
+    try:
+        # A later request inside the call can still time out waiting for a slot; that is not upstream's fault.
+        with breaker.guard(ignore=(RateLimitTimeout,)), track_upstream(endpoint):
+            yield
+    except CircuitOpenError:
+        upstream_rejected.inc(endpoint)
+        raise
+    finally:
+        _prepaid_slots.reset(token)
+
+
+@contextmanager
+def _upstream_call(breaker: CircuitBreaker, endpoint: str) -> Iterator[None]:
+    """
+    Run a market-data call through the rate limiter and its circuit breaker,
+    recording it in the request metrics.
+    """
+    prepaid = get_provider().rate_limited
+    if prepaid:
+        _acquire_slot()
+    with _guarded_call(breaker, endpoint, prepaid):
+        yield
+
+
+@asynccontextmanager
+async def _aupstream_call(breaker: CircuitBreaker, endpoint: str) -> AsyncIterator[None]:
+    """Async version of _upstream_call; waits for the rate limiter without blocking the event loop."""
+    prepaid = get_provider().rate_limited
+    if prepaid:
+        await _aacquire_slot()
+    with _guarded_call(breaker, endpoint, prepaid):
+        yield
+
+
+def _request_latest_price(symbols: List[str]) -> Dict[str, Optional[float]]:
+    symbol = symbols[0]
+    try:
+        with _upstream_call(quote_breaker, "latest_trade"):
+            return {symbol: get_provider().latest_trade(symbol)}
+    except CircuitOpenError:
+        return {}
+    except Exception as e:
+        print(f"Error fetching stock price for {symbol}: {e}")
+        return {}
+
+
+def _request_latest_prices(symbols: List[str]) -> Dict[str, Optional[float]]:
+    try:
+        with _upstream_call(quote_breaker, "latest_trades"):
+            prices = get_provider().latest_trades(symbols)
+    except CircuitOpenError:
+        return {}
+    except Exception as e:
+        print(f"Error fetching stock prices for {', '.join(symbols)}: {e}")
+        return {}
+    return {symbol: prices.get(symbol) for symbol in symbols}
+
+
+# Fetchers given to the quote cache. Symbols another request is already
+# fetching are not requested again; the caller waits for that fetch instead.
+
+def _fetch_latest_price(symbols: List[str]) -> Dict[str, Optional[float]]:
+    return quote_flight.run(symbols[:1], _request_latest_price)
+
+
+def _fetch_latest_prices(symbols: List[str]) -> Dict[str, Optional[float]]:
+    return quote_flight.run(symbols, _request_latest_prices)
+
+
+def _unique_symbols(symbols: Iterable[str]) -> List[str]:
+    return sorted({symbol.strip().upper() for symbol in symbols if symbol})
+
+
+def _to_quotes(symbols: List[str], entries: Dict[str, Tuple[Optional[float], float]]) -> Dict[str, Quote]:
+    now = time.time()
+    quotes = {}
+    for symbol in symbols:
+        price, fetched_at = entries.get(symbol, (None, now))
+        quotes[symbol] = Quote(price, datetime.fromtimestamp(fetched_at, pytz.UTC))
+    return quotes
 
-api = REST(API_KEY, SECRET_KEY, BASE_URL)
 
 def get_stock_price(symbol: str) -> Optional[float]:
     """
     Get the latest stock price for a given symbol.
+
+    Served from the streamed price book or the quote cache when a recent
+    price is available.
     
     Args:
         symbol (str): Stock ticker symbol (e.g., "AAPL").
@@ -32,12 +636,80 @@ def get_stock_price(symbol: str) -> Optional[float]:
     Returns:
         Optional[float]: The latest trade price, or None if an error occurs.
     """
-    try:
-        trade = api.get_latest_trade(symbol)
-        return trade.price if hasattr(trade, "price") else None
-    except Exception as e:
-        print(f"Error fetching stock price for {symbol}: {e}")
-        return None
+    entries = price_book.get_entries([symbol]) or quote_cache.get_entries([symbol], _fetch_latest_price)
+    return entries.get(symbol, (None, 0))[0]
+
+def get_stock_quotes(symbols: Iterable[str]) -> Dict[str, Quote]:
+    """
+    Get the latest stock prices for several symbols in a single request,
+    along with when each price was fetched.
+
+    Prices streamed into the price book are used first. The rest come from the
+    quote cache or Alpaca's multi-symbol latest-trades endpoint, so valuing a
+    whole portfolio costs at most one round-trip instead of one per holding.
+
+    Args:
+        symbols (Iterable[str]): Stock ticker symbols; duplicates are ignored.
+
+    Returns:
+        Dict[str, Quote]: Quote keyed by symbol. Symbols Alpaca does not know,
+        or all symbols if the request fails, have a price of None.
+    """
+    unique_symbols = _unique_symbols(symbols)
+    if not unique_symbols:
+        return {}
+    entries = price_book.get_entries(unique_symbols)
+    unpriced = [symbol for symbol in unique_symbols if symbol not in entries]
+    if unpriced:
+        entries.update(quote_cache.get_entries(unpriced, _fetch_latest_prices))
+    return _to_quotes(unique_symbols, entries)
+
+def get_stock_prices(symbols: Iterable[str]) -> Dict[str, Optional[float]]:
+    """
+    Get the latest stock prices for several symbols in a single request.
+
+    Args:
+        symbols (Iterable[str]): Stock ticker symbols; duplicates are ignored.
+
+    Returns:
+        Dict[str, Optional[float]]: Latest trade price keyed by symbol. Symbols
+        Alpaca does not know, or all symbols if the request fails, map to None.
+    """
+    return {symbol: quote.price for symbol, quote in get_stock_quotes(symbols).items()}
+
+def fetch_bars(symbol: str, start: datetime, end: datetime, timeframe: str = "1Day") -> pd.DataFrame:
+    """
+    Fetch bars for a symbol between two timezone-aware datetimes.
+
+    Unlike get_historical_data, errors are raised instead of swallowed, so
+    callers can tell an empty range apart from a failed request.
+
+    Args:
+        symbol (str): Stock ticker symbol.
+        start (datetime): Start of the range.
+        end (datetime): End of the range.
+        timeframe (str): Bar size, one of VALID_TIMEFRAMES.
+
+    Returns:
+        pd.DataFrame: Bars indexed by UTC timestamp, possibly empty.
+    """
+    key = _bar_key(symbol, start, end, timeframe)
+
+    def request(keys):
+        with _upstream_call(bar_breaker, "bars"):
+            return {key: get_provider().bars(symbol, start, end, timeframe)}
+
+    return _shared_bars(key, bar_flight.run([key], request))
+
+def _bar_key(symbol: str, start: datetime, end: datetime, timeframe: str) -> Tuple:
+    # Ranges that end "now" differ by microseconds between requests, so ends
+    # are compared to the minute.
+    return symbol.upper(), timeframe, start.timestamp(), int(end.timestamp() // 60)
+
+def _shared_bars(key: Tuple, results: Dict) -> pd.DataFrame:
+    if key not in results:
+        raise RuntimeError(f"A concurrent request for {key[0]} bars failed.")
+    return results[key]
 
 def get_historical_data(symbol: str, timeframe: str = "1Day", days: int = 7) -> Optional[pd.DataFrame]:        
     """
@@ -55,13 +727,7 @@ def get_historical_data(symbol: str, timeframe: str = "1Day", days: int = 7) ->
         end_date = datetime.now(pytz.UTC)
         start_date = end_date - timedelta(days=days)
 
-        bars = api.get_bars(
-            symbol,
-            timeframe,
-            start=start_date.isoformat(),
-            end=end_date.isoformat(),
-            feed='iex'
-        ).df
+        bars = fetch_bars(symbol, start_date, end_date, timeframe)
 
         if bars.empty:
             return None
@@ -71,5 +737,173 @@ def get_historical_data(symbol: str, timeframe: str = "1Day", days: int = 7) ->
         print(f"Error fetching historical data for {symbol}: {e}")
         return None
 
+def list_assets() -> List[Asset]:
+    """
+    Get the assets the market-data provider knows about.
 
+    Returns:
+        List[Asset]: Symbol, name, exchange and whether each asset is tradable.
+    """
+    return get_provider().assets()
+
+
+# Async client. Sessions are pooled per event loop: under ASGI one session
+# serves every request on the worker's loop; under WSGI each async view runs
+# in its own short-lived loop and the session is closed along with it.
 
+_async_sessions: Dict[asyncio.AbstractEventLoop, Tuple[Any, Any]] = {}
+
+
+async def _close_with_loop(loop, session):
+    # An async generator is finalised by loop.shutdown_asyncgens(), which
+    # asyncio.run() (and so Django's async_to_sync) calls before closing the loop.
+    try:
+        yield
+    finally:
+        _async_sessions.pop(loop, None)
+        await session.close()
+
+
+async def _get_async_session():
+    import aiohttp
+
+    loop = asyncio.get_running_loop()
+    pooled = _async_sessions.get(loop)
+    if pooled is None or pooled[0].closed:
+        session = aiohttp.ClientSession(
+            headers={"APCA-API-KEY-ID": API_KEY or "", "APCA-API-SECRET-KEY": SECRET_KEY or ""},
+            connector=aiohttp.TCPConnector(limit=ASYNC_POOL_SIZE),
+            timeout=aiohttp.ClientTimeout(total=ASYNC_TIMEOUT),
+            raise_for_status=True,
+        )
+        closer = _close_with_loop(loop, session)
+        await closer.__anext__()
+        pooled = _async_sessions[loop] = (session, closer)
+    return pooled[0]
+
+
+async def _get_json(path: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    import aiohttp
+
+    await _await_slot()
+    session = await _get_async_session()
+    try:
+        async with session.get(f"{DATA_URL}{path}", params=params) as response:
+            return await response.json()
+    except aiohttp.ClientResponseError as e:
+        # The session raises for error statuses, so a 429 arrives here.
+        if e.status == 429:
+            upstream_limiter.drain()
+        raise
+
+
+def _rfc3339(value: datetime) -> str:
+    return value.astimezone(pytz.UTC).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+async def _afetch_latest_prices(symbols: List[str]) -> Dict[str, Optional[float]]:
+    async def request(symbols):
+        try:
+            async with _aupstream_call(quote_breaker, "latest_trades"):
+                prices = await get_provider().alatest_trades(symbols)
+        except CircuitOpenError:
+            return {}
+        except Exception as e:
+            print(f"Error fetching stock prices for {', '.join(symbols)}: {e}")
+            return {}
+        return {symbol: prices.get(symbol) for symbol in symbols}
+
+    return await quote_flight.arun(symbols, request)
+
+
+async def aget_stock_price(symbol: str) -> Optional[float]:
+    """
+    Async version of get_stock_price.
+
+    Args:
+        symbol (str): Stock ticker symbol (e.g., "AAPL").
+
+    Returns:
+        Optional[float]: The latest trade price, or None if an error occurs.
+    """
+    entries = price_book.get_entries([symbol])
+    if not entries:
+        entries = await quote_cache.aget_entries([symbol], _afetch_latest_prices, _fetch_latest_price)
+    return entries.get(symbol, (None, 0))[0]
+
+
+async def aget_stock_quotes(symbols: Iterable[str]) -> Dict[str, Quote]:
+    """
+    Async version of get_stock_quotes.
+
+    Args:
+        symbols (Iterable[str]): Stock ticker symbols; duplicates are ignored.
+
+    Returns:
+        Dict[str, Quote]: Quote keyed by symbol, with a price of None for unknown symbols.
+    """
+    unique_symbols = _unique_symbols(symbols)
+    if not unique_symbols:
+        return {}
+    entries = price_book.get_entries(unique_symbols)
+    unpriced = [symbol for symbol in unique_symbols if symbol not in entries]
+    if unpriced:
+        entries.update(await quote_cache.aget_entries(unpriced, _afetch_latest_prices, _fetch_latest_prices))
+    return _to_quotes(unique_symbols, entries)
+
+
+async def aget_stock_prices(symbols: Iterable[str]) -> Dict[str, Optional[float]]:
+    """
+    Async version of get_stock_prices.
+
+    Args:
+        symbols (Iterable[str]): Stock ticker symbols; duplicates are ignored.
+
+    Returns:
+        Dict[str, Optional[float]]: Latest trade price keyed by symbol.
+    """
+    return {symbol: quote.price for symbol, quote in (await aget_stock_quotes(symbols)).items()}
+
+
+def _bars_frame(bars: List[Dict[str, Any]]) -> pd.DataFrame:
+    """Build a DataFrame shaped like REST.get_bars().df from raw v2 bar objects."""
+    import pandas as pd
+
+    frame = pd.DataFrame(bars, columns=["t", "o", "h", "l", "c", "v", "n", "vw"]).rename(columns={
+        "o": "open", "h": "high", "l": "low", "c": "close",
+        "v": "volume", "n": "trade_count", "vw": "vwap",
+    })
+    frame.index = pd.DatetimeIndex(pd.to_datetime(frame.pop("t"), utc=True), name="timestamp")
+    return frame
+
+
+async def afetch_bars(symbol: str, start: datetime, end: datetime, timeframe: str = "1Day") -> pd.DataFrame:
+    """
+    Async version of fetch_bars.
+
+    Returns:
+        pd.DataFrame: Bars indexed by UTC timestamp, possibly empty.
+    """
+    key = _bar_key(symbol, start, end, timeframe)
+
+    async def request(keys):
+        async with _aupstream_call(bar_breaker, "bars"):
+            return {key: await get_provider().abars(symbol, start, end, timeframe)}
+
+    return _shared_bars(key, await bar_flight.arun([key], request))
+
+
+async def aget_historical_data(symbol: str, timeframe: str = "1Day", days: int = 7) -> Optional[pd.DataFrame]:
+    """
+    Async version of get_historical_data.
+
+    Returns:
+        Optional[pd.DataFrame]: DataFrame containing historical stock prices, or None if an error occurs.
+    """
+    try:
+        end_date = datetime.now(pytz.UTC)
+        bars = await afetch_bars(symbol, end_date - timedelta(days=days), end_date, timeframe)
+        return None if bars.empty else bars
+    except Exception as e:
+        print(f"Error fetching historical data for {symbol}: {e}")
+        return None
@@ -0,0 +1,138 @@
+"""
+Portfolio analytics over stored daily bars.
+
+Closing prices for every holding are loaded with one query into an aligned
+date x symbol matrix. All metrics are then NumPy operations over that matrix,
+so the cost is dominated by the query rather than the number of symbols.
+"""
+
+from datetime import timedelta
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .bar_store import market_today, sync_daily_bars_many
+from .models import Portfolio, StockPrice
+
+TRADING_DAYS = 252
+BENCHMARK_SYMBOL = "SPY"
+
+
+def close_matrix(symbols: List[str], start, end) -> pd.DataFrame:
+    """
+    Load closing prices as a date x symbol frame, forward-filling days a symbol did not trade.
+    """
+    rows = (
+        StockPrice.objects.filter(stock__symbol__in=symbols, date__range=(start, end))
+        .values_list("date", "stock__symbol", "close_price")
+    )
+    frame = pd.DataFrame.from_records(list(rows), columns=["date", "symbol", "close"])
+    if frame.empty:
+        return pd.DataFrame(columns=symbols, dtype=float)
+    matrix = frame.pivot(index="date", columns="symbol", values="close").sort_index().ffill()
+    return matrix.reindex(columns=symbols)
+
+
+def returns_matrix(closes: np.ndarray) -> np.ndarray:
+    """Simple daily returns of a (days x symbols) close matrix; gaps count as flat days."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = closes[1:] / closes[:-1] - 1.0
+    return np.nan_to_num(returns, nan=0.0, posinf=0.0, neginf=0.0)
+
+
+def max_drawdown(returns: np.ndarray) -> float:
+    wealth = np.cumprod(1.0 + returns)
+    peaks = np.maximum.accumulate(np.concatenate(([1.0], wealth)))[1:]
+    return float(np.min(wealth / peaks - 1.0)) if len(wealth) else 0.0
+
+
+def compute_metrics(closes: np.ndarray, weights: np.ndarray, benchmark: Optional[np.ndarray] = None,
+                    risk_free_rate: float = 0.0) -> Dict[str, Any]:
+    """
+    Compute portfolio metrics from aligned closes.
+
+    Args:
+        closes (np.ndarray): (days x symbols) closing prices.
+        weights (np.ndarray): Portfolio weight of each symbol, summing to 1.
+        benchmark (Optional[np.ndarray]): Benchmark closes on the same days, for beta.
+        risk_free_rate (float): Annual risk-free rate used in the Sharpe ratio.
+
+    Returns:
+        Dict[str, Any]: Annualised return and volatility, Sharpe ratio, max
+        drawdown, beta (None without a benchmark) and the correlation matrix.
+    """
+    returns = returns_matrix(closes)
+    portfolio_returns = returns @ weights
+
+    annual_return = float(np.mean(portfolio_returns) * TRADING_DAYS)
+    volatility = float(np.std(portfolio_returns, ddof=1) * np.sqrt(TRADING_DAYS))
+    sharpe = (annual_return - risk_free_rate) / volatility if volatility > 0 else None
+
+    beta = None
+    if benchmark is not None:
+        benchmark_returns = returns_matrix(benchmark.reshape(-1, 1))[:, 0]
+        variance = np.var(benchmark_returns, ddof=1)
+        if variance > 0:
+            beta = float(np.cov(portfolio_returns, benchmark_returns, ddof=1)[0, 1] / variance)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        correlation = np.corrcoef(returns, rowvar=False) if returns.shape[1] > 1 else np.ones((1, 1))
+
+    return {
+        "annual_return": annual_return,
+        "volatility": volatility,
+        "sharpe": sharpe,
+        "max_drawdown": max_drawdown(portfolio_returns),
+        "beta": beta,
+        "correlation": np.atleast_2d(correlation),
+    }
+
+
+def portfolio_analytics(portfolio: Portfolio, days: int = 365, sync: bool = True) -> Dict[str, Any]:
+    """
+    Analyse a portfolio's current holdings over the last `days` days.
+
+    Holdings are weighted by their market value at the last stored close.
+    With sync=True, missing bars for the holdings and the benchmark are
+    downloaded concurrently through the bar store first.
+
+    Returns:
+        Dict[str, Any]: JSON-ready metrics, or an "error" key when there is
+        not enough price history.
+    """
+    holdings = {h.symbol: h.quantity for h in portfolio.holdings.all()}
+    symbols = sorted(holdings)
+    end = market_today()
+    start = end - timedelta(days=days)
+    if not symbols:
+        return {"error": "This portfolio has no holdings to analyse."}
+
+    if sync:
+        sync_daily_bars_many(symbols + [BENCHMARK_SYMBOL], start, end)
+
+    matrix = close_matrix(symbols + [BENCHMARK_SYMBOL], start, end)
+    closes = matrix[symbols].to_numpy(dtype=float)
+    if len(closes) < 3:
+        return {"error": "Not enough price history to analyse this portfolio."}
+
+    last_closes = np.nan_to_num(closes[-1])
+    values = last_closes * np.array([holdings[s] for s in symbols], dtype=float)
+    if values.sum() <= 0:
+        return {"error": "Not enough price history to analyse this portfolio."}
+    weights = values / values.sum()
+
+    benchmark = matrix[BENCHMARK_SYMBOL].to_numpy(dtype=float)
+    metrics = compute_metrics(closes, weights, benchmark if not np.isnan(benchmark).all() else None)
+
+    correlation = [[None if np.isnan(v) else round(float(v), 4) for v in row] for row in metrics.pop("correlation")]
+    return {
+        "symbols": symbols,
+        "weights": [round(float(w), 6) for w in weights],
+        "start": matrix.index[0].isoformat(),
+        "end": matrix.index[-1].isoformat(),
+        "observations": len(closes),
+        "benchmark": BENCHMARK_SYMBOL,
+        **metrics,
+        "correlation": correlation,
+    }
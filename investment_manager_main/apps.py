@@ -1,5 +1,11 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class InvestmentManagerMainConfig(AppConfig):
     name = 'investment_manager_main'
+
+    def ready(self):
+        from .metrics import install_query_hook
+
+        connection_created.connect(install_query_hook, dispatch_uid="investment_manager_main.metrics")
@@ -0,0 +1,242 @@
+"""
+Daily bar store backed by the Stock and StockPrice tables.
+
+History requests are served from the database. Only the days outside the
+range already synced for a symbol are downloaded from Alpaca, and they are
+written with a single bulk upsert.
+
+Today's bar keeps changing until the session is over, so today only counts
+as synced once the close has settled. Until then, each process downloads
+the today-only tail at most once every TODAY_TTL seconds per symbol.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+from datetime import date, datetime, time, timedelta
+from time import monotonic
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+import pytz
+from asgiref.sync import async_to_sync, sync_to_async
+from django.db import transaction
+
+from .alpaca_api import afetch_bars, fetch_bars
+from .models import Stock, StockPrice
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+MARKET_TZ = pytz.timezone("America/New_York")
+BAR_COLUMNS = ["open", "high", "low", "close", "volume"]
+# When a day's daily bar stops changing: the 16:00 close plus a margin for late prints.
+SESSION_SETTLED = time(16, 15)
+TODAY_TTL = 60
+
+_today_fetched: Dict[str, float] = {}
+_today_lock = threading.Lock()
+
+
+def market_today() -> date:
+    return datetime.now(MARKET_TZ).date()
+
+
+def session_over(day: date) -> bool:
+    """Whether day's daily bar has settled, so the day can be marked synced."""
+    return datetime.now(MARKET_TZ) >= MARKET_TZ.localize(datetime.combine(day, SESSION_SETTLED))
+
+
+def pending_ranges(symbol: str, stock: Optional[Stock], start: date, end: date) -> List[Tuple[date, date]]:
+    """missing_ranges, minus a today-only tail this process downloaded in the last TODAY_TTL seconds."""
+    ranges = missing_ranges(stock, start, end)
+    today = market_today()
+    if ranges and ranges[-1] == (today, today):
+        with _today_lock:
+            fetched = _today_fetched.get(symbol)
+        if fetched is not None and monotonic() - fetched < TODAY_TTL:
+            ranges.pop()
+    return ranges
+
+
+def missing_ranges(stock: Optional[Stock], start: date, end: date) -> List[Tuple[date, date]]:
+    """
+    Work out which parts of [start, end] have not been synced for a stock yet.
+
+    Returns:
+        List[Tuple[date, date]]: Inclusive date ranges to download, oldest first.
+    """
+    if stock is None or stock.bars_synced_from is None:
+        return [(start, end)]
+
+    ranges = []
+    if start < stock.bars_synced_from:
+        ranges.append((start, stock.bars_synced_from - timedelta(days=1)))
+    if end > stock.bars_synced_to:
+        ranges.append((stock.bars_synced_to + timedelta(days=1), end))
+    return ranges
+
+
+def range_bounds(range_start: date, range_end: date) -> Tuple[datetime, datetime]:
+    """Turn an inclusive date range into the datetimes to request from Alpaca."""
+    return (
+        MARKET_TZ.localize(datetime.combine(range_start, time.min)),
+        min(MARKET_TZ.localize(datetime.combine(range_end, time.max)), datetime.now(pytz.UTC)),
+    )
+
+
+def sync_daily_bars(symbol: str, start: date, end: date) -> Optional[Stock]:
+    """
+    Download and store the daily bars for symbol in [start, end] that are not stored yet.
+
+    Until today's session is over the synced range stops at yesterday, and
+    today is refreshed once TODAY_TTL has passed.
+
+    Returns:
+        Optional[Stock]: The stock row, or None if Alpaca has no bars for an unknown symbol.
+    """
+    stock = Stock.objects.filter(symbol=symbol).first()
+    ranges = pending_ranges(symbol, stock, start, end)
+    if not ranges:
+        return stock
+
+    frames = [fetch_bars(symbol, *range_bounds(*r)) for r in ranges]
+    return store_daily_bars(symbol, stock, start, end, frames)
+
+
+async def async_daily_bars(symbol: str, start: date, end: date) -> Optional[Stock]:
+    """Async version of sync_daily_bars. Missing head and tail ranges are downloaded concurrently."""
+    stock = await sync_to_async(Stock.objects.filter(symbol=symbol).first)()
+    ranges = pending_ranges(symbol, stock, start, end)
+    if not ranges:
+        return stock
+
+    frames = await asyncio.gather(*(afetch_bars(symbol, *range_bounds(*r)) for r in ranges))
+    return await sync_to_async(store_daily_bars)(symbol, stock, start, end, list(frames))
+
+
+async def async_daily_bars_many(symbols: List[str], start: date, end: date) -> None:
+    """Async version of sync_daily_bars_many."""
+    results = await asyncio.gather(*(async_daily_bars(s, start, end) for s in symbols), return_exceptions=True)
+    for symbol, result in zip(symbols, results):
+        if isinstance(result, Exception):
+            print(f"Error syncing daily bars for {symbol}: {result}")
+
+
+def sync_daily_bars_many(symbols: List[str], start: date, end: date) -> None:
+    """
+    Sync the daily bars in [start, end] for several symbols, downloading them concurrently.
+
+    A symbol that fails to sync is logged and skipped; the others are still stored.
+    """
+    async_to_sync(async_daily_bars_many)(symbols, start, end)
+
+
+def store_daily_bars(symbol: str, stock: Optional[Stock], start: date, end: date,
+                     frames: List[pd.DataFrame]) -> Optional[Stock]:
+    """Upsert downloaded bars and widen the stock's synced range to cover [start, end]."""
+    frames = [bars for bars in frames if not bars.empty]
+    if stock is None and not frames:
+        return None
+
+    with transaction.atomic():
+        if stock is None:
+            stock, _ = Stock.objects.get_or_create(symbol=symbol, defaults={"name": symbol})
+
+        rows = [
+            StockPrice(
+                stock=stock,
+                date=timestamp.date(),
+                open_price=bar.open,
+                high_price=bar.high,
+                low_price=bar.low,
+                close_price=bar.close,
+                volume=int(bar.volume),
+            )
+            for bars in frames
+            for timestamp, bar in zip(bars.index.tz_convert(MARKET_TZ), bars.itertuples())
+        ]
+        StockPrice.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=["stock", "date"],
+            update_fields=["open_price", "high_price", "low_price", "close_price", "volume"],
+        )
+
+        today = market_today()
+        synced_to = min(end, today if session_over(today) else today - timedelta(days=1))
+        stock.bars_synced_from = min(start, stock.bars_synced_from or start)
+        stock.bars_synced_to = max(synced_to, stock.bars_synced_to or synced_to)
+        Stock.objects.filter(pk=stock.pk).update(
+            bars_synced_from=stock.bars_synced_from,
+            bars_synced_to=stock.bars_synced_to,
+        )
+    if end >= today:
+        with _today_lock:
+            _today_fetched[symbol] = monotonic()
+    return stock
+
+
+def read_daily_bars(stock: Stock, start: date, end: date) -> Optional[pd.DataFrame]:
+    import pandas as pd
+
+    rows = (
+        StockPrice.objects.filter(stock=stock, date__range=(start, end))
+        .order_by("date")
+        .values_list("date", "open_price", "high_price", "low_price", "close_price", "volume")
+    )
+    history = pd.DataFrame.from_records(list(rows), columns=["date"] + BAR_COLUMNS)
+    if history.empty:
+        return None
+    return history.set_index(pd.DatetimeIndex(history.pop("date")))
+
+
+def _window(days: int) -> Tuple[date, date]:
+    end = market_today()
+    return end - timedelta(days=days), end
+
+
+def get_daily_bars(symbol: str, days: int = 365) -> Optional[pd.DataFrame]:
+    """
+    Get the last `days` days of daily bars for a symbol, syncing any missing days first.
+
+    Args:
+        symbol (str): Stock ticker symbol.
+        days (int): Number of calendar days to cover, ending today.
+
+    Returns:
+        Optional[pd.DataFrame]: Bars indexed by date with open/high/low/close/volume
+        columns, or None if no bars are available or the download fails.
+    """
+    symbol = symbol.strip().upper()
+    if not symbol:
+        return None
+
+    start, end = _window(days)
+    try:
+        stock = sync_daily_bars(symbol, start, end)
+    except Exception as e:
+        print(f"Error syncing daily bars for {symbol}: {e}")
+        stock = Stock.objects.filter(symbol=symbol).first()
+    if stock is None:
+        return None
+    return read_daily_bars(stock, start, end)
+
+
+async def aget_daily_bars(symbol: str, days: int = 365) -> Optional[pd.DataFrame]:
+    """
+    Async version of get_daily_bars. Missing head and tail ranges are downloaded concurrently.
+    """
+    symbol = symbol.strip().upper()
+    if not symbol:
+        return None
+
+    start, end = _window(days)
+    try:
+        stock = await async_daily_bars(symbol, start, end)
+    except Exception as e:
+        print(f"Error syncing daily bars for {symbol}: {e}")
+        stock = await sync_to_async(Stock.objects.filter(symbol=symbol).first)()
+    if stock is None:
+        return None
+    return await sync_to_async(read_daily_bars)(stock, start, end)
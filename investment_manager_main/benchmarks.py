@@ -0,0 +1,309 @@
+"""
+Application benchmarks.
+
+seed() builds a synthetic user with portfolios, holdings and a trade history
+of a given size. run_benchmarks() times the model methods and views on the
+hot path against SyntheticProvider, a fake market-data backend with a fixed
+latency that counts upstream calls. It reports latency percentiles, query
+counts and upstream calls per operation. Each scale runs inside a transaction
+that is rolled back, so the database is left as it was.
+"""
+
+import asyncio
+import itertools
+import math
+import platform
+import random
+import subprocess
+import threading
+import time
+import uuid
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from statistics import mean
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .alpaca_api import bar_breaker, price_book, quote_breaker, quote_cache
+from .imports import chunked
+from .models import Holding, Portfolio, Trade
+from .providers import Asset, MarketDataProvider, set_provider
+
+DEFAULT_SCALES = [10, 1_000, 10_000]
+SEED_BATCH_SIZE = 5000
+BAR_FREQUENCIES = {"1Min": "min", "5Min": "5min", "15Min": "15min", "1Hour": "h", "1Day": "B"}
+
+
+class SyntheticProvider(MarketDataProvider):
+    """
+    Deterministic prices and bars for any symbol, served after ``latency`` seconds.
+
+    Counts calls by method, and in ``peak`` the most calls to a method that were in flight at once.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: Counter = Counter()
+        self.peak: Counter = Counter()
+        self._in_flight: Counter = Counter()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def price(symbol: str) -> float:
+        return 20.0 + zlib.crc32(symbol.encode()) % 480
+
+    @contextmanager
+    def _call(self, method: str) -> Iterator[None]:
+        with self._lock:
+            self.calls[method] += 1
+            self._in_flight[method] += 1
+            self.peak[method] = max(self.peak[method], self._in_flight[method])
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight[method] -= 1
+
+    def _bars(self, symbol: str, start: datetime, end: datetime, timeframe: str):
+        import numpy as np
+        import pandas as pd
+
+        index = pd.date_range(pd.Timestamp(start).tz_convert("UTC"), pd.Timestamp(end).tz_convert("UTC"),
+                              freq=BAR_FREQUENCIES[timeframe])
+        close = self.price(symbol) * (1 + 0.05 * np.sin(np.arange(len(index)) / 10))
+        return pd.DataFrame({
+            "open": close, "high": close * 1.01, "low": close * 0.99, "close": close,
+            "volume": 100_000, "trade_count": 1000, "vwap": close,
+        }, index=pd.DatetimeIndex(index, name="timestamp"))
+
+    def latest_trade(self, symbol: str) -> Optional[float]:
+        with self._call("latest_trade"):
+            time.sleep(self.latency)
+        return self.price(symbol)
+
+    def latest_trades(self, symbols: List[str]) -> Dict[str, Optional[float]]:
+        with self._call("latest_trades"):
+            time.sleep(self.latency)
+        return {symbol: self.price(symbol) for symbol in symbols}
+
+    def bars(self, symbol: str, start: datetime, end: datetime, timeframe: str = "1Day"):
+        with self._call("bars"):
+            time.sleep(self.latency)
+        return self._bars(symbol, start, end, timeframe)
+
+    def assets(self) -> List[Asset]:
+        with self._call("assets"):
+            time.sleep(self.latency)
+        return []
+
+    async def alatest_trades(self, symbols: List[str]) -> Dict[str, Optional[float]]:
+        with self._call("latest_trades"):
+            await asyncio.sleep(self.latency)
+        return {symbol: self.price(symbol) for symbol in symbols}
+
+    async def abars(self, symbol: str, start: datetime, end: datetime, timeframe: str = "1Day"):
+        with self._call("bars"):
+            await asyncio.sleep(self.latency)
+        return self._bars(symbol, start, end, timeframe)
+
+
+def seed(trades: int, portfolios: int = 3, symbols: int = 20, rng_seed: int = 0) -> Tuple[User, List[Portfolio]]:
+    """
+    Create a user whose portfolios hold `symbols` symbols each and share a
+    history of `trades` trades, one minute apart and ending now.
+    """
+    rng = random.Random(rng_seed)
+    user = User.objects.create(username=f"bench-{uuid.uuid4().hex[:12]}")
+    owned = [
+        Portfolio.objects.create(user=user, name=f"Benchmark {n + 1}", balance=10_000_000,
+                                 trade_count=trades // portfolios + (n < trades % portfolios))
+        for n in range(portfolios)
+    ]
+    tickers = [f"BM{n:03d}" for n in range(symbols)]
+    Holding.objects.bulk_create([
+        Holding(portfolio=portfolio, symbol=symbol, quantity=rng.randint(100, 1000),
+                average_price=round(SyntheticProvider.price(symbol) * rng.uniform(0.8, 1.2), 2))
+        for portfolio in owned for symbol in tickers
+    ])
+
+    now = timezone.now()
+    history = (
+        Trade(
+            portfolio=owned[n % portfolios],
+            symbol=tickers[n % symbols],
+            quantity=rng.randint(1, 100),
+            trade_type="buy" if rng.random() < 0.6 else "sell",
+            trade_price=round(SyntheticProvider.price(tickers[n % symbols]) * rng.uniform(0.8, 1.2), 2),
+            timestamp=now - timedelta(minutes=n),
+        )
+        for n in range(trades)
+    )
+    for batch in chunked(history, SEED_BATCH_SIZE):
+        Trade.objects.bulk_create(batch)
+    return user, owned
+
+
+def percentile(samples: List[float], q: float) -> float:
+    """Nearest-rank percentile of samples, q in [0, 100]."""
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def measure(name: str, operation: Callable[[], Any], provider: SyntheticProvider,
+            iterations: int, warmup: int = 0, cold_cache: bool = False) -> Dict[str, Any]:
+    """Run operation warmup + iterations times and summarise the timed runs."""
+    for _ in range(warmup):
+        operation()
+
+    samples, queries, upstream = [], [], Counter()
+    for _ in range(iterations):
+        if cold_cache:
+            quote_cache.clear()
+            price_book.clear()
+        calls_before = provider.calls.copy()
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            operation()
+            samples.append(time.perf_counter() - started)
+        queries.append(len(captured))
+        upstream.update(provider.calls - calls_before)
+
+    return {
+        "name": name,
+        "iterations": iterations,
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+        "mean_ms": round(mean(samples) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3),
+        "queries": round(mean(queries), 2),
+        "upstream_calls": round(sum(upstream.values()) / iterations, 2),
+        "upstream_by_method": {method: round(count / iterations, 2) for method, count in sorted(upstream.items())},
+    }
+
+
+def _expect(response, status: int, name: str):
+    if response.status_code != status:
+        raise RuntimeError(f"{name} returned HTTP {response.status_code}, expected {status}.")
+    return response
+
+
+def operations(client: Client, portfolio: Portfolio) -> Dict[str, Callable[[], Any]]:
+    """The benchmarked operations for a seeded portfolio and a client logged in as its owner."""
+    symbol = portfolio.holdings.order_by("symbol").values_list("symbol", flat=True).first()
+    sides = itertools.cycle(["buy", "sell"])
+    details = reverse("portfolio_details", args=[portfolio.id])
+    trade = reverse("mock_trade", args=[portfolio.id])
+    history = reverse("get_stock_history")
+
+    return {
+        "Portfolio.total_value": portfolio.total_value,
+        "Portfolio.total_profit_loss": portfolio.total_profit_loss,
+        "mock_trade": lambda: _expect(client.post(trade, {
+            "trade_type": next(sides), "symbol": symbol, "quantity": 1,
+        }), 302, "mock_trade"),
+        "dashboard": lambda: _expect(client.get(reverse("dashboard")), 200, "dashboard"),
+        "portfolio_details": lambda: _expect(client.get(details), 200, "portfolio_details"),
+        "get_stock_history": lambda: _expect(client.get(history, {"symbol": symbol, "timeframe": "1Y"}),
+                                             200, "get_stock_history"),
+    }
+
+
+def run_benchmarks(scales: Iterable[int] = DEFAULT_SCALES, iterations: int = 20, warmup: int = 2,
+                   latency: float = 0.005, cold_cache: bool = False, rng_seed: int = 0,
+                   progress: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    """
+    Seed each scale, time every operation against a SyntheticProvider and roll back.
+
+    Args:
+        scales: Trade-history sizes to benchmark.
+        iterations: Timed runs per operation.
+        warmup: Untimed runs per operation first.
+        latency: Seconds the fake backend waits per call.
+        cold_cache: Clear the quote cache and price book before every run.
+
+    Returns:
+        Dict[str, Any]: JSON-ready document with the environment, settings and one result per scale and operation.
+    """
+    provider = SyntheticProvider(latency)
+    previous = set_provider(provider)
+    quote_cache.clear()
+    price_book.clear()
+    quote_breaker.reset()
+    bar_breaker.reset()
+    results = []
+    try:
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"], MOCK_TRADE_QUEUE=False):
+            for scale in scales:
+                with transaction.atomic():
+                    started = time.perf_counter()
+                    user, portfolios = seed(scale, rng_seed=rng_seed)
+                    if progress:
+                        progress(f"Seeded {scale:,} trade(s) in {time.perf_counter() - started:.1f}s.")
+                    client = Client()
+                    client.force_login(user)
+                    for name, operation in operations(client, portfolios[0]).items():
+                        result = measure(name, operation, provider, iterations, warmup, cold_cache)
+                        results.append({"scale": scale, **result})
+                        if progress:
+                            progress(f"  {name:<28} p50 {result['p50_ms']:>9.2f} ms  p99 {result['p99_ms']:>9.2f} ms  "
+                                     f"{result['queries']:>6} queries  {result['upstream_calls']:>5} upstream")
+                    transaction.set_rollback(True)
+                quote_cache.clear()
+                price_book.clear()
+    finally:
+        set_provider(previous)
+
+    return {
+        "generated_at": timezone.now().isoformat(),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "django": django.get_version(),
+        "database": connection.vendor,
+        "settings": {
+            "scales": list(scales),
+            "iterations": iterations,
+            "warmup": warmup,
+            "latency_ms": latency * 1000,
+            "cold_cache": cold_cache,
+            "seed": rng_seed,
+        },
+        "results": results,
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Pair up results by scale and operation and give the current/baseline ratio of each metric."""
+    previous = {(r["scale"], r["name"]): r for r in baseline.get("results", [])}
+    rows = []
+    for result in current["results"]:
+        before = previous.get((result["scale"], result["name"]))
+        if before is None:
+            continue
+        rows.append({
+            "scale": result["scale"],
+            "name": result["name"],
+            **{
+                f"{metric}_ratio": round(result[metric] / before[metric], 3) if before[metric] else None
+                for metric in ("p50_ms", "p99_ms", "queries", "upstream_calls")
+            },
+        })
+    return rows
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=Path(settings.BASE_DIR), capture_output=True,
+                              text=True, timeout=5, check=True).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
@@ -0,0 +1,94 @@
+"""
+Price series for charts.
+
+A chart a few hundred pixels wide cannot show more points than it has
+pixels, so long series are reduced with Largest-Triangle-Three-Buckets
+(LTTB) before they are sent. LTTB keeps the first and last points and, from
+each bucket in between, the point forming the largest triangle with the
+point kept before it and the average of the next bucket. Peaks and troughs
+survive, where plain decimation would drop them.
+
+Series are sent as columns: a start time in epoch seconds, each point's
+offset from it in seconds, and the prices.
+"""
+
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Indices of the `threshold` points LTTB keeps from a series sorted by x.
+
+    Bucket bounds and averages are computed for all buckets at once. Each
+    bucket then needs one vectorized area computation, because which point
+    it keeps depends on the point kept in the bucket before it.
+
+    Args:
+        x (np.ndarray): Increasing x values, e.g. epoch seconds.
+        y (np.ndarray): Values at each x.
+        threshold (int): Points to keep, at least 3.
+
+    Returns:
+        np.ndarray: Increasing indices into x and y. Every index if the series is no longer than threshold.
+    """
+    n = len(x)
+    if threshold >= n:
+        return np.arange(n)
+    if threshold < 3:
+        raise ValueError("LTTB needs to keep at least 3 points.")
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    # Points between the first and last are split into threshold - 2 buckets.
+    # Each bucket holds at least one point, because threshold < n.
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.intp)
+    sizes = np.diff(edges)
+    average_x = np.add.reduceat(x[1:-1], edges[:-1] - 1) / sizes
+    average_y = np.add.reduceat(y[1:-1], edges[:-1] - 1) / sizes
+    # The point after the last bucket is the last point.
+    next_x = np.append(average_x[1:], x[-1])
+    next_y = np.append(average_y[1:], y[-1])
+
+    kept = np.empty(threshold, dtype=np.intp)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for bucket in range(threshold - 2):
+        lo, hi = edges[bucket], edges[bucket + 1]
+        # Twice the triangle area; the factor does not change which point is largest.
+        area = np.abs((x[a] - next_x[bucket]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (next_y[bucket] - y[a]))
+        a = lo + int(np.argmax(area))
+        kept[bucket + 1] = a
+    return kept
+
+
+def columnar_series(frame: pd.DataFrame, column: str = "close", max_points: Optional[int] = None) -> Dict[str, Any]:
+    """
+    One column of a time-indexed frame as a compact chart payload.
+
+    Args:
+        frame (pd.DataFrame): Rows indexed by timestamp, in time order. Naive timestamps are read as UTC.
+        column (str): The column to send.
+        max_points (Optional[int]): Downsample with LTTB to at most this many points.
+
+    Returns:
+        Dict[str, Any]: "start" (epoch seconds of the first point, None if empty), "offsets" (seconds
+        from start), "prices", and "total", the number of points before downsampling.
+    """
+    # The index unit varies with the source and the pandas version, so convert through NumPy.
+    seconds = pd.DatetimeIndex(frame.index).values.astype("datetime64[s]").astype("int64")
+    values = frame[column].to_numpy(dtype=float)
+    total = len(values)
+    if max_points and total > max_points:
+        kept = lttb(seconds, values, max_points)
+        seconds, values = seconds[kept], values[kept]
+
+    start = int(seconds[0]) if total else None
+    return {
+        "start": start,
+        "offsets": (seconds - start).tolist() if total else [],
+        "prices": values.tolist(),
+        "total": total,
+    }
@@ -0,0 +1,102 @@
+"""
+Streaming exports of a portfolio's trades, holdings and performance series.
+
+Rows are read with QuerySet.iterator() and encoded as they are produced, so
+a response starts straight away and memory does not grow with the number of
+rows. Trade exports use the same columns as the CSV import.
+"""
+
+import csv
+import json
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, NamedTuple, Tuple
+
+from .models import Holding, Portfolio, PortfolioPerformance, Trade
+
+CHUNK_SIZE = 2000
+# Rows encoded per chunk of the response body.
+ROWS_PER_WRITE = 500
+
+
+class Dataset(NamedTuple):
+    columns: Tuple[str, ...]
+    rows: Callable[[Portfolio], Iterable[tuple]]
+
+
+def _trades(portfolio):
+    return Trade.objects.filter(portfolio=portfolio).order_by("timestamp", "id").values_list(
+        "timestamp", "symbol", "trade_type", "quantity", "trade_price", "price_floor", "price_ceiling"
+    )
+
+
+def _holdings(portfolio):
+    return Holding.objects.filter(portfolio=portfolio).order_by("symbol").values_list(
+        "symbol", "quantity", "average_price"
+    )
+
+
+def _performance(portfolio):
+    return PortfolioPerformance.objects.filter(portfolio=portfolio).order_by("date").values_list(
+        "date", "total_value"
+    )
+
+
+DATASETS: Dict[str, Dataset] = {
+    "trades": Dataset(("timestamp", "symbol", "trade_type", "quantity", "price", "price_floor", "price_ceiling"), _trades),
+    "holdings": Dataset(("symbol", "quantity", "average_price"), _holdings),
+    "performance": Dataset(("date", "total_value"), _performance),
+}
+
+
+def _encode(value):
+    """Dates and datetimes as ISO 8601; everything else as is (csv writes None as an empty field)."""
+    return value.isoformat() if hasattr(value, "isoformat") else value
+
+
+def _batches(rows: Iterable[tuple]) -> Iterator[list]:
+    rows = iter(rows)
+    while batch := list(islice(rows, ROWS_PER_WRITE)):
+        yield batch
+
+
+class _Echo:
+    """File-like object whose write() hands back the line instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(columns: Tuple[str, ...], rows: Iterable[tuple]) -> Iterator[str]:
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for batch in _batches(rows):
+        yield "".join(writer.writerow([_encode(value) for value in row]) for row in batch)
+
+
+def stream_ndjson(columns: Tuple[str, ...], rows: Iterable[tuple]) -> Iterator[str]:
+    for batch in _batches(rows):
+        yield "".join(
+            json.dumps({column: _encode(value) for column, value in zip(columns, row)}) + "\n"
+            for row in batch
+        )
+
+
+FORMATS = {
+    "csv": (stream_csv, "text/csv"),
+    "ndjson": (stream_ndjson, "application/x-ndjson"),
+}
+
+
+def export_portfolio(portfolio: Portfolio, dataset: str, fmt: str = "csv") -> Tuple[Iterator[str], str]:
+    """
+    Stream one dataset of a portfolio in the given format.
+
+    Returns:
+        Tuple[Iterator[str], str]: The encoded chunks and their content type.
+
+    Raises:
+        KeyError: If the dataset or format is unknown.
+    """
+    columns, rows = DATASETS[dataset]
+    encode, content_type = FORMATS[fmt]
+    return encode(columns, rows(portfolio).iterator(chunk_size=CHUNK_SIZE)), content_type
@@ -0,0 +1,176 @@
+"""
+Bulk trade import from CSV.
+
+The file is parsed lazily and handled in fixed-size chunks: each chunk is
+validated and written with one bulk_create, so memory stays flat however long
+the file is. Holdings and trade aggregates are then rebuilt once from the
+full history.
+
+Expected columns: timestamp, symbol, trade_type, quantity, price. Timestamps
+are ISO dates or datetimes; naive values are taken as US market time, and
+plain dates as the market close. Optional price_floor and price_ceiling
+columns, as written by the trade export, are checked against the price.
+Imported limits are recorded but not armed as triggers unless asked for,
+since they were set against prices that may be long gone.
+"""
+
+import csv
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, time as clock
+from decimal import Decimal
+from itertools import islice
+from typing import Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .bar_store import MARKET_TZ
+from .models import Portfolio, Trade
+from .trading import rebuild_positions, validate_limits
+
+REQUIRED_COLUMNS = ("timestamp", "symbol", "trade_type", "quantity", "price")
+CHUNK_SIZE = 5000
+MAX_REPORTED_ERRORS = 100
+MARKET_CLOSE = clock(16, 0)
+
+
+@dataclass
+class ImportResult:
+    rows: int = 0
+    imported: int = 0
+    error_count: int = 0
+    errors: List[str] = field(default_factory=list)
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def add_error(self, line: int, message: str) -> None:
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"Line {line}: {message}")
+
+
+def read_rows(stream: TextIO) -> Iterator[Tuple[int, dict]]:
+    """Yield (line number, row) pairs from a CSV stream, raising ValueError if required columns are missing."""
+    reader = csv.DictReader(stream)
+    missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"Missing column(s): {', '.join(missing)}.")
+    for row in reader:
+        yield reader.line_num, row
+
+
+def parse_timestamp(value: str) -> datetime:
+    value = value.strip()
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid timestamp {value!r}.")
+    if len(value) == 10:
+        parsed = datetime.combine(parsed.date(), MARKET_CLOSE)
+    if timezone.is_naive(parsed):
+        parsed = MARKET_TZ.localize(parsed)
+    return parsed
+
+
+def parse_limit(row: dict, column: str) -> Optional[float]:
+    value = (row.get(column) or "").strip()
+    if not value:
+        return None
+    try:
+        limit = float(value)
+    except ValueError:
+        raise ValueError(f"Invalid {column.replace('_', ' ')} {value!r}.")
+    if limit <= 0:
+        raise ValueError(f"{column.replace('_', ' ').capitalize()} must be greater than zero.")
+    return limit
+
+
+def parse_row(row: dict) -> Trade:
+    """Validate one CSV row and build an unsaved Trade from it, raising ValueError if it is invalid."""
+    symbol = (row["symbol"] or "").strip().upper()
+    if not symbol or len(symbol) > 10:
+        raise ValueError(f"Invalid symbol {row['symbol']!r}.")
+    trade_type = (row["trade_type"] or "").strip().lower()
+    if trade_type not in ("buy", "sell"):
+        raise ValueError(f"Invalid trade type {row['trade_type']!r}.")
+    try:
+        quantity = int(row["quantity"])
+        price = float(row["price"])
+    except (TypeError, ValueError):
+        raise ValueError("Quantity must be a whole number and price a number.")
+    if quantity <= 0 or price <= 0:
+        raise ValueError("Quantity and price must be greater than zero.")
+    price_floor, price_ceiling = parse_limit(row, "price_floor"), parse_limit(row, "price_ceiling")
+    validate_limits(price, price_floor, price_ceiling)
+    return Trade(symbol=symbol, trade_type=trade_type, quantity=quantity, trade_price=price,
+                 price_floor=price_floor, price_ceiling=price_ceiling,
+                 timestamp=parse_timestamp(row["timestamp"] or ""))
+
+
+def chunked(rows: Iterable, size: int) -> Iterator[list]:
+    rows = iter(rows)
+    while chunk := list(islice(rows, size)):
+        yield chunk
+
+
+def import_trades(portfolio: Portfolio, stream: TextIO, chunk_size: int = CHUNK_SIZE,
+                  adjust_balance: bool = False, arm_triggers: bool = False) -> ImportResult:
+    """
+    Import trades from a CSV stream into a portfolio.
+
+    Invalid rows are skipped and reported; valid ones are all imported in one
+    transaction, together with the rebuilt holdings for the symbols imported.
+
+    Args:
+        portfolio (Portfolio): The portfolio to import into.
+        stream (TextIO): CSV text with a header row.
+        chunk_size (int): Rows validated and inserted per batch.
+        adjust_balance (bool): Also debit buys and credit sells to the cash
+            balance, as if the trades had been placed here.
+        arm_triggers (bool): Let the trigger engine act on imported price
+            floors and ceilings. Otherwise they are marked as already fired.
+
+    Returns:
+        ImportResult: Row counts, up to MAX_REPORTED_ERRORS error messages and timing.
+
+    Raises:
+        ValueError: If the header is missing required columns.
+    """
+    started = time.perf_counter()
+    imported_at = timezone.now()
+    result = ImportResult()
+    symbols = set()
+    cash = Decimal(0)
+
+    with transaction.atomic():
+        for chunk in chunked(read_rows(stream), chunk_size):
+            trades = []
+            for line, row in chunk:
+                result.rows += 1
+                try:
+                    trade = parse_row(row)
+                except ValueError as e:
+                    result.add_error(line, str(e))
+                    continue
+                trade.portfolio = portfolio
+                if not arm_triggers and (trade.price_floor is not None or trade.price_ceiling is not None):
+                    trade.trigger_fired_at = imported_at
+                trades.append(trade)
+                symbols.add(trade.symbol)
+                value = Decimal(str(trade.quantity * trade.trade_price))
+                cash += value if trade.trade_type == "sell" else -value
+            Trade.objects.bulk_create(trades)
+            result.imported += len(trades)
+
+        if result.imported:
+            rebuild_positions(portfolio, symbols)
+            if adjust_balance:
+                Portfolio.objects.filter(pk=portfolio.pk).update(balance=F("balance") + cash)
+
+    result.seconds = time.perf_counter() - started
+    return result
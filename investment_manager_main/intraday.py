@@ -0,0 +1,158 @@
+"""
+Intraday bars for history charts.
+
+Daily bars live in the database (see bar_store.py). Intraday bars are
+fetched from the market-data provider in chunks and cached in memory instead.
+Chunks sit on a fixed grid of UTC days, e.g. two-day chunks for 1Min bars,
+so the same chunk is requested and cached no matter which range asked for
+it. A chunk that ended a while ago will not change again and is cached for
+a day. The chunk covering now is cached for INTRADAY_CACHE_TTL seconds.
+
+Missing chunks are fetched concurrently. Each is one upstream request (the
+async client follows page tokens if a chunk spans several pages), goes
+through the usual single-flight, circuit breaker and rate limiter, and the
+chunks are joined with a single concat at the end.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, List, Optional, Tuple
+
+import pytz
+from asgiref.sync import async_to_sync
+
+from .alpaca_api import afetch_bars
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+MARKET_TZ = pytz.timezone("America/New_York")
+
+# Days of bars per chunk, small enough that a chunk fits in one 10,000-bar
+# page even with extended-hours trading.
+CHUNK_DAYS = {"1Min": 2, "5Min": 3, "15Min": 7, "1Hour": 30}
+
+INTRADAY_CACHE_TTL = float(os.getenv("ALPACA_INTRADAY_CACHE_TTL", "60"))
+INTRADAY_CACHE_CLOSED_TTL = float(os.getenv("ALPACA_INTRADAY_CACHE_CLOSED_TTL", "86400"))
+INTRADAY_CACHE_MAX_SIZE = int(os.getenv("ALPACA_INTRADAY_CACHE_MAX_SIZE", "256"))
+# Bars for the last minutes can still be amended, so a chunk counts as closed
+# only this long after it ends.
+SETTLE_SECONDS = 15 * 60
+
+Chunk = Tuple[str, str, int]
+
+
+class ChunkCache:
+    """In-process LRU of bar chunks, each with its own expiry time."""
+
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self._entries: "OrderedDict[Chunk, Tuple[pd.DataFrame, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, chunk: Chunk) -> Optional[pd.DataFrame]:
+        with self._lock:
+            entry = self._entries.get(chunk)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._entries[chunk]
+                return None
+            self._entries.move_to_end(chunk)
+            return entry[0]
+
+    def set(self, chunk: Chunk, bars: pd.DataFrame, ttl: float) -> None:
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[chunk] = (bars, time.monotonic() + ttl)
+            self._entries.move_to_end(chunk)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+chunk_cache = ChunkCache(max_size=INTRADAY_CACHE_MAX_SIZE)
+
+
+def chunk_bounds(chunk: Chunk) -> Tuple[datetime, datetime]:
+    """Start and end of a chunk, in UTC."""
+    _, timeframe, number = chunk
+    length = timedelta(days=CHUNK_DAYS[timeframe])
+    start = datetime(1970, 1, 1, tzinfo=pytz.UTC) + number * length
+    return start, start + length
+
+
+def chunks(symbol: str, timeframe: str, start: datetime, end: datetime) -> List[Chunk]:
+    """The chunks covering [start, end], oldest first."""
+    length = CHUNK_DAYS[timeframe] * 86400
+    first, last = int(start.timestamp() // length), int(end.timestamp() // length)
+    return [(symbol, timeframe, number) for number in range(first, last + 1)]
+
+
+async def _fetch_chunk(chunk: Chunk, now: datetime) -> pd.DataFrame:
+    cached = chunk_cache.get(chunk)
+    if cached is not None:
+        return cached
+    chunk_start, chunk_end = chunk_bounds(chunk)
+    bars = await afetch_bars(chunk[0], chunk_start, min(chunk_end, now), chunk[1])
+    closed = chunk_end <= now - timedelta(seconds=SETTLE_SECONDS)
+    chunk_cache.set(chunk, bars, INTRADAY_CACHE_CLOSED_TTL if closed else INTRADAY_CACHE_TTL)
+    return bars
+
+
+async def aget_intraday_bars(symbol: str, timeframe: str, days: int) -> Optional[pd.DataFrame]:
+    """
+    Get the last `days` days of intraday bars for a symbol.
+
+    Args:
+        symbol (str): Stock ticker symbol.
+        timeframe (str): Bar size, one of CHUNK_DAYS.
+        days (int): Number of calendar days to cover, ending now.
+
+    Returns:
+        Optional[pd.DataFrame]: Bars indexed by UTC timestamp, or None if none
+        are available or a chunk fails to download.
+    """
+    import pandas as pd
+
+    symbol = symbol.strip().upper()
+    if not symbol or timeframe not in CHUNK_DAYS:
+        return None
+
+    end = datetime.now(pytz.UTC)
+    start = end - timedelta(days=days)
+    try:
+        frames = await asyncio.gather(*(_fetch_chunk(chunk, end) for chunk in chunks(symbol, timeframe, start, end)))
+    except Exception as e:
+        print(f"Error fetching {timeframe} bars for {symbol}: {e}")
+        return None
+
+    frames = [bars for bars in frames if not bars.empty]
+    if not frames:
+        return None
+    bars = pd.concat(frames)
+    # Neighbouring chunks share the bar at their boundary.
+    bars = bars[~bars.index.duplicated()]
+    bars = bars[(bars.index >= start) & (bars.index <= end)]
+    return bars if not bars.empty else None
+
+
+def get_intraday_bars(symbol: str, timeframe: str, days: int) -> Optional[pd.DataFrame]:
+    """Sync version of aget_intraday_bars. Chunks are still fetched concurrently."""
+    return async_to_sync(aget_intraday_bars)(symbol, timeframe, days)
+
+
+def last_session(bars: pd.DataFrame) -> pd.DataFrame:
+    """Only the bars of the most recent trading day, in market time."""
+    dates = bars.index.tz_convert(MARKET_TZ).date
+    return bars[dates == dates[-1]]
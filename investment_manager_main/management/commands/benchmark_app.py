@@ -0,0 +1,63 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from investment_manager_main.benchmarks import DEFAULT_SCALES, compare, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Time portfolio valuation, mock trades, the dashboard, portfolio details and stock history "
+        "against a fake market-data backend at several trade-history sizes, and write the results "
+        "as JSON. Seeded data is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scales", default=",".join(str(s) for s in DEFAULT_SCALES),
+                            help="Comma-separated trade-history sizes to seed, up to 1000000.")
+        parser.add_argument("--iterations", type=int, default=20, help="Timed runs per operation.")
+        parser.add_argument("--warmup", type=int, default=2, help="Untimed runs per operation first.")
+        parser.add_argument("--latency", type=float, default=5.0, help="Fake backend latency per call, in ms.")
+        parser.add_argument("--cold-cache", action="store_true",
+                            help="Clear the quote cache and price book before every run.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", default="benchmark-results.json", help="JSON file to write.")
+        parser.add_argument("--compare", help="Earlier results file to compare against.")
+        parser.add_argument("--max-regression", type=float,
+                            help="With --compare, fail if any p50 grows by more than this factor.")
+
+    def handle(self, *args, **options):
+        try:
+            scales = [int(s) for s in options["scales"].split(",") if s.strip()]
+        except ValueError:
+            raise CommandError("--scales must be comma-separated integers.")
+        if not scales or min(scales) < 1 or max(scales) > 1_000_000:
+            raise CommandError("Scales must be between 1 and 1000000 trades.")
+
+        baseline = None
+        if options["compare"]:
+            try:
+                with open(options["compare"]) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Could not read {options['compare']}: {e}")
+
+        document = run_benchmarks(
+            scales, iterations=options["iterations"], warmup=options["warmup"],
+            latency=options["latency"] / 1000, cold_cache=options["cold_cache"], rng_seed=options["seed"],
+            progress=self.stdout.write,
+        )
+        with open(options["output"], "w") as f:
+            json.dump(document, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {len(document['results'])} result(s) to {options['output']}."))
+
+        if baseline is None:
+            return
+        regressions = []
+        for row in compare(baseline, document):
+            ratio = row["p50_ms_ratio"]
+            self.stdout.write(f"{row['scale']:>9,} {row['name']:<28} p50 x{ratio}  queries x{row['queries_ratio']}")
+            if options["max_regression"] and ratio and ratio > options["max_regression"]:
+                regressions.append(f"{row['name']} at {row['scale']:,} trades (x{ratio})")
+        if regressions:
+            raise CommandError(f"p50 regressed beyond x{options['max_regression']}: {', '.join(regressions)}.")
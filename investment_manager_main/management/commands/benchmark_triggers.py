@@ -0,0 +1,62 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from investment_manager_main.triggers import Trigger, TriggerEngine
+
+# The engine has to keep up with a live feed of thousands of ticks per second.
+# A scan over every open trigger on each tick falls far below this.
+MIN_RATE = 5000
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure how many price ticks per second the trigger engine can check against a "
+        "synthetic set of open floors and ceilings. Runs in memory; no database writes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--triggers", type=int, default=100_000, help="Open triggers to index.")
+        parser.add_argument("--symbols", type=int, default=500, help="Symbols the triggers are spread over.")
+        parser.add_argument("--ticks", type=int, default=200_000, help="Price updates to check.")
+        parser.add_argument("--min-rate", type=float, default=MIN_RATE,
+                            help=f"Fail if fewer ticks per second than this are checked (default {MIN_RATE}, 0 to disable).")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        symbols = [f"SYM{i}" for i in range(options["symbols"])]
+
+        engine = TriggerEngine()
+        started = time.perf_counter()
+        for trade_id in range(1, options["triggers"] + 1):
+            engine.add(Trigger(
+                trade_id=trade_id,
+                portfolio_id=1,
+                symbol=rng.choice(symbols),
+                quantity=1,
+                floor=rng.uniform(50, 95),
+                ceiling=rng.uniform(105, 150),
+            ))
+        build_seconds = time.perf_counter() - started
+
+        # Each symbol random-walks from 100, so triggers near the start price fire as the run goes on.
+        prices = dict.fromkeys(symbols, 100.0)
+        ticks = []
+        for _ in range(options["ticks"]):
+            symbol = rng.choice(symbols)
+            prices[symbol] *= 1 + rng.gauss(0, 0.002)
+            ticks.append((symbol, prices[symbol]))
+
+        fired = 0
+        started = time.perf_counter()
+        for symbol, price in ticks:
+            fired += len(engine.check(symbol, price))
+        check_seconds = time.perf_counter() - started
+        rate = len(ticks) / check_seconds if check_seconds else float("inf")
+
+        self.stdout.write(f"Indexed {options['triggers']} trigger(s) over {len(symbols)} symbol(s) in {build_seconds:.2f}s.")
+        self.stdout.write(f"Checked {len(ticks)} tick(s) in {check_seconds:.3f}s: {rate:,.0f} ticks/s, {fired} fired.")
+        if rate < options["min_rate"]:
+            raise CommandError(f"Trigger checks ran at {rate:,.0f} ticks/s, below the required {options['min_rate']:,.0f}.")
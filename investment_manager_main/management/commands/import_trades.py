@@ -0,0 +1,44 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from investment_manager_main.imports import CHUNK_SIZE, import_trades
+from investment_manager_main.models import Portfolio
+
+
+class Command(BaseCommand):
+    help = "Import a portfolio's trade history from a CSV file (timestamp, symbol, trade_type, quantity, price)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("portfolio_id", type=int)
+        parser.add_argument("path", help="CSV file to import, or - for standard input.")
+        parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Rows validated and inserted per batch.")
+        parser.add_argument("--adjust-balance", action="store_true",
+                            help="Debit buys and credit sells to the portfolio's cash balance.")
+        parser.add_argument("--arm-triggers", action="store_true",
+                            help="Act on imported price floors and ceilings as live triggers.")
+
+    def handle(self, *args, **options):
+        portfolio = Portfolio.objects.filter(id=options["portfolio_id"]).first()
+        if portfolio is None:
+            raise CommandError(f"Portfolio {options['portfolio_id']} does not exist.")
+
+        try:
+            if options["path"] == "-":
+                result = import_trades(portfolio, sys.stdin, options["chunk_size"], options["adjust_balance"],
+                                       options["arm_triggers"])
+            else:
+                with open(options["path"], newline="", encoding="utf-8-sig") as stream:
+                    result = import_trades(portfolio, stream, options["chunk_size"], options["adjust_balance"],
+                                           options["arm_triggers"])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        for error in result.errors:
+            self.stderr.write(error)
+        if result.error_count > len(result.errors):
+            self.stderr.write(f"... and {result.error_count - len(result.errors)} more invalid row(s).")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result.imported} of {result.rows} row(s) in {result.seconds:.2f}s "
+            f"({result.rows_per_second:,.0f} rows/s)."
+        ))
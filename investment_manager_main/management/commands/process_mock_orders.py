@@ -0,0 +1,65 @@
+import os
+import socket
+import threading
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from investment_manager_main.trading import process_orders, requeue_stale_orders
+
+
+class Command(BaseCommand):
+    help = "Settle queued mock orders in batches. Several workers, in this process or others, can run at once."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=1, help="Worker threads to run in this process.")
+        parser.add_argument("--batch-size", type=int, default=100, help="Orders claimed per batch.")
+        parser.add_argument("--interval", type=float, default=1.0,
+                            help="Seconds to wait when the queue is empty.")
+        parser.add_argument("--stale-after", type=float, default=300.0,
+                            help="Seconds after which orders left processing by a dead worker are requeued.")
+        parser.add_argument("--once", action="store_true", help="Drain the queue once and exit.")
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale_orders(timedelta(seconds=options["stale_after"]))
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} stale order(s).")
+
+        self.options = options
+        self.stopped = threading.Event()
+        self.totals = [0] * options["workers"]
+        prefix = f"{socket.gethostname()}:{os.getpid()}"
+
+        try:
+            if options["workers"] == 1:
+                self.work(prefix, 0)
+            else:
+                threads = [
+                    threading.Thread(target=self.work, args=(f"{prefix}:{i}", i, True),
+                                     name=f"mock-order-worker-{i}", daemon=True)
+                    for i in range(options["workers"])
+                ]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    while thread.is_alive():
+                        thread.join(0.5)
+        except KeyboardInterrupt:
+            self.stopped.set()
+
+        self.stdout.write(self.style.SUCCESS(f"Processed {sum(self.totals)} order(s)."))
+
+    def work(self, worker, index, own_connection=False):
+        try:
+            while not self.stopped.is_set():
+                claimed = process_orders(worker, self.options["batch_size"])
+                self.totals[index] += claimed
+                if not claimed:
+                    if self.options["once"]:
+                        return
+                    close_old_connections()
+                    self.stopped.wait(self.options["interval"])
+        finally:
+            if own_connection:
+                connection.close()
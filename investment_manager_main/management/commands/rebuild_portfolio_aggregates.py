@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from investment_manager_main.models import Portfolio
+from investment_manager_main.trading import replay_trades
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = "Recompute each portfolio's invested amount, realized P&L and trade count from its trade history."
+
+    def add_arguments(self, parser):
+        parser.add_argument("portfolio_ids", nargs="*", type=int, help="Only rebuild these portfolios.")
+
+    def handle(self, *args, **options):
+        portfolios = Portfolio.objects.order_by("id")
+        if options["portfolio_ids"]:
+            portfolios = portfolios.filter(id__in=options["portfolio_ids"])
+
+        pending = []
+        rebuilt = 0
+        for portfolio in portfolios.iterator():
+            replay_trades(portfolio)
+            pending.append(portfolio)
+            if len(pending) >= BATCH_SIZE:
+                rebuilt += self.flush(pending)
+        rebuilt += self.flush(pending)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt aggregates for {rebuilt} portfolio(s)."))
+
+    def flush(self, pending):
+        Portfolio.objects.bulk_update(pending, ["invested_amount", "realized_profit_loss", "trade_count"])
+        count = len(pending)
+        pending.clear()
+        return count
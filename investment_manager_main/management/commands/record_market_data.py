@@ -0,0 +1,43 @@
+from datetime import datetime, timedelta
+
+import pytz
+from django.core.management.base import BaseCommand, CommandError
+
+from investment_manager_main.alpaca_api import VALID_TIMEFRAMES, use_batch_budget
+from investment_manager_main.price_feed import watched_symbols
+from investment_manager_main.providers import get_provider, record_market_data
+
+
+class Command(BaseCommand):
+    help = ("Record quotes, bars and the asset list from the configured market-data provider "
+            "into a directory the replay provider can serve (MARKET_DATA_PROVIDER=replay).")
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory", help="Directory to write the recording to.")
+        parser.add_argument("symbols", nargs="*", help="Symbols to record; defaults to every held or alerted symbol.")
+        parser.add_argument("--days", type=int, default=365, help="Calendar days of bars to record, ending now.")
+        parser.add_argument("--timeframe", action="append", dest="timeframes",
+                            help="Bar size to record; repeat for several. Defaults to 1Day.")
+        parser.add_argument("--quotes", type=int, default=1, help="Latest-trade samples to record per symbol.")
+        parser.add_argument("--interval", type=float, default=1.0, help="Seconds between quote samples.")
+
+    def handle(self, *args, **options):
+        symbols = options["symbols"] or sorted(watched_symbols())
+        if not symbols:
+            raise CommandError("No symbols given and none are held or alerted.")
+        timeframes = options["timeframes"] or ["1Day"]
+        unknown = set(timeframes) - VALID_TIMEFRAMES
+        if unknown:
+            raise CommandError(f"Unknown timeframe(s): {', '.join(sorted(unknown))}.")
+
+        use_batch_budget()
+        end = datetime.now(pytz.UTC)
+        counts = record_market_data(
+            get_provider(), options["directory"], symbols,
+            start=end - timedelta(days=options["days"]), end=end, timeframes=timeframes,
+            quotes=options["quotes"], interval=options["interval"],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Recorded {counts['quotes']} quote(s), {counts['bars']} bar(s) and {counts['assets']} asset(s) "
+            f"for {len(symbols)} symbol(s) to {options['directory']}."
+        ))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from investment_manager_main.alerts import AlertEvaluator
+from investment_manager_main.price_feed import PriceFeed
+from investment_manager_main.price_sources import PollingPriceSource, drive
+
+
+class Command(BaseCommand):
+    help = "Evaluate active stock alerts against polled quotes or the streamed trade feed."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--source", choices=["poll", "stream"], default="poll",
+                            help="Poll quotes on an interval, or stream trades from the websocket.")
+        parser.add_argument("--interval", type=float, default=15.0,
+                            help="Seconds between polls when --source=poll.")
+        parser.add_argument("--refresh-interval", type=float, default=60.0,
+                            help="Seconds between reloading alerts created or removed by other processes.")
+
+    def handle(self, *args, **options):
+        evaluator = AlertEvaluator(on_fired=self.report)
+
+        if options["source"] == "stream":
+            feed = PriceFeed(refresh_interval=options["refresh_interval"], engines=[evaluator])
+            feed.sync_subscriptions()
+            self.stdout.write(f"Streaming trades for {len(evaluator)} alert(s).")
+            feed.run()
+            return
+
+        source = PollingPriceSource(evaluator.symbols, interval=options["interval"])
+        fired = drive(source, [evaluator], refresh_interval=options["refresh_interval"])
+        self.stdout.write(self.style.SUCCESS(f"Price source ended after firing {fired} alert(s)."))
+
+    def report(self, fired):
+        for alert in fired:
+            self.stdout.write(str(alert))
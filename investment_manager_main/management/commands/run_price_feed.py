@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+
+from investment_manager_main.alpaca_api import price_book
+from investment_manager_main.price_feed import PriceFeed
+from investment_manager_main.alerts import AlertEvaluator
+from investment_manager_main.triggers import TriggerEngine
+
+
+class Command(BaseCommand):
+    help = "Stream live trades for held and alerted symbols into the price book."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--flush-interval", type=float, default=1.0,
+                            help="Seconds between writes of buffered trades to the price book.")
+        parser.add_argument("--refresh-interval", type=float, default=60.0,
+                            help="Seconds between re-reading holdings and alerts for new symbols.")
+        parser.add_argument("--no-triggers", action="store_true",
+                            help="Do not act on trade price floors and ceilings.")
+        parser.add_argument("--no-alerts", action="store_true",
+                            help="Do not evaluate stock alerts.")
+
+    def handle(self, *args, **options):
+        if not price_book.cache_alias:
+            self.stderr.write(self.style.WARNING(
+                "ALPACA_PRICE_BOOK_ALIAS is not set, so prices are only visible to this process."
+            ))
+
+        engines = []
+        if not options["no_triggers"]:
+            engines.append(TriggerEngine())
+        if not options["no_alerts"]:
+            engines.append(AlertEvaluator(on_fired=self.report_alerts))
+
+        feed = PriceFeed(flush_interval=options["flush_interval"], refresh_interval=options["refresh_interval"],
+                         engines=engines)
+        feed.sync_subscriptions()
+        self.stdout.write(f"Streaming trades for {len(feed.symbols)} symbol(s).")
+        for engine in engines:
+            self.stdout.write(f"{type(engine).__name__}: watching {len(engine)} price level(s).")
+        feed.run()
+
+    def report_alerts(self, fired):
+        for alert in fired:
+            self.stdout.write(str(alert))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from investment_manager_main.alpaca_api import use_batch_budget
+from investment_manager_main.models import Portfolio
+from investment_manager_main.performance import backfill_portfolios, snapshot_portfolios
+
+
+class Command(BaseCommand):
+    help = "Record today's value of each portfolio and backfill missed days from stored closing prices."
+
+    def add_arguments(self, parser):
+        parser.add_argument("portfolio_ids", nargs="*", type=int, help="Only snapshot these portfolios.")
+        parser.add_argument("--backfill-days", type=int, default=30,
+                            help="Calendar days before today to backfill when missing (0 to disable).")
+        parser.add_argument("--no-sync", action="store_true",
+                            help="Backfill from bars already stored instead of downloading missing ones.")
+
+    def handle(self, *args, **options):
+        # Bar downloads for the backfill queue behind page loads, on the batch budget.
+        use_batch_budget()
+        portfolios = Portfolio.objects.order_by("id")
+        if options["portfolio_ids"]:
+            portfolios = portfolios.filter(id__in=options["portfolio_ids"])
+
+        backfilled = backfill_portfolios(portfolios, days=options["backfill_days"], sync=not options["no_sync"])
+        written = snapshot_portfolios(portfolios)
+        self.stdout.write(self.style.SUCCESS(
+            f"Recorded {written} snapshot(s) and backfilled {backfilled} missing day(s)."
+        ))
@@ -0,0 +1,107 @@
+import random
+import threading
+import time
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+
+from investment_manager_main.models import Holding, Portfolio, Trade
+from investment_manager_main.trading import execute_trade
+
+SYMBOL = "STRESS"
+
+
+class Command(BaseCommand):
+    help = (
+        "Fire concurrent buys and sells at one throwaway portfolio, check that its balance, holding "
+        "and aggregates add up afterwards, and report throughput."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--threads", type=int, default=8)
+        parser.add_argument("--trades", type=int, default=100, help="Trades per thread.")
+        parser.add_argument("--price", type=float, default=10.0)
+        parser.add_argument("--balance", type=float, default=500.0,
+                            help="Starting balance; keep it low so some buys are refused.")
+        parser.add_argument("--retries", type=int, default=50,
+                            help="Attempts per trade when the database reports a lock conflict.")
+        parser.add_argument("--keep", action="store_true", help="Keep the stress portfolio afterwards.")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        user = User.objects.create_user(username=f"stress-{time.time_ns()}")
+        portfolio = Portfolio.objects.create(user=user, name="Stress test", balance=Decimal(str(options["balance"])))
+        counts = {"buy": 0, "sell": 0, "refused": 0, "conflicts": 0}
+        lock = threading.Lock()
+
+        def trade(seed):
+            rng = random.Random(seed)
+            try:
+                for _ in range(options["trades"]):
+                    trade_type = rng.choice(["buy", "sell"])
+                    outcome = self.attempt(portfolio, trade_type, options, counts, lock)
+                    with lock:
+                        counts[outcome] += 1
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=trade, args=(options["seed"] + i,)) for i in range(options["threads"])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        try:
+            problems = self.verify(portfolio, options, counts)
+        finally:
+            if not options["keep"]:
+                user.delete()
+
+        executed = counts["buy"] + counts["sell"]
+        self.stdout.write(
+            f"{executed} trade(s) executed ({counts['buy']} buys, {counts['sell']} sells), "
+            f"{counts['refused']} refused, {counts['conflicts']} lock conflict(s) retried, "
+            f"in {elapsed:.2f}s: {executed / elapsed:,.0f} trades/s."
+        )
+        if problems:
+            raise CommandError("Inconsistent portfolio after stress run: " + "; ".join(problems))
+        self.stdout.write(self.style.SUCCESS("Balance, holding and aggregates are consistent."))
+
+    def attempt(self, portfolio, trade_type, options, counts, lock):
+        for _ in range(options["retries"]):
+            try:
+                execute_trade(portfolio, trade_type, SYMBOL, 1, options["price"])
+                return trade_type
+            except ValueError:
+                return "refused"
+            except OperationalError:
+                # SQLite reports "database is locked" instead of waiting for the writer.
+                with lock:
+                    counts["conflicts"] += 1
+                time.sleep(0.001)
+        raise CommandError("Gave up on a trade after repeated lock conflicts.")
+
+    def verify(self, portfolio, options, counts):
+        portfolio.refresh_from_db()
+        held = Holding.objects.filter(portfolio=portfolio, symbol=SYMBOL).values_list("quantity", flat=True).first() or 0
+        net_shares = counts["buy"] - counts["sell"]
+        expected_balance = Decimal(str(options["balance"])) - Decimal(str(options["price"])) * net_shares
+
+        problems = []
+        if held != net_shares:
+            problems.append(f"holding is {held} shares, expected {net_shares}")
+        if portfolio.balance != expected_balance:
+            problems.append(f"balance is {portfolio.balance}, expected {expected_balance}")
+        if portfolio.balance < 0:
+            problems.append("balance went negative")
+        trades = Trade.objects.filter(portfolio=portfolio).count()
+        if not portfolio.trade_count == trades == counts["buy"] + counts["sell"]:
+            problems.append(f"trade_count {portfolio.trade_count} and {trades} trade rows, "
+                            f"expected {counts['buy'] + counts['sell']}")
+        if abs(portfolio.invested_amount - net_shares * options["price"]) > 1e-6:
+            problems.append(f"invested amount is {portfolio.invested_amount}, expected {net_shares * options['price']}")
+        return problems
@@ -0,0 +1,389 @@
+"""
+Per-request performance metrics.
+
+MetricsMiddleware opens a RequestStats for every request. Four hooks fill it
+while the view runs:
+
+- a database execute wrapper, installed on every new connection, adds the
+  count and duration of each query;
+- track_upstream(), used by alpaca_api around every market-data call, adds
+  the count and duration of each call by endpoint (latest_trade,
+  latest_trades, bars);
+- record_queue_wait(), called by alpaca_api when a call has waited for the
+  upstream rate limiter, adds the time spent queued;
+- InstrumentedDjangoTemplates, the template backend, adds the time spent
+  rendering templates.
+
+The stats live in a context variable, so they follow the request into
+sync_to_async threads and async views. When the response is ready they are
+folded into in-process histograms labelled by view, served in Prometheus
+text format by the metrics view, and summarised in a Server-Timing header.
+Histograms are per process; scrape every worker.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Cumulative histogram with a fixed set of label names, in Prometheus' data model."""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self, *labels: str) -> Optional[Tuple[List[int], float, int]]:
+        """(cumulative bucket counts, sum, count) for one label set, or None if never observed."""
+        with self._lock:
+            series = self._series.get(labels)
+            return (list(series[0]), series[1], series[2]) if series else None
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, list(counts), total, count) for labels, (counts, total, count) in self._series.items())
+        for labels, counts, total, count in series:
+            bounds = [_number(bound) for bound in self.buckets] + ["+Inf"]
+            for bound, bucket_count in zip(bounds, counts + [count]):
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {bucket_count}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {count}")
+        return lines
+
+    def clear(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+
+class Gauge:
+    """
+    Current values with a fixed set of label names. If ``collect`` is set, it
+    is called at render time and returns the values keyed by label tuple.
+    """
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 collect: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.collect = collect
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+    def values(self) -> Dict[Tuple[str, ...], float]:
+        if self.collect is not None:
+            return dict(self.collect())
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        lines.extend(f"{self.name}{_labels(self.label_names, labels)} {_number(value)}"
+                     for labels, value in sorted(self.values().items()))
+        return lines
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Counter:
+    """Monotonic counter with a fixed set of label names."""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        lines.extend(f"{self.name}{_labels(self.label_names, labels)} {_number(value)}" for labels, value in values)
+        return lines
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+requests_total = Counter("investment_manager_requests_total", "Requests handled, by view and status code.",
+                         ["view", "status"])
+request_seconds = Histogram("investment_manager_request_duration_seconds", "Wall time per request.", ["view"])
+db_queries = Histogram("investment_manager_db_queries", "Database queries per request.", ["view"], COUNT_BUCKETS)
+db_seconds = Histogram("investment_manager_db_duration_seconds", "Time spent in database queries per request.",
+                       ["view"])
+upstream_calls = Histogram("investment_manager_upstream_calls", "Market-data calls per request.", ["view"],
+                           COUNT_BUCKETS)
+upstream_seconds = Histogram("investment_manager_upstream_duration_seconds",
+                             "Latency of each market-data call, by endpoint.", ["endpoint"])
+upstream_errors = Counter("investment_manager_upstream_errors_total", "Failed market-data calls, by endpoint.",
+                          ["endpoint"])
+upstream_rejected = Counter("investment_manager_upstream_rejected_total",
+                            "Market-data calls refused by an open circuit breaker, by endpoint.", ["endpoint"])
+upstream_queue_depth = Gauge("investment_manager_upstream_queue_depth",
+                             "Market-data calls waiting for the rate limiter, by priority.", ["priority"])
+upstream_wait_seconds = Histogram("investment_manager_upstream_wait_seconds",
+                                  "Time market-data calls waited for the rate limiter, by priority.", ["priority"])
+render_seconds = Histogram("investment_manager_render_duration_seconds", "Time spent rendering templates per request.",
+                           ["view"])
+
+REGISTRY = [requests_total, request_seconds, db_queries, db_seconds, upstream_calls, upstream_seconds,
+            upstream_errors, upstream_rejected, upstream_queue_depth, upstream_wait_seconds, render_seconds]
+
+
+def render_metrics() -> str:
+    """Every metric in Prometheus text exposition format."""
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+def reset_metrics() -> None:
+    for metric in REGISTRY:
+        metric.clear()
+
+
+class RequestStats:
+    """What one request spent on queries, market-data calls and template rendering."""
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.upstream: Dict[str, List] = {}
+        self.queue_seconds = 0.0
+        self.render_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add_query(self, seconds: float) -> None:
+        with self._lock:
+            self.queries += 1
+            self.query_seconds += seconds
+
+    def add_upstream(self, endpoint: str, seconds: float) -> None:
+        with self._lock:
+            entry = self.upstream.setdefault(endpoint, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def add_queue_wait(self, seconds: float) -> None:
+        with self._lock:
+            self.queue_seconds += seconds
+
+    def add_render(self, seconds: float) -> None:
+        with self._lock:
+            self.render_seconds += seconds
+
+    @property
+    def upstream_calls(self) -> int:
+        return sum(count for count, _ in self.upstream.values())
+
+    @property
+    def upstream_seconds(self) -> float:
+        return sum(seconds for _, seconds in self.upstream.values())
+
+
+_current: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+def current_stats() -> Optional[RequestStats]:
+    return _current.get()
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute wrapper that times queries made while a request is being measured."""
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.add_query(time.perf_counter() - started)
+
+
+def install_query_hook(sender, connection, **kwargs) -> None:
+    """connection_created receiver: time every query on the new connection."""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@contextmanager
+def track_upstream(endpoint: str) -> Iterator[None]:
+    """Time one market-data call. Works around awaits too, since it only reads the clock."""
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        upstream_errors.inc(endpoint)
+        raise
+    finally:
+        seconds = time.perf_counter() - started
+        upstream_seconds.observe(seconds, endpoint)
+        stats = _current.get()
+        if stats is not None:
+            stats.add_upstream(endpoint, seconds)
+
+
+def record_queue_wait(priority: str, seconds: float) -> None:
+    """Record how long a market-data call waited for the rate limiter."""
+    upstream_wait_seconds.observe(seconds, priority)
+    stats = _current.get()
+    if stats is not None:
+        stats.add_queue_wait(seconds)
+
+
+class TimedTemplate:
+    """Wraps a backend template so its render time is added to the current request's stats."""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            stats = _current.get()
+            if stats is not None:
+                stats.add_render(time.perf_counter() - started)
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing each top-level render."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+def _view_name(request) -> str:
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "<unmatched>"
+    return match.view_name or match._func_path
+
+
+def server_timing(stats: RequestStats, total: float) -> str:
+    parts = [
+        f'db;dur={stats.query_seconds * 1000:.1f};desc="{stats.queries} queries"',
+        f'upstream;dur={stats.upstream_seconds * 1000:.1f};desc="{stats.upstream_calls} calls"',
+    ]
+    parts.extend(
+        f'upstream-{endpoint.replace("_", "-")};dur={seconds * 1000:.1f};desc="{count} calls"'
+        for endpoint, (count, seconds) in sorted(stats.upstream.items())
+    )
+    if stats.queue_seconds:
+        parts.append(f"upstream-queue;dur={stats.queue_seconds * 1000:.1f}")
+    parts.append(f"render;dur={stats.render_seconds * 1000:.1f}")
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+
+class MetricsMiddleware:
+    """
+    Measures each request and records it under the view that handled it.
+    Put it first in MIDDLEWARE so the timings cover the rest of the stack.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.server_timing = getattr(settings, "METRICS_SERVER_TIMING", True)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, stats, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, stats, time.perf_counter() - started)
+
+    def _finish(self, request, response, stats: RequestStats, total: float):
+        view = _view_name(request)
+        requests_total.inc(view, str(response.status_code))
+        request_seconds.observe(total, view)
+        db_queries.observe(stats.queries, view)
+        db_seconds.observe(stats.query_seconds, view)
+        upstream_calls.observe(stats.upstream_calls, view)
+        render_seconds.observe(stats.render_seconds, view)
+        if self.server_timing:
+            response["Server-Timing"] = server_timing(stats, total)
+        return response
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investment_manager_main', '0005_remove_contactmessage_subject_contactmessage_phone_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stock',
+            name='bars_synced_from',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='stock',
+            name='bars_synced_to',
+            field=models.DateField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 4.2.30 on 2026-10-18 08:52
+
+from django.db import migrations, models
+
+
+def backfill_aggregates(apps, schema_editor):
+    Portfolio = apps.get_model('investment_manager_main', 'Portfolio')
+    Trade = apps.get_model('investment_manager_main', 'Trade')
+
+    for portfolio in Portfolio.objects.all():
+        positions = {}
+        trades = Trade.objects.filter(portfolio=portfolio).order_by('timestamp', 'id')
+        for trade in trades:
+            shares, average_price = positions.get(trade.symbol, (0, 0.0))
+            portfolio.trade_count += 1
+            if trade.trade_type == 'buy':
+                portfolio.invested_amount += trade.quantity * trade.trade_price
+                total = shares + trade.quantity
+                positions[trade.symbol] = (total, (shares * average_price + trade.quantity * trade.trade_price) / total)
+            else:
+                cost_basis = trade.quantity * average_price
+                portfolio.invested_amount -= cost_basis
+                portfolio.realized_profit_loss += trade.quantity * trade.trade_price - cost_basis
+                positions[trade.symbol] = (max(shares - trade.quantity, 0), average_price)
+        portfolio.save(update_fields=['invested_amount', 'realized_profit_loss', 'trade_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investment_manager_main', '0006_stock_bars_synced_range'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='portfolio',
+            name='invested_amount',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='portfolio',
+            name='realized_profit_loss',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='portfolio',
+            name='trade_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:01
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def remove_duplicate_snapshots(apps, schema_editor):
+    PortfolioPerformance = apps.get_model('investment_manager_main', 'PortfolioPerformance')
+
+    seen = set()
+    duplicates = []
+    for row in PortfolioPerformance.objects.order_by('-id').values('id', 'portfolio_id', 'date'):
+        key = (row['portfolio_id'], row['date'])
+        if key in seen:
+            duplicates.append(row['id'])
+        seen.add(key)
+    PortfolioPerformance.objects.filter(id__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investment_manager_main', '0007_portfolio_aggregates'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='portfolioperformance',
+            name='date',
+            field=models.DateField(default=django.utils.timezone.localdate),
+        ),
+        migrations.RunPython(remove_duplicate_snapshots, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='portfolioperformance',
+            constraint=models.UniqueConstraint(fields=('portfolio', 'date'), name='unique_portfolio_performance_date'),
+        ),
+    ]
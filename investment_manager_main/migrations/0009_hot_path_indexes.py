@@ -0,0 +1,44 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:02
+
+from django.db import migrations, models
+
+
+def merge_duplicate_holdings(apps, schema_editor):
+    Holding = apps.get_model('investment_manager_main', 'Holding')
+
+    kept = {}
+    for holding in Holding.objects.order_by('id'):
+        key = (holding.portfolio_id, holding.symbol)
+        first = kept.get(key)
+        if first is None:
+            kept[key] = holding
+            continue
+        total = first.quantity + holding.quantity
+        if total:
+            first.average_price = (first.average_price * first.quantity + holding.average_price * holding.quantity) / total
+        first.quantity = total
+        first.save(update_fields=['quantity', 'average_price'])
+        holding.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investment_manager_main', '0008_portfolio_performance_unique_date'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='stockalert',
+            index=models.Index(fields=['symbol', 'is_active'], name='stockalert_symbol_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trade',
+            index=models.Index(fields=['portfolio', 'timestamp', 'id'], name='trade_portfolio_time_idx'),
+        ),
+        migrations.RunPython(merge_duplicate_holdings, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='holding',
+            constraint=models.UniqueConstraint(fields=('portfolio', 'symbol'), name='unique_holding_portfolio_symbol'),
+        ),
+    ]
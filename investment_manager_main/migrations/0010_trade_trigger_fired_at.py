@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investment_manager_main', '0009_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trade',
+            name='trigger_fired_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
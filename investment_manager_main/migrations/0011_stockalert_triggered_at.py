@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 09:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investment_manager_main', '0010_trade_trigger_fired_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='stockalert',
+            name='triggered_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 11:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('investment_manager_main', '0013_trade_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='portfolio',
+            name='balance',
+            field=models.DecimalField(decimal_places=2, default=0.0, max_digits=10),
+        ),
+    ]
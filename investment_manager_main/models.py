@@ -1,33 +1,52 @@
 from django.db import models
 from django.contrib.auth.models import User
-from .alpaca_api import get_stock_price
+from django.utils import timezone
+from .alpaca_api import get_stock_price, get_stock_prices
 
 class Portfolio(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="portfolios")
     name = models.CharField(max_length=100, default="Default Portfolio")
     balance = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Running aggregates over the trade history, maintained by record_trade().
+    invested_amount = models.FloatField(default=0)
+    realized_profit_loss = models.FloatField(default=0)
+    trade_count = models.PositiveIntegerField(default=0)
+
+    def record_trade(self, trade_type, quantity, price, average_price=None):
+        """
+        Fold one trade into the running aggregates. Sells need the average
+        price paid for the shares being sold to release their cost basis.
+        """
+        self.trade_count += 1
+        if trade_type == "buy":
+            self.invested_amount += quantity * price
+        else:
+            cost_basis = quantity * average_price
+            self.invested_amount -= cost_basis
+            self.realized_profit_loss += quantity * price - cost_basis
 
     def total_invested(self):
-        return sum(trade.trade_price * trade.quantity 
-                   for trade in self.trades.all() 
-                   if trade.trade_type.lower() == 'buy')
+        return self.invested_amount
     
-    def current_portfolio_value(self):
-        return self.total_value()
+    def current_portfolio_value(self, prices=None):
+        return self.total_value(prices)
 
-    def total_profit_loss(self):
-         return self.current_portfolio_value() - (float(self.balance) + self.total_invested())
+    def total_profit_loss(self, prices=None):
+         unrealized = self.current_portfolio_value(prices) - (float(self.balance) + self.total_invested())
+         return unrealized + self.realized_profit_loss
     
-    def gains_percentage(self):
+    def gains_percentage(self, prices=None):
         invested = self.total_invested()
         if invested == 0:
             return 0
-        return round((self.total_profit_loss() / invested) * 100, 2)
+        return round((self.total_profit_loss(prices) / invested) * 100, 2)
     
-    def total_value(self):
-        holdings = self.holdings.all()
-        holdings_value = sum(h.stock_price() * h.quantity for h in holdings)
+    def total_value(self, prices=None):
+        holdings = list(self.holdings.all())
+        if prices is None:
+            prices = get_stock_prices(h.symbol for h in holdings)
+        holdings_value = sum((prices.get(h.symbol) or 0) * h.quantity for h in holdings)
         return holdings_value + float(self.balance) 
     
     def __str__(self):
@@ -40,11 +59,18 @@ class Holding(models.Model):
     quantity = models.PositiveIntegerField()
     average_price = models.FloatField()
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["portfolio", "symbol"], name="unique_holding_portfolio_symbol"),
+        ]
+
     def stock_price(self):
         return get_stock_price(self.symbol)
 
-    def current_value(self):
-        return self.stock_price() * self.quantity
+    def current_value(self, price=None):
+        if price is None:
+            price = self.stock_price()
+        return price * self.quantity if price else 0
 
     def __str__(self):
         return f"{self.symbol} - {self.quantity} shares in {self.portfolio.name}"
@@ -58,7 +84,14 @@ class Trade(models.Model):
     trade_price = models.FloatField()
     price_floor = models.FloatField(null=True, blank=True)
     price_ceiling = models.FloatField(null=True, blank=True)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set once the floor or ceiling has been hit and the shares sold.
+    trigger_fired_at = models.DateTimeField(null=True, blank=True)
+    timestamp = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["portfolio", "timestamp", "id"], name="trade_portfolio_time_idx"),
+        ]
 
     def __str__(self):
         return f"{self.trade_type.upper()} {self.quantity} {self.symbol} at ${self.trade_price}"
@@ -67,6 +100,8 @@ class Stock(models.Model):
     symbol = models.CharField(max_length=10, unique=True)
     name = models.CharField(max_length=255)
     sector = models.CharField(max_length=100, null=True, blank=True)
+    bars_synced_from = models.DateField(null=True, blank=True)
+    bars_synced_to = models.DateField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.symbol} - {self.name}"
@@ -95,20 +130,39 @@ class MockOrder(models.Model):
     symbol = models.CharField(max_length=10)
     quantity = models.PositiveIntegerField()
     order_type = models.CharField(max_length=4, choices=[("buy", "Buy"), ("sell", "Sell")])
-    price_at_execution = models.FloatField()
-    status = models.CharField(max_length=20, choices=[("pending", "Pending"), ("completed", "Completed"), ("failed", "Failed")], default="pending")
+    price_floor = models.FloatField(null=True, blank=True)
+    price_ceiling = models.FloatField(null=True, blank=True)
+    # Filled in when the order settles.
+    price_at_execution = models.FloatField(null=True, blank=True)
+    status = models.CharField(max_length=20, choices=[("pending", "Pending"), ("processing", "Processing"), ("completed", "Completed"), ("failed", "Failed")], default="pending")
+    error = models.CharField(max_length=255, blank=True)
+    claimed_by = models.CharField(max_length=100, blank=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "id"], name="mockorder_status_idx"),
+        ]
+
     def __str__(self):
-        return f"{self.user.username} {self.order_type.upper()} {self.symbol} x{self.quantity} at ${self.price_at_execution}"
+        order = f"{self.user.username} {self.order_type.upper()} {self.symbol} x{self.quantity}"
+        if self.price_at_execution is None:
+            return f"{order} ({self.status})"
+        return f"{order} at ${self.price_at_execution}"
 
 
 
 class PortfolioPerformance(models.Model):
     portfolio = models.ForeignKey(Portfolio, on_delete=models.CASCADE, related_name="performance")
-    date = models.DateField(auto_now_add=True)
+    date = models.DateField(default=timezone.localdate)
     total_value = models.FloatField()
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["portfolio", "date"], name="unique_portfolio_performance_date"),
+        ]
+
     def __str__(self):
         return f"{self.portfolio.name} Performance on {self.date}"
 
@@ -118,6 +172,12 @@ class StockAlert(models.Model):
     symbol = models.CharField(max_length=10)
     target_price = models.FloatField()
     is_active = models.BooleanField(default=True)
+    triggered_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["symbol", "is_active"], name="stockalert_symbol_active_idx"),
+        ]
 
     def __str__(self):
         return f"Alert for {self.symbol} at ${self.target_price}"
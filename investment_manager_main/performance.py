@@ -0,0 +1,138 @@
+"""
+Daily portfolio performance snapshots.
+
+Each run values every portfolio with one batched quote lookup and upserts one
+PortfolioPerformance row per (portfolio, date). Days that were missed are
+backfilled from stored closing prices by unwinding each portfolio's trades
+from its current holdings and balance, so no live quotes are needed for them.
+"""
+
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .analytics import close_matrix
+from .bar_store import MARKET_TZ, market_today, sync_daily_bars_many
+from .models import PortfolioPerformance, Trade
+from .valuation import value_portfolios
+
+BATCH_SIZE = 500
+# Extra days loaded before a backfill window so its first day has a close to carry forward.
+LOOKBACK_DAYS = 7
+
+
+def save_snapshots(rows: List[PortfolioPerformance]) -> int:
+    """Upsert snapshot rows, replacing the value of any existing (portfolio, date) row."""
+    PortfolioPerformance.objects.bulk_create(
+        rows,
+        batch_size=BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=["portfolio", "date"],
+        update_fields=["total_value"],
+    )
+    return len(rows)
+
+
+def snapshot_portfolios(portfolios, on: Optional[date] = None) -> int:
+    """
+    Record the current value of each portfolio.
+
+    Args:
+        portfolios: A Portfolio queryset.
+        on (Optional[date]): Snapshot date, defaulting to today's market date.
+
+    Returns:
+        int: Number of rows written.
+    """
+    on = on or market_today()
+    valuation = value_portfolios(portfolios)
+    return save_snapshots([
+        PortfolioPerformance(portfolio=v.portfolio, date=on, total_value=v.total_value)
+        for v in valuation.portfolios
+    ])
+
+
+def backfill_portfolios(portfolios, days: int = 30, sync: bool = True) -> int:
+    """
+    Fill in missing snapshots for the trading days in the `days` calendar days before today.
+
+    Trading days are the dates that have stored closes. A portfolio's value
+    on a past day is its balance and holdings at that day's close, found by
+    undoing every later trade, priced at the stored closes. Days before the
+    portfolio was created and days that already have a snapshot are skipped.
+
+    Returns:
+        int: Number of rows written.
+    """
+    portfolios = list(portfolios.prefetch_related("holdings"))
+    end = market_today() - timedelta(days=1)
+    start = end - timedelta(days=days - 1)
+    if not portfolios or days <= 0:
+        return 0
+
+    # Only trades made after the window opened are ever undone.
+    window_opens = MARKET_TZ.localize(datetime.combine(start, time.min))
+    trades: Dict[int, list] = defaultdict(list)
+    rows = (
+        Trade.objects.filter(portfolio__in=portfolios, timestamp__gte=window_opens)
+        .order_by("-timestamp", "-id")
+        .values_list("portfolio_id", "timestamp", "symbol", "trade_type", "quantity", "trade_price")
+    )
+    for portfolio_id, timestamp, symbol, trade_type, quantity, price in rows.iterator(chunk_size=2000):
+        trades[portfolio_id].append((timestamp.astimezone(MARKET_TZ).date(), symbol, trade_type, quantity, price))
+
+    symbols = sorted(
+        {h.symbol for p in portfolios for h in p.holdings.all()}
+        | {t[1] for history in trades.values() for t in history}
+    )
+    if not symbols:
+        return 0
+
+    if sync:
+        sync_daily_bars_many(symbols, start - timedelta(days=LOOKBACK_DAYS), end)
+
+    matrix = close_matrix(symbols, start - timedelta(days=LOOKBACK_DAYS), end)
+    matrix = matrix[matrix.index >= start]
+    if matrix.empty:
+        return 0
+    closes = np.nan_to_num(matrix.to_numpy(dtype=float))
+    column = {symbol: i for i, symbol in enumerate(symbols)}
+
+    existing = set(
+        PortfolioPerformance.objects.filter(portfolio__in=portfolios, date__range=(start, end))
+        .values_list("portfolio_id", "date")
+    )
+
+    snapshots = []
+    for portfolio in portfolios:
+        created = portfolio.created_at.astimezone(MARKET_TZ).date()
+        shares = np.zeros(len(symbols))
+        for holding in portfolio.holdings.all():
+            shares[column[holding.symbol]] = holding.quantity
+        cash = float(portfolio.balance)
+
+        history, undone = trades[portfolio.id], 0
+        for day, prices in zip(reversed(matrix.index), closes[::-1]):
+            while undone < len(history) and history[undone][0] > day:
+                _, symbol, trade_type, quantity, price = history[undone]
+                sign = 1 if trade_type == "buy" else -1
+                shares[column[symbol]] -= sign * quantity
+                cash += sign * quantity * price
+                undone += 1
+            if day < created:
+                break
+            if (portfolio.id, day) not in existing:
+                snapshots.append(PortfolioPerformance(
+                    portfolio=portfolio, date=day, total_value=cash + float(shares @ prices),
+                ))
+
+    return save_snapshots(snapshots)
+
+
+def performance_series(portfolio) -> Dict[str, list]:
+    """Stored snapshots for a portfolio, oldest first, as parallel date and value lists."""
+    rows = portfolio.performance.order_by("date").values_list("date", "total_value")
+    dates, values = zip(*rows) if rows else ((), ())
+    return {"dates": [d.isoformat() for d in dates], "values": list(values)}
@@ -0,0 +1,111 @@
+"""
+Real-time price feed.
+
+Streams trades from Alpaca's websocket for every symbol held in a portfolio or
+watched by an active alert, and writes them to the price book that
+get_stock_price reads before going to the REST API.
+"""
+
+import threading
+import time
+from typing import Dict, Sequence, Set, Tuple
+
+from django.db import close_old_connections
+
+from .alpaca_api import API_KEY, SECRET_KEY, PriceBook, price_book
+from .models import Holding, StockAlert
+
+
+def watched_symbols() -> Set[str]:
+    """Symbols held in any portfolio or targeted by an active alert."""
+    held = Holding.objects.values_list("symbol", flat=True).distinct()
+    alerted = StockAlert.objects.filter(is_active=True).values_list("symbol", flat=True).distinct()
+    return {symbol.upper() for symbol in held} | {symbol.upper() for symbol in alerted}
+
+
+class PriceFeed:
+    """
+    Keeps the price book current from a trade stream.
+
+    Trades are buffered and written to the book every ``flush_interval``
+    seconds, so a shared cache sees one write per symbol per flush rather than
+    one per trade. Subscriptions follow holdings and alerts, re-checked every
+    ``refresh_interval`` seconds.
+
+    Every trade is also passed to the given engines (a TriggerEngine, an
+    AlertEvaluator, ...), which act on whatever fired on each flush and
+    reload with each subscription refresh.
+    """
+
+    def __init__(self, stream=None, book: PriceBook = price_book,
+                 flush_interval: float = 1.0, refresh_interval: float = 60.0,
+                 engines: Sequence = ()):
+        if stream is None:
+            from alpaca_trade_api.stream import Stream
+
+            stream = Stream(API_KEY, SECRET_KEY, data_feed="iex")
+        self.stream = stream
+        self.book = book
+        self.flush_interval = flush_interval
+        self.refresh_interval = refresh_interval
+        self.engines = list(engines)
+        self.symbols: Set[str] = set()
+        self._pending: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    async def on_trade(self, trade) -> None:
+        timestamp = getattr(trade, "timestamp", None)
+        traded_at = timestamp.timestamp() if timestamp is not None else time.time()
+        with self._lock:
+            self._pending[trade.symbol] = (float(trade.price), traded_at)
+        for engine in self.engines:
+            engine.check(trade.symbol, float(trade.price))
+
+    def flush(self) -> int:
+        """Write buffered trades to the book and return how many symbols were updated."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if pending:
+            self.book.update_many(pending)
+        for engine in self.engines:
+            engine.fire_pending()
+        return len(pending)
+
+    def sync_subscriptions(self) -> None:
+        for engine in self.engines:
+            engine.load()
+        wanted = watched_symbols()
+        added, removed = wanted - self.symbols, self.symbols - wanted
+        if added:
+            self.stream.subscribe_trades(self.on_trade, *sorted(added))
+        if removed:
+            self.stream.unsubscribe_trades(*sorted(removed))
+        self.symbols = wanted
+
+    def run(self) -> None:
+        """
+        Stream until interrupted. Flushing and resubscribing run on a background thread.
+
+        Call sync_subscriptions() first; until then the feed is subscribed to nothing.
+        """
+        worker = threading.Thread(target=self._maintain, name="price-feed-maintenance", daemon=True)
+        worker.start()
+        try:
+            self.stream.run()
+        finally:
+            self._stopped.set()
+            worker.join()
+            self.flush()
+
+    def _maintain(self) -> None:
+        next_refresh = time.monotonic() + self.refresh_interval
+        while not self._stopped.wait(self.flush_interval):
+            self.flush()
+            if time.monotonic() >= next_refresh:
+                close_old_connections()
+                try:
+                    self.sync_subscriptions()
+                except Exception as e:
+                    print(f"Error refreshing price feed subscriptions: {e}")
+                next_refresh = time.monotonic() + self.refresh_interval
@@ -0,0 +1,71 @@
+"""
+Price sources for the trigger engine and the alert evaluator.
+
+A price source is any iterable of {symbol: price} batches. drive() feeds each
+batch to a set of engines, objects with load(), check(symbol, price) and
+fire_pending() such as TriggerEngine and AlertEvaluator. Streamed prices go
+through PriceFeed instead, which calls the same methods.
+"""
+
+import time
+from typing import Callable, Dict, Iterable, Iterator, Sequence
+
+from django.db import close_old_connections
+
+from .alpaca_api import get_stock_prices
+
+
+class PollingPriceSource:
+    """Polls quotes for a changing set of symbols every `interval` seconds."""
+
+    def __init__(self, symbols: Callable[[], Iterable[str]], interval: float = 15.0,
+                 fetch: Callable = get_stock_prices):
+        self.symbols = symbols
+        self.interval = interval
+        self.fetch = fetch
+
+    def __iter__(self) -> Iterator[Dict[str, float]]:
+        while True:
+            symbols = sorted(self.symbols())
+            if symbols:
+                yield {symbol: price for symbol, price in self.fetch(symbols).items() if price is not None}
+            time.sleep(self.interval)
+
+
+class FakePriceSource:
+    """Replays fixed batches of prices, for tests and local runs without market data."""
+
+    def __init__(self, batches: Iterable[Dict[str, float]]):
+        self.batches = list(batches)
+
+    def __iter__(self) -> Iterator[Dict[str, float]]:
+        return iter(self.batches)
+
+
+def drive(source: Iterable[Dict[str, float]], engines: Sequence, refresh_interval: float = 60.0) -> int:
+    """
+    Check every price from source against the engines until it is exhausted.
+
+    Fired items are acted on after each batch, and the engines reload from the
+    database every `refresh_interval` seconds.
+
+    Returns:
+        int: Total number of triggers or alerts fired.
+    """
+    for engine in engines:
+        engine.load()
+    next_refresh = time.monotonic() + refresh_interval
+
+    fired = 0
+    for batch in source:
+        for symbol, price in batch.items():
+            for engine in engines:
+                engine.check(symbol, price)
+        for engine in engines:
+            fired += engine.fire_pending()
+        if time.monotonic() >= next_refresh:
+            close_old_connections()
+            for engine in engines:
+                engine.load()
+            next_refresh = time.monotonic() + refresh_interval
+    return fired
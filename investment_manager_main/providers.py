@@ -0,0 +1,266 @@
+"""
+Market-data providers.
+
+Everything alpaca_api serves (latest trades, bars and the asset list) comes
+from a provider. AlpacaProvider, defined in alpaca_api, talks to Alpaca.
+ReplayProvider serves quotes and bars recorded to local files, with optional
+simulated latency, so the whole app can be load tested and benchmarked
+offline and deterministically.
+
+The provider is picked on first use from MARKET_DATA_PROVIDER ("alpaca" or
+"replay"; replay reads MARKET_DATA_REPLAY_DIR), or set with set_provider().
+"""
+
+from __future__ import annotations
+
+import abc
+import asyncio
+import csv
+import os
+import random
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+MARKET_DATA_PROVIDER = os.getenv("MARKET_DATA_PROVIDER", "alpaca")
+MARKET_DATA_REPLAY_DIR = os.getenv("MARKET_DATA_REPLAY_DIR", "market_data")
+MARKET_DATA_REPLAY_LATENCY = float(os.getenv("MARKET_DATA_REPLAY_LATENCY", "0"))
+MARKET_DATA_REPLAY_JITTER = float(os.getenv("MARKET_DATA_REPLAY_JITTER", "0"))
+
+BAR_FIELDS = ["open", "high", "low", "close", "volume", "trade_count", "vwap"]
+ASSET_FIELDS = ["symbol", "name", "exchange", "tradable"]
+
+
+class Asset(NamedTuple):
+    symbol: str
+    name: str
+    exchange: str
+    tradable: bool
+
+
+class MarketDataProvider(abc.ABC):
+    """
+    Source of market data. Subclasses implement latest_trades, bars and assets.
+
+    latest_trade returns None for a symbol the provider does not know and
+    raises on any other failure; latest_trades maps unknown symbols to None.
+    bars returns a DataFrame indexed by UTC timestamp with BAR_FIELDS columns,
+    empty when there are no bars in the range.
+
+    The async methods run the sync ones on a worker thread unless a provider
+    has a native async client.
+
+    Calls to a provider with ``rate_limited`` set take a slot from the
+    upstream rate limiter first (see alpaca_api).
+    """
+
+    rate_limited = False
+
+    def latest_trade(self, symbol: str) -> Optional[float]:
+        return self.latest_trades([symbol]).get(symbol)
+
+    @abc.abstractmethod
+    def latest_trades(self, symbols: List[str]) -> Dict[str, Optional[float]]:
+        ...
+
+    @abc.abstractmethod
+    def bars(self, symbol: str, start: datetime, end: datetime, timeframe: str = "1Day") -> pd.DataFrame:
+        ...
+
+    @abc.abstractmethod
+    def assets(self) -> List[Asset]:
+        ...
+
+    async def alatest_trades(self, symbols: List[str]) -> Dict[str, Optional[float]]:
+        return await sync_to_async(self.latest_trades, thread_sensitive=False)(symbols)
+
+    async def abars(self, symbol: str, start: datetime, end: datetime, timeframe: str = "1Day") -> pd.DataFrame:
+        return await sync_to_async(self.bars, thread_sensitive=False)(symbol, start, end, timeframe)
+
+
+class ReplayProvider(MarketDataProvider):
+    """
+    Serves market data recorded by record_market_data from a directory:
+
+        quotes.csv                     symbol,price rows, replayed in order
+        assets.csv                     symbol,name,exchange,tradable
+        bars/<timeframe>/<SYMBOL>.csv  timestamp plus BAR_FIELDS
+
+    A symbol with several quote rows returns the next one on each request and
+    wraps around at the end, so a price series plays back in the same order
+    on every run. Each request waits ``latency`` seconds plus up to ``jitter``
+    more, drawn from a generator seeded with ``seed``.
+    """
+
+    def __init__(self, directory, latency: float = 0.0, jitter: float = 0.0, seed: Optional[int] = 0):
+        self.directory = Path(directory)
+        self.latency = latency
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._quotes: Dict[str, List[float]] = {}
+        self._positions: Dict[str, int] = {}
+        self._bars: Dict[Tuple[str, str], pd.DataFrame] = {}
+        self._lock = threading.Lock()
+        self._load_quotes()
+
+    def _load_quotes(self) -> None:
+        path = self.directory / "quotes.csv"
+        if not path.exists():
+            return
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                self._quotes.setdefault(row["symbol"].strip().upper(), []).append(float(row["price"]))
+
+    def _delay(self) -> float:
+        with self._lock:
+            return self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+
+    def _next_prices(self, symbols: List[str]) -> Dict[str, Optional[float]]:
+        prices = {}
+        with self._lock:
+            for symbol in symbols:
+                series = self._quotes.get(symbol)
+                if not series:
+                    prices[symbol] = None
+                    continue
+                position = self._positions.get(symbol, 0)
+                prices[symbol] = series[position % len(series)]
+                self._positions[symbol] = position + 1
+        return prices
+
+    def _read_bars(self, symbol: str, timeframe: str) -> pd.DataFrame:
+        import pandas as pd
+
+        key = (symbol, timeframe)
+        bars = self._bars.get(key)
+        if bars is None:
+            path = self.directory / "bars" / timeframe / f"{symbol}.csv"
+            if path.exists():
+                bars = pd.read_csv(path, index_col="timestamp")
+                bars.index = pd.DatetimeIndex(pd.to_datetime(bars.index, utc=True), name="timestamp")
+            else:
+                bars = pd.DataFrame(columns=BAR_FIELDS, index=pd.DatetimeIndex([], tz="UTC", name="timestamp"))
+            self._bars[key] = bars = bars.sort_index()
+        return bars
+
+    def _slice_bars(self, symbol: str, start: datetime, end: datetime, timeframe: str) -> pd.DataFrame:
+        import pandas as pd
+
+        bars = self._read_bars(symbol.upper(), timeframe)
+        return bars[(bars.index >= pd.Timestamp(start)) & (bars.index <= pd.Timestamp(end))].copy()
+
+    def latest_trades(self, symbols: List[str]) -> Dict[str, Optional[float]]:
+        time.sleep(self._delay())
+        return self._next_prices(symbols)
+
+    def bars(self, symbol: str, start: datetime, end: datetime, timeframe: str = "1Day") -> pd.DataFrame:
+        time.sleep(self._delay())
+        return self._slice_bars(symbol, start, end, timeframe)
+
+    def assets(self) -> List[Asset]:
+        time.sleep(self._delay())
+        path = self.directory / "assets.csv"
+        if not path.exists():
+            return [Asset(symbol, symbol, "", True) for symbol in sorted(self._quotes)]
+        with open(path, newline="") as f:
+            return [
+                Asset(row["symbol"], row["name"], row["exchange"], row["tradable"].lower() == "true")
+                for row in csv.DictReader(f)
+            ]
+
+    async def alatest_trades(self, symbols: List[str]) -> Dict[str, Optional[float]]:
+        await asyncio.sleep(self._delay())
+        return self._next_prices(symbols)
+
+    async def abars(self, symbol: str, start: datetime, end: datetime, timeframe: str = "1Day") -> pd.DataFrame:
+        await asyncio.sleep(self._delay())
+        return self._slice_bars(symbol, start, end, timeframe)
+
+
+def record_market_data(provider: MarketDataProvider, directory, symbols: Iterable[str],
+                       start: datetime, end: datetime, timeframes: Iterable[str] = ("1Day",),
+                       quotes: int = 1, interval: float = 0.0) -> Dict[str, int]:
+    """
+    Record data from provider into a directory ReplayProvider can serve.
+
+    Latest trades for all symbols are sampled `quotes` times, `interval`
+    seconds apart; bars are saved for every symbol and timeframe in
+    [start, end], along with the provider's asset list.
+
+    Returns:
+        Dict[str, int]: Number of quote rows, bar rows and assets written.
+    """
+    directory = Path(directory)
+    symbols = sorted({symbol.strip().upper() for symbol in symbols if symbol.strip()})
+    directory.mkdir(parents=True, exist_ok=True)
+    counts = {"quotes": 0, "bars": 0, "assets": 0}
+
+    with open(directory / "quotes.csv", "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["symbol", "price"])
+        for sample in range(quotes):
+            if sample:
+                time.sleep(interval)
+            for symbol, price in sorted(provider.latest_trades(symbols).items()):
+                if price is not None:
+                    writer.writerow([symbol, price])
+                    counts["quotes"] += 1
+
+    for timeframe in timeframes:
+        (directory / "bars" / timeframe).mkdir(parents=True, exist_ok=True)
+        for symbol in symbols:
+            bars = provider.bars(symbol, start, end, timeframe)
+            bars.reindex(columns=BAR_FIELDS).to_csv(directory / "bars" / timeframe / f"{symbol}.csv",
+                                                     index_label="timestamp")
+            counts["bars"] += len(bars)
+
+    with open(directory / "assets.csv", "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(ASSET_FIELDS)
+        for asset in provider.assets():
+            writer.writerow(asset)
+            counts["assets"] += 1
+    return counts
+
+
+_provider: Optional[MarketDataProvider] = None
+_provider_lock = threading.Lock()
+
+
+def _configured_provider() -> MarketDataProvider:
+    if MARKET_DATA_PROVIDER == "replay":
+        return ReplayProvider(MARKET_DATA_REPLAY_DIR, latency=MARKET_DATA_REPLAY_LATENCY,
+                              jitter=MARKET_DATA_REPLAY_JITTER)
+    if MARKET_DATA_PROVIDER == "alpaca":
+        from .alpaca_api import AlpacaProvider
+
+        return AlpacaProvider()
+    raise ValueError(f"Unknown MARKET_DATA_PROVIDER {MARKET_DATA_PROVIDER!r}; use 'alpaca' or 'replay'.")
+
+
+def get_provider() -> MarketDataProvider:
+    """Get the active provider, creating the configured one on first use."""
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                _provider = _configured_provider()
+    return _provider
+
+
+def set_provider(provider: Optional[MarketDataProvider]) -> Optional[MarketDataProvider]:
+    """
+    Make provider the active one and return the previous one. None goes back
+    to the configured provider on next use.
+    """
+    global _provider
+    with _provider_lock:
+        previous, _provider = _provider, provider
+    return previous
@@ -0,0 +1,365 @@
+"""
+Protection for upstream market-data calls.
+
+SingleFlight coalesces concurrent fetches of the same keys, so when a popular
+quote expires, one request fetches it and everyone else waiting on it shares
+the result. It works across threads and async tasks (and across event loops)
+because in-flight fetches are tracked with concurrent.futures.Future.
+
+CircuitBreaker fails fast once the upstream error rate spikes, instead of
+letting every request wait out the timeout; callers fall back to the last
+value they know.
+
+PriorityRateLimiter keeps calls under the upstream rate limit. When the
+bucket is empty, calls queue instead of failing, and interactive work is
+served before batch work.
+"""
+
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, Hashable, Iterable, Iterator, List, Optional, Tuple
+
+
+class SingleFlight:
+    """
+    Share in-flight fetches between concurrent callers.
+
+    A fetch receives the keys nobody else is fetching and returns a dict of
+    results; keys it leaves out failed. Callers that want keys another caller
+    is already fetching wait for that fetch, up to ``timeout`` seconds. Keys
+    whose shared fetch failed or timed out are left out of their result too.
+    """
+
+    def __init__(self, timeout: float = 15.0):
+        self.timeout = timeout
+        self._inflight: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def _claim(self, keys: Iterable[Hashable]) -> Tuple[List[Hashable], Dict[Hashable, Future]]:
+        mine, theirs = [], {}
+        with self._lock:
+            for key in keys:
+                future = self._inflight.get(key)
+                if future is None:
+                    self._inflight[key] = Future()
+                    mine.append(key)
+                else:
+                    theirs[key] = future
+        return mine, theirs
+
+    def _publish(self, keys: List[Hashable], result=None, error: BaseException = None) -> None:
+        with self._lock:
+            futures = [self._inflight.pop(key) for key in keys]
+        for future in futures:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._inflight)
+
+    def run(self, keys: Iterable[Hashable], fetch: Callable[[List[Hashable]], Dict]) -> Dict:
+        mine, theirs = self._claim(keys)
+        results = {}
+        if mine:
+            try:
+                fetched = fetch(mine)
+            except BaseException as e:
+                self._publish(mine, error=e)
+                raise
+            self._publish(mine, fetched)
+            results.update(fetched)
+        for key, future in theirs.items():
+            try:
+                shared = future.result(timeout=self.timeout)
+            except Exception:
+                continue
+            if key in shared:
+                results[key] = shared[key]
+        return results
+
+    async def arun(self, keys: Iterable[Hashable], afetch: Callable[[List[Hashable]], Awaitable[Dict]]) -> Dict:
+        """Async version of run; waits for other callers' fetches without blocking the event loop."""
+        mine, theirs = self._claim(keys)
+        results = {}
+        if mine:
+            try:
+                fetched = await afetch(mine)
+            except BaseException as e:
+                self._publish(mine, error=e)
+                raise
+            self._publish(mine, fetched)
+            results.update(fetched)
+        for key, future in theirs.items():
+            try:
+                shared = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), self.timeout)
+            except Exception:
+                continue
+            if key in shared:
+                results[key] = shared[key]
+        return results
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling upstream while a circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Stops calling upstream while it is failing.
+
+    Outcomes of the calls made in the last ``window`` seconds are kept. Once
+    at least ``min_calls`` were made and ``failure_ratio`` of them failed, the
+    breaker opens: calls raise CircuitOpenError straight away for
+    ``reset_timeout`` seconds. After that one trial call is let through
+    (half-open). If it succeeds the breaker closes, otherwise it opens again.
+
+    allow() hands each admitted call a ticket that it passes back to
+    record(). Calls admitted while closed share the ticket of that closed
+    period; the trial gets its own. Outcomes carrying any other ticket, such
+    as a slow call admitted before the breaker opened, are ignored.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_ratio: float = 0.5, min_calls: int = 5, window: float = 30.0,
+                 reset_timeout: float = 30.0, clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.failure_ratio = failure_ratio
+        self.min_calls = min_calls
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self._outcomes: "deque[Tuple[float, bool]]" = deque()
+        self._opened_at = None
+        self._tickets = itertools.count(1)
+        self._closed_ticket = next(self._tickets)
+        self._trial: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return self.CLOSED
+            if self._trial is not None or self.clock() - self._opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self.OPEN
+
+    def allow(self) -> Optional[int]:
+        """
+        Admit a call, returning its ticket for record(), or None if the call may not go upstream now.
+        In half-open state only the first caller gets through.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return self._closed_ticket
+            if self._trial is not None or self.clock() - self._opened_at < self.reset_timeout:
+                return None
+            self._trial = next(self._tickets)
+            return self._trial
+
+    def record(self, ok: bool, ticket: int) -> None:
+        with self._lock:
+            now = self.clock()
+            if self._opened_at is not None:
+                # Only the half-open trial reports back while the breaker is open.
+                if ticket != self._trial:
+                    return
+                self._trial = None
+                if ok:
+                    self._opened_at = None
+                    self._outcomes.clear()
+                    self._closed_ticket = next(self._tickets)
+                else:
+                    self._opened_at = now
+                return
+
+            if ticket != self._closed_ticket:
+                # Admitted before the breaker last opened.
+                return
+            self._outcomes.append((now, ok))
+            while self._outcomes and self._outcomes[0][0] < now - self.window:
+                self._outcomes.popleft()
+            failures = sum(1 for _, succeeded in self._outcomes if not succeeded)
+            if len(self._outcomes) >= self.min_calls and failures >= self.failure_ratio * len(self._outcomes):
+                self._opened_at = now
+                self._outcomes.clear()
+
+    def release(self, ticket: int) -> None:
+        """Give back an admitted call without an outcome, letting another half-open trial through."""
+        with self._lock:
+            if ticket == self._trial:
+                self._trial = None
+
+    @contextmanager
+    def guard(self, ignore: Tuple[type, ...] = ()) -> Iterator[None]:
+        """
+        Run the enclosed call if allowed, recording whether it raised.
+        Exceptions in ``ignore`` say nothing about upstream and are not recorded.
+        """
+        ticket = self.allow()
+        if ticket is None:
+            raise CircuitOpenError(f"{self.name} circuit is open; not calling upstream.")
+        try:
+            yield
+        except ignore:
+            self.release(ticket)
+            raise
+        except BaseException:
+            self.record(False, ticket)
+            raise
+        self.record(True, ticket)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._outcomes.clear()
+            self._opened_at = None
+            self._closed_ticket = next(self._tickets)
+            self._trial = None
+
+
+INTERACTIVE = 0
+BATCH = 10
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BATCH: "batch"}
+
+
+class RateLimitTimeout(Exception):
+    """Raised when a call has queued for a token longer than the limiter's max_wait."""
+
+
+class PriorityRateLimiter:
+    """
+    Token bucket shared by every upstream call, handing out tokens by priority.
+
+    The bucket holds up to ``burst`` tokens and refills at ``rate`` tokens per
+    second; each call takes one. When the bucket is empty, calls queue instead
+    of failing. Queued calls are served lowest priority first, then in arrival
+    order, so interactive requests overtake batch work that is already
+    waiting. Sync callers block on a condition variable; async callers sleep
+    on their own event loop, so both share one queue. A call that waits
+    longer than ``max_wait`` seconds raises RateLimitTimeout. A rate of 0
+    turns limiting off.
+    """
+
+    poll_interval = 0.05
+
+    def __init__(self, rate: float, burst: float = 1, max_wait: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_wait = max_wait
+        self.clock = clock
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._waiting: List[Tuple[int, int]] = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+    def depths(self) -> Dict[int, int]:
+        """Number of queued calls by priority."""
+        with self._condition:
+            depths = dict.fromkeys(PRIORITY_NAMES, 0)
+            for priority, _ in self._waiting:
+                depths[priority] = depths.get(priority, 0) + 1
+            return depths
+
+    def configure(self, rate: float, burst: float) -> None:
+        """Change the rate and bucket size; calls already queued keep their place."""
+        with self._condition:
+            self.rate = rate
+            self.burst = burst
+            self._tokens = min(self._tokens, float(burst))
+            self._condition.notify_all()
+
+    def drain(self) -> None:
+        """Empty the bucket, e.g. after upstream answered 429, so calls queue until it refills."""
+        with self._condition:
+            self._tokens = 0.0
+            self._updated = self.clock()
+
+    def reset(self) -> None:
+        """Refill the bucket. Calls already queued keep their place."""
+        with self._condition:
+            self._tokens = float(self.burst)
+            self._updated = self.clock()
+            self._condition.notify_all()
+
+    def _enqueue(self, priority: int) -> Tuple[int, int]:
+        ticket = (priority, next(self._sequence))
+        heapq.heappush(self._waiting, ticket)
+        return ticket
+
+    def _cancel(self, ticket: Tuple[int, int]) -> None:
+        if ticket in self._waiting:
+            self._waiting.remove(ticket)
+            heapq.heapify(self._waiting)
+            self._condition.notify_all()
+
+    def _try_take(self, ticket: Tuple[int, int]) -> Optional[float]:
+        """Take a token if ticket is first in line and one is available; otherwise return seconds to wait."""
+        now = self.clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._waiting[0] != ticket:
+            return 1 / self.rate
+        if self._tokens < 1:
+            return (1 - self._tokens) / self.rate
+        heapq.heappop(self._waiting)
+        self._tokens -= 1
+        self._condition.notify_all()
+        return None
+
+    def _remaining(self, started: float, delay: float) -> float:
+        if self.max_wait is None:
+            return delay
+        remaining = started + self.max_wait - self.clock()
+        if remaining <= 0:
+            raise RateLimitTimeout(f"Waited more than {self.max_wait}s for an upstream request slot.")
+        return min(delay, remaining)
+
+    def acquire(self, priority: int = INTERACTIVE) -> float:
+        """Wait for a token. Returns the seconds spent waiting."""
+        if self.rate <= 0:
+            return 0.0
+        started = self.clock()
+        with self._condition:
+            ticket = self._enqueue(priority)
+            try:
+                while True:
+                    delay = self._try_take(ticket)
+                    if delay is None:
+                        return self.clock() - started
+                    self._condition.wait(self._remaining(started, delay))
+            except BaseException:
+                self._cancel(ticket)
+                raise
+
+    async def aacquire(self, priority: int = INTERACTIVE) -> float:
+        """Async version of acquire."""
+        if self.rate <= 0:
+            return 0.0
+        started = self.clock()
+        with self._condition:
+            ticket = self._enqueue(priority)
+        try:
+            while True:
+                with self._condition:
+                    delay = self._try_take(ticket)
+                if delay is None:
+                    return self.clock() - started
+                await asyncio.sleep(min(self._remaining(started, delay), self.poll_interval))
+        except BaseException:
+            with self._condition:
+                self._cancel(ticket)
+            raise
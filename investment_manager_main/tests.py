@@ -1,23 +1,75 @@
+import asyncio
+import calendar
+import json
 import os
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'investment_management_app.settings')
-from django.test import TestCase, Client
-from django.urls import reverse, resolve
-from django.contrib.auth.models import User
-from unittest.mock import patch, MagicMock
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
 from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch, MagicMock, AsyncMock
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'investment_management_app.settings')
+
+import numpy as np
 import pandas as pd
 import pytz
-from datetime import datetime, timedelta
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connection
+from django.test import TestCase, TransactionTestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse, resolve
 
 from .models import (
     Portfolio, Holding, Trade, ContactMessage,
     MockOrder, Stock, StockPrice, PortfolioPerformance, StockAlert
 )
 from .views import *
-from .alpaca_api import get_stock_price, get_historical_data
+from . import alpaca_api, bar_store, metrics
+from .alerts import AlertEvaluator
+from .alpaca_api import (
+    PriceBook, Quote, QuoteCache, afetch_bars, aget_stock_prices, get_historical_data, get_stock_price,
+    get_stock_prices, price_book, quote_cache,
+)
+from .analytics import compute_metrics, portfolio_analytics
+from .bar_store import get_daily_bars, market_today
+from .benchmarks import SyntheticProvider, run_benchmarks
+from .charts import columnar_series, lttb
+from .imports import import_trades
+from .intraday import aget_intraday_bars, chunk_cache, chunks, get_intraday_bars, last_session
+from .performance import backfill_portfolios
+from .price_feed import PriceFeed
+from .price_sources import FakePriceSource, drive
+from .providers import MarketDataProvider, ReplayProvider, record_market_data, set_provider
+from .resilience import (
+    BATCH, INTERACTIVE, CircuitBreaker, CircuitOpenError, PriorityRateLimiter, RateLimitTimeout, SingleFlight,
+)
+from .trading import execute_trade, claim_orders, settle_orders
+from .triggers import Trigger, TriggerEngine
+from .valuation import value_user_portfolios
 
 # tests
 
+def make_quotes(prices):
+    as_of = datetime.now(pytz.UTC)
+    return {symbol: Quote(price, as_of - timedelta(seconds=i)) for i, (symbol, price) in enumerate(prices.items())}
+
+
+def reset_upstream():
+    """Forget cached quotes, breaker state and rate-limit budgets left behind by earlier tests."""
+    quote_cache.clear()
+    alpaca_api.quote_breaker.reset()
+    alpaca_api.bar_breaker.reset()
+    alpaca_api.set_default_priority(INTERACTIVE)
+    alpaca_api.upstream_limiter.configure(alpaca_api.RATE_LIMIT / 60, alpaca_api.RATE_BURST)
+    alpaca_api.upstream_limiter.reset()
+    bar_store._today_fetched.clear()
+
 class PortfolioMethodTests(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(username='testuser', password='testpass')
@@ -78,6 +130,12 @@ class MockOrderModelTests(TestCase):
         )
         self.assertEqual(str(order), "orderuser BUY TSLA x5 at $700.0")
 
+    def test_unsettled_order_shows_its_status(self):
+        user = User.objects.create_user(username='orderuser', password='orderpass')
+        portfolio = Portfolio.objects.create(user=user, balance=5000.00)
+        order = MockOrder.objects.create(user=user, portfolio=portfolio, symbol='TSLA', quantity=5, order_type='sell')
+        self.assertEqual(str(order), "orderuser SELL TSLA x5 (pending)")
+
 class AuthViewTests(TestCase):
     def test_registration_success(self):
         response = self.client.post(reverse('register'), {
@@ -124,6 +182,161 @@ class PortfolioViewTests(TestCase):
         self.assertEqual(Portfolio.objects.count(), 0)
         self.assertRedirects(response, reverse('dashboard'))
 
+    @patch('investment_manager_main.valuation.aget_stock_quotes', new_callable=AsyncMock)
+    def test_portfolio_details_prices_holdings_in_one_call(self, mock_quotes):
+        mock_quotes.return_value = make_quotes({'AAPL': 160.00, 'MSFT': 210.00})
+        Holding.objects.create(portfolio=self.portfolio, symbol='AAPL', quantity=10, average_price=150.00)
+        Holding.objects.create(portfolio=self.portfolio, symbol='MSFT', quantity=5, average_price=200.00)
+
+        response = self.client.get(reverse('portfolio_details', args=[self.portfolio.id]))
+        self.assertEqual(response.status_code, 200)
+        mock_quotes.assert_called_once()
+        self.assertEqual(response.context['total_profit_loss'], 10*160 + 5*210)
+
+    @patch('investment_manager_main.valuation.get_stock_quotes')
+    def test_dashboard_prices_all_portfolios_in_one_call(self, mock_quotes):
+        mock_quotes.return_value = make_quotes({'AAPL': 160.00})
+        other = Portfolio.objects.create(user=self.user, name="Other", balance=500.00)
+        Holding.objects.create(portfolio=self.portfolio, symbol='AAPL', quantity=10, average_price=150.00)
+        Holding.objects.create(portfolio=other, symbol='AAPL', quantity=1, average_price=150.00)
+
+        response = self.client.get(reverse('dashboard'))
+        mock_quotes.assert_called_once()
+        self.assertEqual(response.context['total_value'], 1000 + 1600 + 500 + 160)
+
+    def test_trade_history_is_keyset_paginated(self):
+        same_time = datetime(2024, 1, 2, 15, 0, tzinfo=pytz.UTC)
+        for i in range(5):
+            trade = Trade.objects.create(portfolio=self.portfolio, symbol=f'S{i}', quantity=1,
+                                         trade_type='buy', trade_price=1.0)
+            Trade.objects.filter(pk=trade.pk).update(timestamp=same_time if i < 3 else same_time + timedelta(days=i))
+
+        seen, cursor = [], None
+        while True:
+            page, cursor = load_trade_history(self.portfolio.id, self.user, cursor, page_size=2)
+            seen.extend(t.symbol for t in page)
+            if cursor is None:
+                break
+        self.assertEqual(seen, ['S4', 'S3', 'S2', 'S1', 'S0'])
+
+    @patch('investment_manager_main.valuation.aget_stock_quotes', new_callable=AsyncMock)
+    def test_portfolio_details_links_to_older_trades(self, mock_quotes):
+        mock_quotes.return_value = {}
+        for i in range(TRADE_PAGE_SIZE + 1):
+            Trade.objects.create(portfolio=self.portfolio, symbol='AAPL', quantity=1, trade_type='buy', trade_price=1.0)
+
+        response = self.client.get(reverse('portfolio_details', args=[self.portfolio.id]))
+        self.assertEqual(len(response.context['trades']), TRADE_PAGE_SIZE)
+        self.assertIsNotNone(response.context['next_cursor'])
+
+        response = self.client.get(reverse('portfolio_details', args=[self.portfolio.id]),
+                                   {'cursor': response.context['next_cursor']})
+        self.assertEqual(len(response.context['trades']), 1)
+        self.assertIsNone(response.context['next_cursor'])
+
+    def test_trade_distribution_groups_by_symbol(self):
+        for symbol, quantity in [('AAPL', 3), ('MSFT', 2), ('AAPL', 4)]:
+            Trade.objects.create(portfolio=self.portfolio, symbol=symbol, quantity=quantity,
+                                 trade_type='buy', trade_price=1.0)
+
+        response = self.client.get(reverse('portfolio_trade_distribution', args=[self.portfolio.id]))
+        self.assertEqual(response.json(), {'symbols': ['AAPL', 'MSFT'], 'quantities': [7, 2]})
+
+class QueryBudgetTests(TestCase):
+    """
+    Query counts for the hot views, with several portfolios, holdings and
+    trades so that per-row queries would show up. Each view's budget includes
+    the session and user lookups.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user(username='budgetuser', password='budgetpass')
+        self.client.login(username='budgetuser', password='budgetpass')
+        self.portfolios = []
+        for i in range(3):
+            portfolio = Portfolio.objects.create(user=self.user, name=f"Portfolio {i}", balance=10000)
+            for symbol in ('AAPL', 'MSFT', 'GOOG'):
+                Holding.objects.create(portfolio=portfolio, symbol=symbol, quantity=5, average_price=100.0)
+                Trade.objects.create(portfolio=portfolio, symbol=symbol, quantity=5, trade_type='buy', trade_price=100.0)
+            self.portfolios.append(portfolio)
+        self.quotes = make_quotes({'AAPL': 110.0, 'MSFT': 120.0, 'GOOG': 130.0})
+
+    def test_dashboard(self):
+        with patch('investment_manager_main.valuation.get_stock_quotes', return_value=self.quotes):
+            with self.assertNumQueries(4):
+                self.client.get(reverse('dashboard'))
+
+    def test_portfolio_details(self):
+        with patch('investment_manager_main.valuation.aget_stock_quotes', new_callable=AsyncMock, return_value=self.quotes):
+            with self.assertNumQueries(5):
+                self.client.get(reverse('portfolio_details', args=[self.portfolios[0].id]))
+
+    def test_get_user_holding(self):
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('get_user_holding'), {'symbol': 'aapl'})
+        self.assertEqual(response.json()['quantity'], 5)
+
+    @patch('investment_manager_main.views.get_stock_price', return_value=100.0)
+    def test_mock_trade(self, mock_price):
+        url = reverse('mock_trade', args=[self.portfolios[0].id])
+        for trade_type, symbol, budget in [('buy', 'AAPL', 8), ('buy', 'TSLA', 11), ('sell', 'AAPL', 9)]:
+            with self.subTest(trade_type=trade_type, symbol=symbol), self.assertNumQueries(budget):
+                self.client.post(url, {'trade_type': trade_type, 'symbol': symbol, 'quantity': 1})
+
+    @patch('investment_manager_main.analytics.sync_daily_bars_many')
+    def test_analytics(self, mock_sync):
+        today = market_today()
+        for symbol in ('AAPL', 'MSFT', 'GOOG', 'SPY'):
+            stock = Stock.objects.create(symbol=symbol, name=symbol)
+            StockPrice.objects.bulk_create([
+                StockPrice(stock=stock, date=today - timedelta(days=n), open_price=100 + n, high_price=100 + n,
+                           low_price=100 + n, close_price=100 + n * (n % 3), volume=1000)
+                for n in range(1, 11)
+            ])
+        for url in (reverse('portfolio_analytics', args=[self.portfolios[0].id]),
+                    reverse('portfolio_analytics_data', args=[self.portfolios[0].id])):
+            with self.subTest(url=url), self.assertNumQueries(5):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_performance_data(self):
+        today = market_today()
+        PortfolioPerformance.objects.bulk_create([
+            PortfolioPerformance(portfolio=self.portfolios[0], date=today - timedelta(days=n), total_value=10000 + n)
+            for n in range(10)
+        ])
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('portfolio_performance_data', args=[self.portfolios[0].id]))
+        self.assertEqual(len(response.json()['values']), 10)
+
+    def test_exports(self):
+        PortfolioPerformance.objects.create(portfolio=self.portfolios[0], date=market_today(), total_value=10000)
+        for dataset in ('trades', 'holdings', 'performance'):
+            with self.subTest(dataset=dataset), self.assertNumQueries(4):
+                response = self.client.get(reverse('export_portfolio', args=[self.portfolios[0].id, dataset]))
+                b''.join(response.streaming_content)
+
+    def test_holding_is_unique_per_portfolio_and_symbol(self):
+        with self.assertRaises(IntegrityError):
+            Holding.objects.create(portfolio=self.portfolios[0], symbol='AAPL', quantity=1, average_price=1.0)
+
+class ValuationTests(TestCase):
+    @patch('investment_manager_main.valuation.get_stock_quotes')
+    def test_shared_symbols_are_priced_once(self, mock_quotes):
+        mock_quotes.return_value = make_quotes({'AAPL': 10.0, 'MSFT': 20.0})
+        user = User.objects.create_user(username='valueuser', password='valuepass')
+        first = Portfolio.objects.create(user=user, name="First", balance=100)
+        second = Portfolio.objects.create(user=user, name="Second", balance=0)
+        Holding.objects.create(portfolio=first, symbol='AAPL', quantity=1, average_price=5.0)
+        Holding.objects.create(portfolio=second, symbol='AAPL', quantity=2, average_price=5.0)
+        Holding.objects.create(portfolio=second, symbol='MSFT', quantity=3, average_price=5.0)
+
+        with self.assertNumQueries(2):
+            valuation = value_user_portfolios(user)
+        self.assertEqual(set(mock_quotes.call_args.args[0]), {'AAPL', 'MSFT'})
+        self.assertEqual(valuation.for_portfolio(first.id).total_value, 110.0)
+        self.assertEqual(valuation.for_portfolio(second.id).total_value, 80.0)
+        self.assertEqual(valuation.total_value, 190.0)
+        self.assertEqual(valuation.priced_at, min(q.as_of for q in mock_quotes.return_value.values()))
+
 class MockTradeTests(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(username='tradeuser', password='tradepass')
@@ -156,7 +369,286 @@ class MockTradeTests(TestCase):
         )
         self.assertContains(response, "You do not have enough shares")
 
+    @patch('investment_manager_main.views.get_stock_price')
+    def test_trades_update_portfolio_aggregates(self, mock_price):
+        url = reverse('mock_trade', args=[self.portfolio.id])
+        mock_price.return_value = 150.00
+        self.client.post(url, {'trade_type': 'buy', 'symbol': 'AAPL', 'quantity': '10'})
+        mock_price.return_value = 160.00
+        self.client.post(url, {'trade_type': 'sell', 'symbol': 'AAPL', 'quantity': '4'})
+
+        self.portfolio.refresh_from_db()
+        self.assertEqual(self.portfolio.trade_count, 2)
+        self.assertEqual(self.portfolio.realized_profit_loss, 40.00)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.portfolio.total_invested(), 900.00)
+
+@override_settings(MOCK_TRADE_QUEUE=True)
+class MockOrderQueueTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='queueuser', password='queuepass')
+        self.client.login(username='queueuser', password='queuepass')
+        self.portfolio = Portfolio.objects.create(user=self.user, balance=10000.00)
+
+    def place(self, trade_type, symbol, quantity, **limits):
+        return self.client.post(reverse('mock_trade', args=[self.portfolio.id]),
+                                {'trade_type': trade_type, 'symbol': symbol, 'quantity': quantity, **limits})
+
+    @patch('investment_manager_main.views.get_stock_price')
+    def test_trade_is_queued_without_pricing(self, mock_price):
+        response = self.place('buy', 'aapl', 10)
+        self.assertRedirects(response, reverse('portfolio_details', args=[self.portfolio.id]), fetch_redirect_response=False)
+        mock_price.assert_not_called()
+        order = MockOrder.objects.get()
+        self.assertEqual((order.symbol, order.status, order.price_at_execution), ('AAPL', 'pending', None))
+        self.portfolio.refresh_from_db()
+        self.assertEqual(self.portfolio.balance, Decimal('10000.00'))
+
+    @patch('investment_manager_main.trading.get_stock_prices')
+    def test_worker_settles_batch_with_one_quote_call(self, mock_prices):
+        mock_prices.return_value = {'AAPL': 100.0, 'MSFT': 200.0}
+        self.place('buy', 'AAPL', 10)
+        self.place('buy', 'MSFT', 5)
+        self.place('sell', 'AAPL', 4)
+        self.place('sell', 'MSFT', 50)
+        self.place('buy', 'AAPL', 1, price_floor='150')
+
+        call_command('process_mock_orders', '--once', stdout=StringIO())
+        mock_prices.assert_called_once()
+        self.assertEqual(set(mock_prices.call_args.args[0]), {'AAPL', 'MSFT'})
+
+        statuses = list(MockOrder.objects.order_by('id').values_list('status', flat=True))
+        self.assertEqual(statuses, ['completed', 'completed', 'completed', 'failed', 'failed'])
+        self.assertEqual(MockOrder.objects.get(status='failed', symbol='MSFT').error, "You do not have enough shares to sell.")
+        self.assertEqual(Holding.objects.get(symbol='AAPL').quantity, 6)
+        self.portfolio.refresh_from_db()
+        self.assertEqual(self.portfolio.balance, Decimal('10000') - 1000 - 1000 + 400)
+
+    def test_claimed_orders_are_not_claimed_twice(self):
+        for _ in range(3):
+            self.place('buy', 'AAPL', 1)
+        first = claim_orders('worker-a', batch_size=2)
+        second = claim_orders('worker-b', batch_size=2)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 1)
+        self.assertFalse({o.id for o in first} & {o.id for o in second})
+        self.assertEqual(claim_orders('worker-c'), [])
+
+    @patch('investment_manager_main.valuation.aget_stock_quotes', new_callable=AsyncMock)
+    def test_portfolio_details_lists_queued_orders(self, mock_quotes):
+        mock_quotes.return_value = {}
+        self.place('buy', 'AAPL', 3)
+        response = self.client.get(reverse('portfolio_details', args=[self.portfolio.id]))
+        self.assertContains(response, 'Queued Orders')
+        self.assertEqual(len(response.context['open_orders']), 1)
+
+class ConcurrentTradeTests(TransactionTestCase):
+    def test_parallel_trades_leave_portfolio_consistent(self):
+        out = StringIO()
+        call_command('stress_trades', '--threads', '4', '--trades', '25', '--balance', '100', stdout=out)
+        self.assertIn('consistent', out.getvalue())
+        self.assertIn('trades/s', out.getvalue())
+        self.assertFalse(Portfolio.objects.exists())
+
+TRADE_CSV = """timestamp,symbol,trade_type,quantity,price
+2023-01-03,aapl,buy,10,100
+2023-01-04T10:30:00,AAPL,BUY,10,200
+2023-01-05,MSFT,buy,5,250
+not-a-date,AAPL,buy,1,1
+2023-01-06,AAPL,hold,1,1
+2023-01-09,AAPL,sell,5,300
+"""
+
+class ImportTradesTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='importuser', password='importpass')
+        self.client.login(username='importuser', password='importpass')
+        self.portfolio = Portfolio.objects.create(user=self.user, balance=10000)
+
+    def test_command_imports_valid_rows_and_rebuilds_holdings(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write(TRADE_CSV)
+        out, err = StringIO(), StringIO()
+        call_command('import_trades', str(self.portfolio.id), f.name, '--chunk-size', '2', stdout=out, stderr=err)
+        os.unlink(f.name)
+
+        self.assertIn('Imported 4 of 6 row(s)', out.getvalue())
+        self.assertIn('rows/s', out.getvalue())
+        self.assertIn('Line 5: Invalid timestamp', err.getvalue())
+        self.assertIn('Line 6: Invalid trade type', err.getvalue())
+
+        aapl = Holding.objects.get(portfolio=self.portfolio, symbol='AAPL')
+        self.assertEqual((aapl.quantity, aapl.average_price), (15, 150.0))
+        self.assertEqual(Holding.objects.get(portfolio=self.portfolio, symbol='MSFT').quantity, 5)
+        self.portfolio.refresh_from_db()
+        self.assertEqual(self.portfolio.trade_count, 4)
+        self.assertEqual(self.portfolio.realized_profit_loss, 5 * (300 - 150))
+        self.assertEqual(self.portfolio.balance, Decimal('10000'))
+        first = Trade.objects.order_by('timestamp').first()
+        self.assertEqual(first.timestamp, datetime(2023, 1, 3, 21, 0, tzinfo=pytz.UTC))
+
+    def test_upload_view_adjusts_balance(self):
+        upload = SimpleUploadedFile('trades.csv', TRADE_CSV.encode(), content_type='text/csv')
+        response = self.client.post(reverse('import_trades', args=[self.portfolio.id]),
+                                    {'file': upload, 'adjust_balance': '1'})
+        self.assertEqual(response.context['result'].imported, 4)
+        self.portfolio.refresh_from_db()
+        self.assertEqual(self.portfolio.balance, Decimal('10000') - 1000 - 2000 - 1250 + 1500)
+
+    def test_price_limits_are_validated(self):
+        csv_text = (
+            'timestamp,symbol,trade_type,quantity,price,price_floor,price_ceiling\n'
+            '2023-01-03,AAPL,buy,10,100,95,105\n'
+            '2023-01-04,AAPL,buy,10,100,120,\n'
+            '2023-01-05,AAPL,buy,10,100,,cheap\n'
+        )
+        result = import_trades(self.portfolio, StringIO(csv_text))
+        self.assertEqual((result.imported, result.error_count), (1, 2))
+        self.assertIn('Line 3: Price floor must be lower than the current price.', result.errors)
+        self.assertIn("Line 4: Invalid price ceiling 'cheap'.", result.errors)
+        trade = Trade.objects.get(portfolio=self.portfolio)
+        self.assertEqual((trade.price_floor, trade.price_ceiling), (95.0, 105.0))
+
+    def test_imported_limits_are_not_armed_unless_asked(self):
+        csv_text = (
+            'timestamp,symbol,trade_type,quantity,price,price_floor,price_ceiling\n'
+            '2023-01-03,AAPL,buy,10,100,95,105\n'
+        )
+        import_trades(self.portfolio, StringIO(csv_text))
+        self.assertIsNotNone(Trade.objects.get(portfolio=self.portfolio).trigger_fired_at)
+        self.assertEqual(TriggerEngine().load(), 0)
+
+        import_trades(self.portfolio, StringIO(csv_text), arm_triggers=True)
+        engine = TriggerEngine()
+        self.assertEqual(engine.load(), 1)
+        self.assertEqual(len(engine), 1)
+
+    def test_missing_columns_are_rejected(self):
+        upload = SimpleUploadedFile('trades.csv', b'symbol,quantity\nAAPL,1\n', content_type='text/csv')
+        response = self.client.post(reverse('import_trades', args=[self.portfolio.id]), {'file': upload})
+        self.assertContains(response, 'Missing column(s): timestamp, trade_type, price.')
+        self.assertFalse(Trade.objects.exists())
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='exportuser', password='exportpass')
+        self.client.login(username='exportuser', password='exportpass')
+        self.portfolio = Portfolio.objects.create(user=self.user, balance=10000)
+
+    def export(self, dataset, **params):
+        return self.client.get(reverse('export_portfolio', args=[self.portfolio.id, dataset]), params)
+
+    def test_trade_csv_round_trips_through_import(self):
+        upload = SimpleUploadedFile('trades.csv', TRADE_CSV.encode(), content_type='text/csv')
+        self.client.post(reverse('import_trades', args=[self.portfolio.id]), {'file': upload})
+        first = Trade.objects.filter(portfolio=self.portfolio).order_by('timestamp', 'id').first()
+        Trade.objects.filter(pk=first.pk).update(price_floor=90.0, price_ceiling=110.0)
+
+        response = self.export('trades')
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        body = b''.join(response.streaming_content).decode()
+        self.assertTrue(body.startswith('timestamp,symbol,trade_type,quantity,price,price_floor,price_ceiling\r\n'))
+        self.assertEqual(len(body.splitlines()), 5)
+
+        other = Portfolio.objects.create(user=self.user, name='Copy', balance=0)
+        result = import_trades(other, StringIO(body))
+        self.assertEqual((result.imported, result.error_count), (4, 0))
+        self.assertEqual(Holding.objects.get(portfolio=other, symbol='AAPL').quantity, 15)
+        copied = Trade.objects.filter(portfolio=other).order_by('timestamp', 'id').first()
+        self.assertEqual((copied.price_floor, copied.price_ceiling), (90.0, 110.0))
+
+    def test_holdings_and_performance_as_ndjson(self):
+        Holding.objects.create(portfolio=self.portfolio, symbol='AAPL', quantity=3, average_price=10.5)
+        PortfolioPerformance.objects.create(portfolio=self.portfolio, date=datetime(2024, 1, 2).date(), total_value=100.0)
+
+        rows = [json.loads(line) for line in b''.join(self.export('holdings', format='ndjson').streaming_content).splitlines()]
+        self.assertEqual(rows, [{'symbol': 'AAPL', 'quantity': 3, 'average_price': 10.5}])
+        rows = [json.loads(line) for line in b''.join(self.export('performance', format='ndjson').streaming_content).splitlines()]
+        self.assertEqual(rows, [{'date': '2024-01-02', 'total_value': 100.0}])
+
+    def test_unknown_dataset_or_format_is_404(self):
+        self.assertEqual(self.export('secrets').status_code, 404)
+        self.assertEqual(self.export('trades', format='xml').status_code, 404)
+
+class RebuildPortfolioAggregatesTests(TestCase):
+    def test_rebuild_replays_trade_history(self):
+        user = User.objects.create_user(username='rebuilduser', password='rebuildpass')
+        portfolio = Portfolio.objects.create(user=user, balance=0, trade_count=99)
+        for trade_type, quantity, price in [('buy', 10, 100.0), ('buy', 10, 200.0), ('sell', 5, 300.0)]:
+            Trade.objects.create(portfolio=portfolio, symbol='AAPL', quantity=quantity,
+                                 trade_type=trade_type, trade_price=price)
+
+        call_command('rebuild_portfolio_aggregates', stdout=StringIO())
+        portfolio.refresh_from_db()
+        self.assertEqual(portfolio.trade_count, 3)
+        self.assertEqual(portfolio.invested_amount, 15 * 150.0)
+        self.assertEqual(portfolio.realized_profit_loss, 5 * (300.0 - 150.0))
+
+class SnapshotPortfoliosTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='snapshotuser', password='snapshotpass')
+        self.portfolio = Portfolio.objects.create(user=user, balance=9000)
+        Holding.objects.create(portfolio=self.portfolio, symbol='AAPL', quantity=10, average_price=100)
+        self.today = market_today()
+        # The command switches the process to the batch budget.
+        self.addCleanup(reset_upstream)
+
+    def at_noon(self, day):
+        return pytz.timezone('America/New_York').localize(datetime.combine(day, datetime.min.time()).replace(hour=12))
+
+    @patch('investment_manager_main.valuation.get_stock_quotes')
+    def test_snapshot_is_idempotent_per_day(self, mock_quotes):
+        mock_quotes.return_value = make_quotes({'AAPL': 150.0})
+        call_command('snapshot_portfolios', '--backfill-days', '0', stdout=StringIO())
+        mock_quotes.return_value = make_quotes({'AAPL': 160.0})
+        call_command('snapshot_portfolios', '--backfill-days', '0', stdout=StringIO())
+
+        snapshot = PortfolioPerformance.objects.get(portfolio=self.portfolio)
+        self.assertEqual(snapshot.date, self.today)
+        self.assertEqual(snapshot.total_value, 9000 + 10 * 160.0)
+
+    @patch('investment_manager_main.valuation.get_stock_quotes')
+    def test_backfill_unwinds_trades_over_stored_closes(self, mock_quotes):
+        mock_quotes.return_value = make_quotes({'AAPL': 130.0})
+        days = [self.today - timedelta(days=n) for n in (4, 3, 2, 1)]
+        stock = Stock.objects.create(symbol='AAPL', name='Apple')
+        for day, close in zip(days, [90.0, 100.0, 110.0, 120.0]):
+            StockPrice.objects.create(stock=stock, date=day, open_price=close, high_price=close,
+                                      low_price=close, close_price=close, volume=1000)
+        trade = Trade.objects.create(portfolio=self.portfolio, symbol='AAPL', quantity=10,
+                                     trade_type='buy', trade_price=100.0)
+        Trade.objects.filter(pk=trade.pk).update(timestamp=self.at_noon(days[1]))
+        Portfolio.objects.filter(pk=self.portfolio.pk).update(created_at=self.at_noon(days[0]))
+        PortfolioPerformance.objects.create(portfolio=self.portfolio, date=days[3], total_value=1.0)
+
+        call_command('snapshot_portfolios', '--no-sync', stdout=StringIO())
+        series = dict(PortfolioPerformance.objects.values_list('date', 'total_value'))
+        self.assertEqual(series, {
+            days[0]: 9000 + 1000.0,
+            days[1]: 9000 + 10 * 100.0,
+            days[2]: 9000 + 10 * 110.0,
+            days[3]: 1.0,
+            self.today: 9000 + 10 * 130.0,
+        })
+
+    @patch('investment_manager_main.performance.sync_daily_bars_many')
+    def test_backfill_ignores_trades_before_the_window(self, mock_sync):
+        old = Trade.objects.create(portfolio=self.portfolio, symbol='XOM', quantity=5,
+                                   trade_type='buy', trade_price=50.0)
+        Trade.objects.filter(pk=old.pk).update(timestamp=self.at_noon(self.today - timedelta(days=400)))
+        recent = Trade.objects.create(portfolio=self.portfolio, symbol='MSFT', quantity=1,
+                                      trade_type='sell', trade_price=300.0)
+        Trade.objects.filter(pk=recent.pk).update(timestamp=self.at_noon(self.today - timedelta(days=2)))
+
+        backfill_portfolios(Portfolio.objects.all(), days=30)
+        self.assertEqual(mock_sync.call_args.args[0], ['AAPL', 'MSFT'])
+
 class AlpacaAPITests(TestCase):
+    def setUp(self):
+        reset_upstream()
+        alpaca_api.reset_client()
+
     @patch('investment_manager_main.alpaca_api.REST')
     def test_get_stock_price_success(self, mock_rest):
         mock_instance = MagicMock()
@@ -175,6 +667,984 @@ class AlpacaAPITests(TestCase):
         data = get_historical_data('INVALID', days=7)
         self.assertIsNone(data)
 
+    @patch('investment_manager_main.alpaca_api.get_client')
+    def test_get_stock_prices_uses_one_request(self, mock_get_client):
+        mock_api = mock_get_client.return_value
+        mock_api.get_latest_trades.return_value = {'AAPL': MagicMock(price=150.0)}
+
+        prices = get_stock_prices(['aapl', 'MSFT', 'AAPL'])
+        mock_api.get_latest_trades.assert_called_once_with(['AAPL', 'MSFT'])
+        self.assertEqual(prices, {'AAPL': 150.0, 'MSFT': None})
+
+class StartupImportTests(TestCase):
+    """Cold start (app registry plus URLconf) must not pull in the market-data stack."""
+
+    HEAVY_MODULES = {'pandas', 'numpy', 'alpaca_trade_api', 'aiohttp'}
+    BUDGET_MS = float(os.getenv('STARTUP_IMPORT_BUDGET_MS', '800'))
+
+    def test_cold_import_stays_within_budget(self):
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'investment_manager.settings'}
+        env.pop('ALPACA_API_KEY', None)
+        env.pop('ALPACA_SECRET_KEY', None)
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 'import django; django.setup(); import investment_manager.urls'],
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+            env=env, capture_output=True, text=True, timeout=60,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+
+        imported, total_us = set(), 0
+        for line in result.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+            _, cumulative, name = line.split('|')
+            imported.add(name.strip())
+            if not name.startswith('  '):
+                total_us += int(cumulative)
+
+        self.assertFalse(self.HEAVY_MODULES & imported)
+        self.assertLess(total_us / 1000, self.BUDGET_MS)
+
+class AsyncAlpacaAPITests(TestCase):
+    def setUp(self):
+        reset_upstream()
+
+    def test_session_is_pooled_per_loop_and_closed_with_it(self):
+        async def get_twice():
+            return await alpaca_api._get_async_session(), await alpaca_api._get_async_session()
+
+        first, second = asyncio.run(get_twice())
+        self.assertIs(first, second)
+        self.assertTrue(first.closed)
+        self.assertEqual(alpaca_api._async_sessions, {})
+
+    @patch('investment_manager_main.alpaca_api._get_json', new_callable=AsyncMock)
+    def test_aget_stock_prices_uses_one_request(self, mock_get):
+        mock_get.return_value = {'trades': {'AAPL': {'p': 150.0}}}
+
+        prices = asyncio.run(aget_stock_prices(['MSFT', 'aapl']))
+        self.assertEqual(prices, {'AAPL': 150.0, 'MSFT': None})
+        mock_get.assert_awaited_once()
+        self.assertEqual(mock_get.call_args.args[1]['symbols'], 'AAPL,MSFT')
+
+    @patch('investment_manager_main.alpaca_api._get_json', new_callable=AsyncMock)
+    def test_afetch_bars_follows_pagination(self, mock_get):
+        bar = {'t': '2024-01-02T05:00:00Z', 'o': 1, 'h': 2, 'l': 0.5, 'c': 1.5, 'v': 100, 'n': 3, 'vw': 1.2}
+        mock_get.side_effect = [
+            {'bars': [bar], 'next_page_token': 'abc'},
+            {'bars': [dict(bar, t='2024-01-03T05:00:00Z')], 'next_page_token': None},
+        ]
+        end = datetime.now(pytz.UTC)
+
+        bars = asyncio.run(afetch_bars('AAPL', end - timedelta(days=7), end))
+        self.assertEqual(len(bars), 2)
+        self.assertEqual(list(bars['close']), [1.5, 1.5])
+        self.assertEqual(mock_get.call_args.args[1]['page_token'], 'abc')
+
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        User.objects.create_user(username='asyncuser', password='asyncpass')
+
+    @patch('investment_manager_main.views.aget_stock_price', new_callable=AsyncMock)
+    def test_stock_price_view(self, mock_price):
+        mock_price.return_value = 150.0
+        self.client.login(username='asyncuser', password='asyncpass')
+
+        response = self.client.get(reverse('get_stock_price'), {'symbol': 'aapl'})
+        self.assertEqual(response.json(), {'symbol': 'AAPL', 'price': 150.0})
+
+    @patch('investment_manager_main.bar_store.afetch_bars', new_callable=AsyncMock)
+    def test_stock_history_view_syncs_bars(self, mock_fetch):
+        day = market_today() - timedelta(days=1)
+        mock_fetch.return_value = make_bars([day])
+        self.client.login(username='asyncuser', password='asyncpass')
+
+        response = self.client.get(reverse('get_stock_history'), {'symbol': 'AAPL', 'timeframe': '3M'})
+        self.assertEqual(response.json(), {
+            'symbol': 'AAPL', 'timeframe': '3M', 'bar_size': '1Day', 'start': calendar.timegm(day.timetuple()),
+            'offsets': [0], 'prices': [100.0], 'total': 1,
+        })
+        self.assertEqual(StockPrice.objects.count(), 1)
+
+    @patch('investment_manager_main.bar_store.afetch_bars', new_callable=AsyncMock)
+    def test_stock_history_view_downsamples_and_supports_conditional_get(self, mock_fetch):
+        today = market_today()
+        mock_fetch.return_value = make_bars([today - timedelta(days=n) for n in range(1, 300)])
+        self.client.login(username='asyncuser', password='asyncpass')
+        params = {'symbol': 'AAPL', 'timeframe': '1Y', 'max_points': 50}
+
+        response = self.client.get(reverse('get_stock_history'), params)
+        data = response.json()
+        self.assertEqual(len(data['offsets']), 50)
+        self.assertEqual(len(data['prices']), 50)
+        self.assertEqual(data['total'], StockPrice.objects.count())
+        self.assertEqual(data['offsets'][0], 0)
+        self.assertEqual(data['offsets'], sorted(data['offsets']))
+
+        etag = response['ETag']
+        unchanged = self.client.get(reverse('get_stock_history'), params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(unchanged.status_code, 304)
+        self.assertEqual(unchanged.content, b'')
+        changed = self.client.get(reverse('get_stock_history'), params, HTTP_IF_NONE_MATCH='"stale"')
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(changed['ETag'], etag)
+
+        bad = self.client.get(reverse('get_stock_history'), {**params, 'max_points': 'lots'})
+        self.assertEqual(bad.status_code, 400)
+
+    def test_stock_price_view_requires_login(self):
+        response = self.client.get(reverse('get_stock_price'), {'symbol': 'AAPL'})
+        self.assertEqual(response.status_code, 302)
+
+class QuoteCacheTests(TestCase):
+    def setUp(self):
+        # Every symbol trades at 100 except NOPE, which Alpaca does not know.
+        self.fetch = MagicMock(side_effect=lambda symbols: {s: None if s == 'NOPE' else 100.0 for s in symbols})
+
+    def test_fresh_entries_are_not_refetched(self):
+        cache = QuoteCache(ttl=60)
+        self.assertEqual(cache.get_many(['AAPL'], self.fetch), {'AAPL': 100.0})
+        self.assertEqual(cache.get_many(['AAPL', 'MSFT'], self.fetch), {'AAPL': 100.0, 'MSFT': 100.0})
+        self.assertEqual(self.fetch.call_args_list[1].args[0], ['MSFT'])
+
+    def test_unknown_symbols_are_negatively_cached(self):
+        cache = QuoteCache(ttl=60, negative_ttl=60)
+        cache.get_many(['NOPE'], self.fetch)
+        self.assertEqual(cache.get_many(['NOPE'], self.fetch), {'NOPE': None})
+        self.assertEqual(self.fetch.call_count, 1)
+
+    def test_failed_fetches_are_not_cached(self):
+        cache = QuoteCache(ttl=60)
+        failing = MagicMock(return_value={})
+        self.assertEqual(cache.get_many(['AAPL'], failing), {})
+        cache.get_many(['AAPL'], failing)
+        self.assertEqual(failing.call_count, 2)
+
+    def test_stale_entries_are_served_while_revalidating(self):
+        cache = QuoteCache(ttl=10, stale_ttl=60)
+        cache._entries['AAPL'] = (90.0, time.time() - 20)
+
+        self.assertEqual(cache.get_many(['AAPL'], self.fetch), {'AAPL': 90.0})
+        deadline = time.time() + 2
+        while cache._entries['AAPL'][0] != 100.0 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(cache.get_many(['AAPL'], self.fetch), {'AAPL': 100.0})
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = QuoteCache(ttl=60, max_size=2)
+        cache.get_many(['AAPL', 'MSFT'], self.fetch)
+        cache.get_many(['AAPL'], self.fetch)
+        cache.get_many(['TSLA'], self.fetch)
+        self.assertEqual(list(cache._entries), ['AAPL', 'TSLA'])
+
+def make_bars(dates, close=100.0):
+    index = pd.to_datetime(list(dates)).tz_localize('America/New_York').tz_convert('UTC')
+    return pd.DataFrame({
+        'open': close, 'high': close + 1, 'low': close - 1, 'close': close, 'volume': 1000,
+    }, index=index)
+
+class ChartTests(TestCase):
+    def test_lttb_keeps_endpoints_and_extremes(self):
+        x = np.arange(1000, dtype=float)
+        y = np.sin(x / 50)
+        y[437] = 10.0
+        y[612] = -10.0
+
+        kept = lttb(x, y, 40)
+        self.assertEqual(len(kept), 40)
+        self.assertEqual((kept[0], kept[-1]), (0, 999))
+        self.assertTrue(np.all(np.diff(kept) > 0))
+        self.assertIn(437, kept)
+        self.assertIn(612, kept)
+
+    def test_lttb_returns_every_point_of_short_series(self):
+        self.assertEqual(lttb(np.arange(5), np.arange(5), 10).tolist(), [0, 1, 2, 3, 4])
+        with self.assertRaises(ValueError):
+            lttb(np.arange(5), np.arange(5), 2)
+
+    def test_columnar_series_uses_epoch_offsets(self):
+        frame = make_bars([datetime(2024, 1, 2), datetime(2024, 1, 3)])
+        payload = columnar_series(frame)
+        self.assertEqual(payload['start'], int(frame.index[0].timestamp()))
+        self.assertEqual(payload['offsets'], [0, 86400])
+        self.assertEqual(payload['prices'], [100.0, 100.0])
+        self.assertEqual(columnar_series(frame.iloc[:0])['start'], None)
+
+class IntradayTests(TestCase):
+    def setUp(self):
+        reset_upstream()
+        chunk_cache.clear()
+        self.addCleanup(chunk_cache.clear)
+        self.provider = SyntheticProvider(latency=0.2)
+        previous = set_provider(self.provider)
+        self.addCleanup(set_provider, previous)
+
+    def test_chunks_are_fetched_concurrently_merged_and_cached(self):
+        now = datetime.now(pytz.UTC)
+        expected_chunks = len(chunks('AAPL', '5Min', now - timedelta(days=7), now))
+        self.assertGreater(expected_chunks, 2)
+
+        bars = get_intraday_bars('aapl', '5Min', 7)
+        self.assertEqual(self.provider.calls['bars'], expected_chunks)
+        self.assertEqual(self.provider.peak['bars'], expected_chunks)
+
+        self.assertTrue(bars.index.is_unique)
+        self.assertTrue(bars.index.is_monotonic_increasing)
+        self.assertEqual(set(bars.index.to_series().diff().dropna()), {pd.Timedelta(minutes=5)})
+        self.assertGreaterEqual(bars.index[0], now - timedelta(days=7))
+        self.assertLessEqual(bars.index[-1], datetime.now(pytz.UTC))
+
+        get_intraday_bars('AAPL', '5Min', 7)
+        self.assertEqual(self.provider.calls['bars'], expected_chunks)
+
+    def test_failed_chunk_returns_none_and_daily_sizes_are_rejected(self):
+        set_provider(FailingProvider())
+        self.assertIsNone(get_intraday_bars('AAPL', '1Min', 1))
+        self.assertIsNone(asyncio.run(aget_intraday_bars('AAPL', '1Day', 30)))
+
+    def test_last_session_keeps_the_latest_market_day(self):
+        bars = make_bars([datetime(2024, 1, 4, 15, 55), datetime(2024, 1, 5, 9, 30), datetime(2024, 1, 5, 15, 59)])
+        self.assertEqual(len(last_session(bars)), 2)
+
+    def test_history_view_serves_intraday_bars(self):
+        self.provider.latency = 0
+        User.objects.create_user(username='chartuser', password='chartpass')
+        self.client.login(username='chartuser', password='chartpass')
+
+        data = self.client.get(reverse('get_stock_history'), {'symbol': 'AAPL', 'timeframe': '1W'}).json()
+        self.assertEqual(data['bar_size'], '5Min')
+        self.assertGreater(data['total'], 1000)
+        self.assertEqual(len(data['prices']), 1000)
+        data = self.client.get(reverse('get_stock_history'),
+                               {'symbol': 'AAPL', 'timeframe': '1W', 'max_points': 10000}).json()
+        self.assertEqual(set(np.diff(data['offsets'])), {300})
+
+        data = self.client.get(reverse('get_stock_history'), {'symbol': 'AAPL', 'timeframe': '1D'}).json()
+        self.assertEqual(data['bar_size'], '1Min')
+        self.assertLessEqual(data['offsets'][-1], 86400)
+
+    @patch('investment_manager_main.views.get_intraday_bars')
+    def test_history_page_opens_at_the_first_bar_of_the_session(self, mock_bars):
+        bars = make_bars([datetime(2024, 1, 4, 15, 59), datetime(2024, 1, 5, 9, 30), datetime(2024, 1, 5, 15, 59)])
+        bars['open'] = [90.0, 95.0, 99.0]
+        mock_bars.return_value = bars
+        User.objects.create_user(username='chartuser', password='chartpass')
+        self.client.login(username='chartuser', password='chartpass')
+
+        response = self.client.get(reverse('stock_history_display', args=['AAPL']), {'timeframe': '1D'})
+        self.assertEqual(response.context['metrics']['open'], 95.0)
+        self.assertEqual(response.context['metrics']['volume'], 2000)
+        self.assertNotIn('prices', response.context)
+
+class FailingProvider(MarketDataProvider):
+    def __init__(self):
+        self.calls = 0
+
+    def latest_trades(self, symbols):
+        self.calls += 1
+        raise ConnectionError('upstream timed out')
+
+    def bars(self, symbol, start, end, timeframe='1Day'):
+        self.calls += 1
+        raise ConnectionError('upstream timed out')
+
+    def assets(self):
+        self.calls += 1
+        raise ConnectionError('upstream timed out')
+
+class ResilienceTests(TestCase):
+    def setUp(self):
+        reset_upstream()
+        self.addCleanup(reset_upstream)
+
+    def test_concurrent_threads_share_one_fetch(self):
+        flight, calls, release = SingleFlight(timeout=5), [], threading.Event()
+
+        def fetch(keys):
+            calls.append(list(keys))
+            release.wait(5)
+            return {key: key.lower() for key in keys}
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(flight.run(['AAPL'], fetch)))
+        leader.start()
+        while not calls:
+            time.sleep(0.001)
+        followers = [threading.Thread(target=lambda: results.append(flight.run(['AAPL', 'MSFT'], fetch)))
+                     for _ in range(4)]
+        for thread in followers:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in [leader, *followers]:
+            thread.join(5)
+
+        self.assertEqual(calls[0], ['AAPL'])
+        self.assertEqual(sum(keys.count('AAPL') for keys in calls), 1)
+        self.assertTrue(all(result['AAPL'] == 'aapl' for result in results))
+        self.assertEqual(flight.in_flight(), 0)
+
+    def test_concurrent_tasks_share_one_fetch(self):
+        flight, calls = SingleFlight(timeout=5), []
+
+        async def fetch(keys):
+            calls.append(keys)
+            await asyncio.sleep(0.02)
+            return {key: 1.0 for key in keys}
+
+        async def run():
+            return await asyncio.gather(*(flight.arun(['AAPL'], fetch) for _ in range(5)))
+
+        self.assertEqual(asyncio.run(run()), [{'AAPL': 1.0}] * 5)
+        self.assertEqual(calls, [['AAPL']])
+
+    def test_breaker_opens_on_errors_and_closes_after_a_good_trial(self):
+        now = [0.0]
+        breaker = CircuitBreaker('test', failure_ratio=0.5, min_calls=4, window=10, reset_timeout=30,
+                                 clock=lambda: now[0])
+        for ok in (True, False, True, False):
+            breaker.record(ok, breaker.allow())
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        with self.assertRaises(CircuitOpenError):
+            with breaker.guard():
+                pass
+
+        now[0] = 31
+        trial = breaker.allow()
+        self.assertTrue(trial)
+        self.assertIsNone(breaker.allow())
+        breaker.record(True, trial)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_breaker_ignores_calls_that_finish_after_it_opened(self):
+        now = [0.0]
+        breaker = CircuitBreaker('test', failure_ratio=0.5, min_calls=2, window=10, reset_timeout=30,
+                                 clock=lambda: now[0])
+        slow_success, slow_failure = breaker.allow(), breaker.allow()
+        for _ in range(2):
+            breaker.record(False, breaker.allow())
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+        breaker.record(True, slow_success)
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+        now[0] = 20
+        breaker.record(False, slow_failure)
+        now[0] = 31
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+
+        trial = breaker.allow()
+        breaker.record(True, trial)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+        breaker.record(False, slow_failure)
+        breaker.record(False, slow_failure)
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_open_breaker_serves_last_known_price_without_calling_upstream(self):
+        provider = FailingProvider()
+        self.addCleanup(set_provider, set_provider(provider))
+        fetched_at = time.time() - 3600
+        quote_cache._entries['AAPL'] = (150.0, fetched_at)
+
+        for _ in range(alpaca_api.BREAKER_MIN_CALLS + 3):
+            quote = alpaca_api.get_stock_quotes(['AAPL'])['AAPL']
+            self.assertEqual(quote.price, 150.0)
+            self.assertAlmostEqual(quote.as_of.timestamp(), fetched_at, places=3)
+        self.assertEqual(provider.calls, alpaca_api.BREAKER_MIN_CALLS)
+        self.assertEqual(alpaca_api.quote_breaker.state, CircuitBreaker.OPEN)
+        self.assertIsNone(get_stock_price('MSFT'))
+
+class RateLimiterTests(TestCase):
+    def setUp(self):
+        reset_upstream()
+        self.addCleanup(reset_upstream)
+        metrics.reset_metrics()
+        self.addCleanup(metrics.reset_metrics)
+
+    def test_interactive_calls_overtake_queued_batch_work(self):
+        limiter = PriorityRateLimiter(rate=10, burst=1)
+        limiter.acquire()
+        order = []
+
+        def call(name, priority):
+            limiter.acquire(priority)
+            order.append(name)
+
+        threads = [threading.Thread(target=call, args=(f'batch{n}', BATCH)) for n in (1, 2)]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.01)
+        threads.append(threading.Thread(target=call, args=('interactive', INTERACTIVE)))
+        threads[-1].start()
+        time.sleep(0.02)
+        self.assertEqual(limiter.depths(), {INTERACTIVE: 1, BATCH: 2})
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(order, ['interactive', 'batch1', 'batch2'])
+        self.assertEqual(limiter.depths(), {INTERACTIVE: 0, BATCH: 0})
+
+    def test_drained_bucket_queues_until_max_wait(self):
+        limiter = PriorityRateLimiter(rate=20, burst=1, max_wait=1)
+        self.assertLess(limiter.acquire(), 0.01)
+        self.assertGreater(limiter.acquire(), 0.03)
+
+        slow = PriorityRateLimiter(rate=1, burst=1, max_wait=0.05)
+        slow.acquire()
+        with self.assertRaises(RateLimitTimeout):
+            slow.acquire()
+        self.assertEqual(slow.depths()[INTERACTIVE], 0)
+
+    def test_async_callers_share_the_queue(self):
+        limiter = PriorityRateLimiter(rate=20, burst=1)
+
+        async def main():
+            return await asyncio.gather(*(limiter.aacquire() for _ in range(3)))
+
+        waits = sorted(asyncio.run(main()))
+        self.assertLess(waits[0], 0.01)
+        self.assertGreater(waits[2], 0.08)
+
+    @patch('investment_manager_main.alpaca_api.get_client')
+    def test_alpaca_calls_wait_for_a_slot_and_report_it(self, mock_get_client):
+        mock_get_client.return_value.get_latest_trade.return_value = MagicMock(price=150.0)
+        limiter = PriorityRateLimiter(rate=20, burst=1)
+        provider = alpaca_api.AlpacaProvider()
+
+        with patch.object(alpaca_api, 'upstream_limiter', limiter), alpaca_api.upstream_priority(BATCH):
+            provider.latest_trade('AAPL')
+            provider.latest_trade('AAPL')
+            rendered = metrics.render_metrics()
+
+            throttled = Exception('Too Many Requests')
+            throttled.status_code = 429
+            mock_get_client.return_value.get_latest_trade.side_effect = throttled
+            limiter.reset()
+            with self.assertRaises(Exception):
+                provider.latest_trade('AAPL')
+
+        _, waited, count = metrics.upstream_wait_seconds.snapshot('batch')
+        self.assertEqual(count, 3)
+        self.assertGreater(waited, 0.03)
+        self.assertIn('investment_manager_upstream_queue_depth{priority="batch"} 0', rendered)
+        self.assertGreater(limiter.acquire(), 0.03)
+
+
+    @patch('investment_manager_main.alpaca_api.get_client')
+    def test_queueing_is_not_upstream_latency_or_failure(self, mock_get_client):
+        mock_get_client.return_value.get_latest_trades.return_value = {'AAPL': MagicMock(price=150.0)}
+        self.addCleanup(set_provider, set_provider(alpaca_api.AlpacaProvider()))
+        limiter = PriorityRateLimiter(rate=10, burst=1)
+        limiter.drain()
+
+        with patch.object(alpaca_api, 'upstream_limiter', limiter):
+            self.assertEqual(alpaca_api._request_latest_prices(['AAPL']), {'AAPL': 150.0})
+            _, waited, _ = metrics.upstream_wait_seconds.snapshot('interactive')
+            _, took, calls = metrics.upstream_seconds.snapshot('latest_trades')
+            self.assertGreater(waited, 0.05)
+            self.assertLess(took, 0.05)
+            self.assertEqual(calls, 1)
+            self.assertEqual(mock_get_client.return_value.get_latest_trades.call_count, 1)
+
+            limiter.rate, limiter.max_wait = 0.01, 0.01
+            limiter.drain()
+            for _ in range(alpaca_api.BREAKER_MIN_CALLS + 1):
+                self.assertEqual(alpaca_api._request_latest_prices(['AAPL']), {})
+        self.assertEqual(alpaca_api.quote_breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(metrics.upstream_seconds.snapshot('latest_trades')[2], 1)
+        self.assertGreaterEqual(alpaca_api.SINGLE_FLIGHT_TIMEOUT, alpaca_api.RATE_MAX_WAIT)
+
+    def test_batch_commands_use_the_smaller_batch_budget(self):
+        alpaca_api.use_batch_budget()
+        self.assertEqual(alpaca_api.current_priority(), BATCH)
+        self.assertAlmostEqual(alpaca_api.upstream_limiter.rate, alpaca_api.BATCH_RATE_LIMIT / 60)
+        self.assertLessEqual(alpaca_api.upstream_limiter.burst, alpaca_api.RATE_BURST)
+        with alpaca_api.upstream_priority(INTERACTIVE):
+            self.assertEqual(alpaca_api.current_priority(), INTERACTIVE)
+
+    def test_async_429_drains_the_bucket(self):
+        from aiohttp import ClientResponseError, web
+
+        async def too_many(request):
+            return web.json_response({'message': 'too many requests'}, status=429)
+
+        async def main():
+            app = web.Application()
+            app.router.add_get('/v2/stocks/trades/latest', too_many)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, '127.0.0.1', 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+            try:
+                with patch.object(alpaca_api, 'DATA_URL', f'http://127.0.0.1:{port}'):
+                    await alpaca_api.AlpacaProvider().alatest_trades(['AAPL'])
+            finally:
+                await runner.cleanup()
+
+        limiter = PriorityRateLimiter(rate=20, burst=5)
+        with patch.object(alpaca_api, 'upstream_limiter', limiter):
+            with self.assertRaises(ClientResponseError) as raised:
+                asyncio.run(main())
+        self.assertEqual(raised.exception.status, 429)
+        self.assertGreater(limiter.acquire(), 0.03)
+
+
+class BarStoreTests(TestCase):
+    def setUp(self):
+        self.today = market_today()
+        self.days = [self.today - timedelta(days=n) for n in (3, 2, 1)]
+        bar_store._today_fetched.clear()
+        self.addCleanup(bar_store._today_fetched.clear)
+        # Tests run as if today's session were still open unless they say otherwise.
+        patcher = patch('investment_manager_main.bar_store.session_over', return_value=False)
+        self.session_over = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch('investment_manager_main.bar_store.fetch_bars')
+    def test_first_request_stores_window(self, mock_fetch):
+        mock_fetch.return_value = make_bars(self.days)
+
+        history = get_daily_bars('aapl', days=30)
+        self.assertEqual(len(history), 3)
+        self.assertEqual(list(history['close']), [100.0] * 3)
+        stock = Stock.objects.get(symbol='AAPL')
+        self.assertEqual(stock.prices.count(), 3)
+        self.assertEqual(stock.bars_synced_from, self.today - timedelta(days=30))
+        self.assertEqual(stock.bars_synced_to, self.today - timedelta(days=1))
+
+    @patch('investment_manager_main.bar_store.TODAY_TTL', 0)
+    @patch('investment_manager_main.bar_store.fetch_bars')
+    def test_repeat_request_only_fetches_missing_tail(self, mock_fetch):
+        mock_fetch.return_value = make_bars(self.days)
+        get_daily_bars('AAPL', days=30)
+        mock_fetch.return_value = make_bars([self.today], close=105.0)
+
+        history = get_daily_bars('AAPL', days=30)
+        self.assertEqual(mock_fetch.call_count, 2)
+        self.assertEqual(mock_fetch.call_args.args[1].date(), self.today)
+        self.assertEqual(list(history['close']), [100.0, 100.0, 100.0, 105.0])
+
+    @patch('investment_manager_main.bar_store.fetch_bars')
+    def test_back_to_back_requests_fetch_today_once(self, mock_fetch):
+        mock_fetch.return_value = make_bars(self.days)
+        get_daily_bars('AAPL', days=30)
+        get_daily_bars('AAPL', days=30)
+        self.assertEqual(mock_fetch.call_count, 1)
+
+    @patch('investment_manager_main.bar_store.TODAY_TTL', 0)
+    @patch('investment_manager_main.bar_store.fetch_bars')
+    def test_today_counts_as_synced_once_the_session_is_over(self, mock_fetch):
+        self.session_over.return_value = True
+        mock_fetch.return_value = make_bars(self.days + [self.today])
+        get_daily_bars('AAPL', days=30)
+        self.assertEqual(Stock.objects.get(symbol='AAPL').bars_synced_to, self.today)
+
+        get_daily_bars('AAPL', days=30)
+        self.assertEqual(mock_fetch.call_count, 1)
+
+    @patch('investment_manager_main.bar_store.fetch_bars')
+    def test_wider_window_only_fetches_missing_head(self, mock_fetch):
+        mock_fetch.return_value = make_bars(self.days)
+        get_daily_bars('AAPL', days=30)
+        mock_fetch.reset_mock()
+        mock_fetch.return_value = make_bars([])
+
+        get_daily_bars('AAPL', days=365)
+        # Today's tail was fetched moments ago, so only the head is missing.
+        self.assertEqual(mock_fetch.call_count, 1)
+        head_start, head_end = mock_fetch.call_args_list[0].args[1:3]
+        self.assertEqual(head_start.date(), self.today - timedelta(days=365))
+        self.assertEqual(head_end.date(), self.today - timedelta(days=31))
+
+    @patch('investment_manager_main.bar_store.fetch_bars')
+    def test_unknown_symbol_is_not_stored(self, mock_fetch):
+        mock_fetch.return_value = make_bars([])
+        self.assertIsNone(get_daily_bars('NOPE', days=30))
+        self.assertFalse(Stock.objects.exists())
+
+    def test_many_symbols_are_downloaded_concurrently(self):
+        in_flight = peak = 0
+
+        async def fake_fetch(symbol, start, end):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            if symbol == 'FAIL':
+                raise RuntimeError('upstream down')
+            return make_bars(self.days)
+
+        with patch('investment_manager_main.bar_store.afetch_bars', side_effect=fake_fetch):
+            bar_store.sync_daily_bars_many(['AAPL', 'FAIL', 'MSFT'], self.today - timedelta(days=30), self.today)
+
+        self.assertEqual(peak, 3)
+        self.assertEqual(sorted(Stock.objects.values_list('symbol', flat=True)), ['AAPL', 'MSFT'])
+        self.assertEqual(StockPrice.objects.count(), 6)
+
+class ReplayProviderTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.today = market_today()
+        self.days = [self.today - timedelta(days=n) for n in (3, 2, 1)]
+        with open(os.path.join(self.directory, 'quotes.csv'), 'w') as f:
+            f.write('symbol,price\nAAPL,150.0\nMSFT,300.0\nAAPL,151.0\n')
+        os.makedirs(os.path.join(self.directory, 'bars', '1Day'))
+        make_bars(self.days, close=120.0).to_csv(
+            os.path.join(self.directory, 'bars', '1Day', 'AAPL.csv'), index_label='timestamp')
+        reset_upstream()
+        self.addCleanup(quote_cache.clear)
+        self.addCleanup(set_provider, set_provider(ReplayProvider(self.directory)))
+
+    def test_quotes_replay_in_recorded_order(self):
+        provider = ReplayProvider(self.directory)
+        self.assertEqual(provider.latest_trades(['AAPL', 'MSFT', 'NOPE']), {'AAPL': 150.0, 'MSFT': 300.0, 'NOPE': None})
+        self.assertEqual(provider.latest_trade('AAPL'), 151.0)
+        self.assertEqual(provider.latest_trade('AAPL'), 150.0)
+
+    def test_app_reads_quotes_and_bars_from_replay(self):
+        self.assertEqual(get_stock_prices(['AAPL', 'NOPE']), {'AAPL': 150.0, 'NOPE': None})
+        history = get_daily_bars('AAPL', days=30)
+        self.assertEqual(list(history['close']), [120.0] * 3)
+        self.assertIsNone(get_daily_bars('MSFT', days=30))
+
+    def test_latency_is_applied(self):
+        provider = ReplayProvider(self.directory, latency=0.05)
+        started = time.monotonic()
+        provider.latest_trades(['AAPL'])
+        asyncio.run(provider.alatest_trades(['AAPL']))
+        self.assertGreaterEqual(time.monotonic() - started, 0.1)
+
+    def test_recording_round_trips(self):
+        target = tempfile.mkdtemp()
+        start = datetime.now(pytz.UTC) - timedelta(days=30)
+        counts = record_market_data(ReplayProvider(self.directory), target, ['aapl', 'MSFT'],
+                                    start, datetime.now(pytz.UTC), quotes=2)
+        self.assertEqual(counts, {'quotes': 4, 'bars': 3, 'assets': 2})
+
+        replay = ReplayProvider(target)
+        self.assertEqual(replay.latest_trades(['AAPL', 'MSFT']), {'AAPL': 150.0, 'MSFT': 300.0})
+        self.assertEqual(replay.latest_trade('AAPL'), 151.0)
+        self.assertEqual(list(replay.bars('AAPL', start, datetime.now(pytz.UTC))['close']), [120.0] * 3)
+        self.assertEqual([a.symbol for a in replay.assets()], ['AAPL', 'MSFT'])
+
+    def test_provider_must_implement_every_source(self):
+        class QuotesOnly(MarketDataProvider):
+            def latest_trades(self, symbols):
+                return {}
+
+        with self.assertRaises(TypeError):
+            QuotesOnly()
+
+class AnalyticsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.portfolio = Portfolio.objects.create(user=self.user, name='Test Portfolio', balance=10000)
+        self.today = market_today()
+        self.days = [self.today - timedelta(days=n) for n in (4, 3, 2, 1)]
+
+    def store_closes(self, symbol, closes):
+        stock = Stock.objects.create(symbol=symbol, name=symbol)
+        for day, close in zip(self.days, closes):
+            StockPrice.objects.create(stock=stock, date=day, open_price=close, high_price=close,
+                                      low_price=close, close_price=close, volume=1000)
+
+    def test_compute_metrics(self):
+        closes = np.array([[100.0, 50.0], [110.0, 55.0], [99.0, 49.5], [108.9, 54.45]])
+        metrics = compute_metrics(closes, np.array([0.5, 0.5]), benchmark=closes[:, 0])
+
+        self.assertAlmostEqual(metrics['max_drawdown'], -0.1)
+        self.assertAlmostEqual(metrics['beta'], 1.0)
+        np.testing.assert_allclose(metrics['correlation'], np.ones((2, 2)))
+
+    def test_portfolio_analytics_from_stored_bars(self):
+        Holding.objects.create(portfolio=self.portfolio, symbol='AAPL', quantity=10, average_price=100)
+        Holding.objects.create(portfolio=self.portfolio, symbol='MSFT', quantity=10, average_price=100)
+        self.store_closes('AAPL', [100, 102, 101, 104])
+        self.store_closes('MSFT', [100, 98, 99, 96])
+        self.store_closes('SPY', [400, 404, 402, 408])
+
+        analytics = portfolio_analytics(self.portfolio, days=30, sync=False)
+        self.assertEqual(analytics['symbols'], ['AAPL', 'MSFT'])
+        self.assertEqual(analytics['observations'], 4)
+        self.assertAlmostEqual(sum(analytics['weights']), 1.0)
+        self.assertIsNotNone(analytics['beta'])
+        self.assertLess(analytics['correlation'][0][1], 0)
+
+    def test_portfolio_without_history_reports_error(self):
+        Holding.objects.create(portfolio=self.portfolio, symbol='AAPL', quantity=10, average_price=100)
+        self.assertIn('error', portfolio_analytics(self.portfolio, sync=False))
+
+    @patch('investment_manager_main.analytics.sync_daily_bars_many')
+    def test_analytics_views(self, mock_sync):
+        Holding.objects.create(portfolio=self.portfolio, symbol='AAPL', quantity=10, average_price=100)
+        self.store_closes('AAPL', [100, 102, 101, 104])
+        self.client.login(username='testuser', password='testpass')
+
+        response = self.client.get(reverse('portfolio_analytics', args=[self.portfolio.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Sharpe Ratio')
+
+        response = self.client.get(reverse('portfolio_analytics_data', args=[self.portfolio.id]), {'timeframe': '3M'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['symbols'], ['AAPL'])
+        self.assertIsNone(response.json()['beta'])
+
+class PriceBookTests(TestCase):
+    def setUp(self):
+        reset_upstream()
+        price_book.clear()
+        self.addCleanup(price_book.clear)
+
+    def test_old_prices_are_ignored(self):
+        book = PriceBook(max_age=60)
+        book.update_many({'AAPL': (150.0, time.time()), 'MSFT': (300.0, time.time() - 120)})
+        self.assertEqual(list(book.get_entries(['AAPL', 'MSFT'])), ['AAPL'])
+
+    @patch('investment_manager_main.alpaca_api.get_client')
+    def test_quotes_read_the_price_book_first(self, mock_get_client):
+        mock_api = mock_get_client.return_value
+        mock_api.get_latest_trades.return_value = {'MSFT': MagicMock(price=300.0)}
+        price_book.update_many({'AAPL': (150.0, time.time())})
+
+        self.assertEqual(get_stock_price('AAPL'), 150.0)
+        self.assertEqual(get_stock_prices(['AAPL', 'MSFT']), {'AAPL': 150.0, 'MSFT': 300.0})
+        mock_api.get_latest_trade.assert_not_called()
+        mock_api.get_latest_trades.assert_called_once_with(['MSFT'])
+
+class PriceFeedTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='feeduser', password='feedpass')
+        self.portfolio = Portfolio.objects.create(user=self.user, balance=0)
+        self.stream = MagicMock()
+        self.book = PriceBook(max_age=60)
+        self.feed = PriceFeed(stream=self.stream, book=self.book)
+
+    def test_subscriptions_follow_holdings_and_alerts(self):
+        holding = Holding.objects.create(portfolio=self.portfolio, symbol='AAPL', quantity=1, average_price=1)
+        StockAlert.objects.create(user=self.user, symbol='TSLA', target_price=1)
+        StockAlert.objects.create(user=self.user, symbol='GME', target_price=1, is_active=False)
+
+        self.feed.sync_subscriptions()
+        self.stream.subscribe_trades.assert_called_once_with(self.feed.on_trade, 'AAPL', 'TSLA')
+
+        holding.delete()
+        self.feed.sync_subscriptions()
+        self.stream.unsubscribe_trades.assert_called_once_with('AAPL')
+        self.assertEqual(self.feed.symbols, {'TSLA'})
+
+    def test_run_keeps_the_subscriptions_it_starts_with(self):
+        Holding.objects.create(portfolio=self.portfolio, symbol='AAPL', quantity=1, average_price=1)
+        engine = MagicMock()
+        feed = PriceFeed(stream=self.stream, book=self.book, engines=[engine])
+
+        feed.sync_subscriptions()
+        feed.run()
+        engine.load.assert_called_once()
+        self.stream.subscribe_trades.assert_called_once_with(feed.on_trade, 'AAPL')
+
+    def test_trades_are_flushed_to_the_book(self):
+        traded_at = pd.Timestamp.now(tz='UTC')
+        asyncio.run(self.feed.on_trade(MagicMock(symbol='AAPL', price=150.0, timestamp=traded_at)))
+        asyncio.run(self.feed.on_trade(MagicMock(symbol='AAPL', price=151.0, timestamp=traded_at)))
+
+        self.assertEqual(self.feed.flush(), 1)
+        self.assertEqual(self.book.get_entries(['AAPL']), {'AAPL': (151.0, traded_at.timestamp())})
+        self.assertEqual(self.feed.flush(), 0)
+
+class TriggerEngineTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='triggeruser', password='triggerpass')
+        self.portfolio = Portfolio.objects.create(user=self.user, balance=10000)
+
+    def test_check_fires_crossed_floors_and_ceilings_once(self):
+        engine = TriggerEngine()
+        engine.add(Trigger(1, 1, 'AAPL', 10, floor=90.0, ceiling=110.0))
+        engine.add(Trigger(2, 1, 'AAPL', 10, floor=95.0, ceiling=None))
+        engine.add(Trigger(3, 1, 'AAPL', 10, floor=None, ceiling=105.0))
+
+        self.assertEqual(engine.check('AAPL', 100.0), [])
+        self.assertEqual(engine.check('MSFT', 1.0), [])
+        self.assertEqual([t.trade_id for t in engine.check('AAPL', 94.0)], [2])
+        self.assertCountEqual([t.trade_id for t in engine.check('AAPL', 120.0)], [1, 3])
+        self.assertEqual(engine.check('AAPL', 50.0), [])
+        self.assertEqual(len(engine), 0)
+
+    def test_fired_trigger_sells_holding_and_is_not_reloaded(self):
+        execute_trade(self.portfolio, 'buy', 'AAPL', 10, 100.0, price_floor=90.0)
+        execute_trade(self.portfolio, 'buy', 'AAPL', 5, 100.0, price_ceiling=120.0)
+        engine = TriggerEngine()
+        self.assertEqual(engine.load(), 2)
+
+        engine.check('AAPL', 89.0)
+        self.assertEqual(engine.fire_pending(), 1)
+        self.portfolio.refresh_from_db()
+        self.assertEqual(Holding.objects.get(portfolio=self.portfolio).quantity, 5)
+        self.assertEqual(self.portfolio.balance, Decimal('10000') - 1500 + 890)
+        self.assertEqual(Trade.objects.filter(trade_type='sell').get().trade_price, 89.0)
+
+        self.assertEqual(TriggerEngine().load(), 1)
+        self.assertEqual(engine.load(), 0)
+
+    def test_sell_is_capped_at_shares_still_held(self):
+        execute_trade(self.portfolio, 'buy', 'AAPL', 10, 100.0, price_floor=90.0)
+        execute_trade(self.portfolio, 'sell', 'AAPL', 8, 100.0)
+        engine = TriggerEngine()
+        engine.load()
+
+        engine.check('AAPL', 80.0)
+        engine.fire_pending()
+        self.assertFalse(Holding.objects.filter(portfolio=self.portfolio).exists())
+        self.assertEqual(Trade.objects.filter(trade_type='sell').last().quantity, 2)
+        self.assertIsNotNone(Trade.objects.filter(trade_type='buy').get().trigger_fired_at)
+
+    def test_price_feed_checks_triggers_and_fires_on_flush(self):
+        execute_trade(self.portfolio, 'buy', 'AAPL', 10, 100.0, price_ceiling=110.0)
+        engine = TriggerEngine()
+        feed = PriceFeed(stream=MagicMock(), book=PriceBook(max_age=60), engines=[engine])
+        feed.sync_subscriptions()
+
+        asyncio.run(feed.on_trade(MagicMock(symbol='AAPL', price=111.0, timestamp=None)))
+        feed.flush()
+        self.assertFalse(Holding.objects.filter(portfolio=self.portfolio).exists())
+
+    def test_benchmark_command(self):
+        out = StringIO()
+        call_command('benchmark_triggers', '--triggers', '1000', '--ticks', '1000', stdout=out)
+        self.assertIn('ticks/s', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('benchmark_triggers', '--triggers', '10', '--ticks', '10', '--min-rate', '1e12', stdout=out)
+
+class AlertEvaluatorTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='alertuser', password='alertpass')
+
+    def alert(self, symbol, target_price):
+        return StockAlert.objects.create(user=self.user, symbol=symbol, target_price=target_price)
+
+    def active_ids(self):
+        return set(StockAlert.objects.filter(is_active=True).values_list('id', flat=True))
+
+    def test_alerts_fire_when_price_crosses_target(self):
+        above, below = self.alert('AAPL', 110), self.alert('AAPL', 90)
+        far, other = self.alert('AAPL', 200), self.alert('MSFT', 100)
+        fired = []
+        evaluator = AlertEvaluator(on_fired=fired.extend)
+
+        source = FakePriceSource([{'AAPL': 100.0, 'MSFT': 50.0}, {'AAPL': 105.0}, {'AAPL': 111.0}, {'AAPL': 85.0}])
+        # Loading reads ids then rows; each batch that fires is one UPDATE.
+        with self.assertNumQueries(4):
+            self.assertEqual(drive(source, [evaluator], refresh_interval=3600), 2)
+
+        self.assertEqual([(a.alert_id, a.price) for a in fired], [(above.id, 111.0), (below.id, 85.0)])
+        self.assertEqual(self.active_ids(), {far.id, other.id})
+        self.assertIsNotNone(StockAlert.objects.get(id=above.id).triggered_at)
+
+    def test_signals_keep_index_in_sync(self):
+        evaluator = AlertEvaluator()
+        evaluator.load()
+        alert = self.alert('aapl', 110)
+        self.assertEqual(evaluator.symbols(), ['AAPL'])
+
+        alert.target_price = 120
+        alert.save()
+        evaluator.check('AAPL', 100.0)
+        self.assertEqual(evaluator.check('AAPL', 115.0), [])
+
+        alert.delete()
+        self.assertEqual(len(evaluator), 0)
+
+    def test_load_reconciles_changes_from_other_processes(self):
+        evaluator = AlertEvaluator()
+        kept, removed = self.alert('AAPL', 110), self.alert('MSFT', 100)
+        evaluator.load()
+        StockAlert.objects.filter(id=removed.id).update(is_active=False)
+        StockAlert.objects.bulk_create([StockAlert(user=self.user, symbol='TSLA', target_price=300)])
+
+        evaluator.load()
+        self.assertEqual(evaluator.symbols(), ['AAPL', 'TSLA'])
+
+class BenchmarkTests(TestCase):
+    def test_reports_every_operation_and_rolls_back(self):
+        document = run_benchmarks(scales=[10], iterations=2, warmup=0, latency=0, cold_cache=True)
+        results = {r['name']: r for r in document['results']}
+        self.assertEqual(list(results), [
+            'Portfolio.total_value', 'Portfolio.total_profit_loss', 'mock_trade',
+            'dashboard', 'portfolio_details', 'get_stock_history',
+        ])
+        self.assertEqual(results['Portfolio.total_value']['queries'], 1)
+        self.assertEqual(results['Portfolio.total_value']['upstream_by_method'], {'latest_trades': 1.0})
+        self.assertLessEqual(results['Portfolio.total_value']['p50_ms'], results['Portfolio.total_value']['p99_ms'])
+        self.assertFalse(User.objects.exists())
+        self.assertFalse(Trade.objects.exists())
+        json.dumps(document)
+
+    def test_command_writes_json_and_fails_on_regression(self):
+        directory = tempfile.mkdtemp()
+        output, baseline = os.path.join(directory, 'current.json'), os.path.join(directory, 'baseline.json')
+        args = ['--scales', '5', '--iterations', '1', '--warmup', '0', '--latency', '0']
+        call_command('benchmark_app', *args, '--output', output, stdout=StringIO())
+        with open(output) as f:
+            document = json.load(f)
+        self.assertEqual(document['settings']['scales'], [5])
+        for result in document['results']:
+            result['p50_ms'] /= 1000
+        with open(baseline, 'w') as f:
+            json.dump(document, f)
+
+        with self.assertRaises(CommandError):
+            call_command('benchmark_app', *args, '--output', output, '--compare', baseline,
+                         '--max-regression', '2', stdout=StringIO())
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+        metrics.reset_metrics()
+        reset_upstream()
+        self.addCleanup(quote_cache.clear)
+
+    @patch('investment_manager_main.valuation.get_stock_quotes', return_value={})
+    def test_request_queries_and_render_time_are_recorded(self, mock_quotes):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(reverse('dashboard'))
+        self.assertEqual(response.status_code, 200)
+        timing = response['Server-Timing']
+        self.assertIn('db;dur=', timing)
+        self.assertIn(f'desc="{len(captured)} queries"', timing)
+        self.assertIn('render;dur=', timing)
+
+        counts, total, count = metrics.db_queries.snapshot('dashboard')
+        self.assertEqual((total, count), (len(captured), 1))
+        self.assertGreater(metrics.render_seconds.snapshot('dashboard')[1], 0)
+        self.assertEqual(metrics.requests_total.value('dashboard', '200'), 1)
+
+    def test_upstream_calls_are_recorded_per_endpoint(self):
+        self.addCleanup(set_provider, set_provider(SyntheticProvider()))
+        response = self.client.get(reverse('get_stock_price'), {'symbol': 'AAPL'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('upstream-latest-trades;', response['Server-Timing'])
+        self.assertEqual(metrics.upstream_calls.snapshot('get_stock_price')[1], 1)
+        self.assertEqual(metrics.upstream_seconds.snapshot('latest_trades')[2], 1)
+
+    def test_metrics_endpoint_serves_prometheus_text(self):
+        self.client.get(reverse('about'))
+        body = self.client.get('/metrics').content.decode()
+        self.assertIn('# TYPE investment_manager_request_duration_seconds histogram', body)
+        self.assertIn('investment_manager_requests_total{view="about",status="200"} 1', body)
+        self.assertIn('investment_manager_db_queries_bucket{view="about",le="+Inf"} 1', body)
+
+    @override_settings(METRICS_TOKEN=None)
+    def test_metrics_are_private_without_a_token(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.5').status_code, 403)
+        User.objects.filter(username='testuser').update(is_staff=True)
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.5').status_code, 200)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_token_is_required_when_configured(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+
 class URLResolutionTests(TestCase):
     def test_stock_history_url_resolves(self):
         match = resolve('/stock-history/AAPL/')
@@ -0,0 +1,242 @@
+"""
+Trade execution shared by the mock trade view, the order queue and the price trigger engine.
+
+With settings.MOCK_TRADE_QUEUE enabled, the view only records a MockOrder.
+Workers then claim pending orders in batches, price each distinct symbol once
+and settle the batch in a single transaction.
+"""
+
+from datetime import timedelta
+from itertools import groupby
+from operator import itemgetter
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .alpaca_api import get_stock_prices
+from .models import Holding, MockOrder, Portfolio, Trade
+
+
+def validate_limits(price: float, price_floor: Optional[float], price_ceiling: Optional[float]) -> None:
+    """Check a trade's floor and ceiling against its execution price, raising ValueError if they are inconsistent."""
+    if price_floor and price_floor > price:
+        raise ValueError("Price floor must be lower than the current price.")
+    if price_ceiling and price_ceiling < price:
+        raise ValueError("Price ceiling must be higher than the current price.")
+    if price_floor and price_ceiling and price_floor >= price_ceiling:
+        raise ValueError("Price floor must be less than price ceiling.")
+
+
+def execute_trade(portfolio: Portfolio, trade_type: str, symbol: str, quantity: int, price: float,
+                  price_floor: Optional[float] = None, price_ceiling: Optional[float] = None) -> Trade:
+    """
+    Apply a buy or sell at `price` to a portfolio's balance, aggregates and holdings, and record the trade.
+
+    Everything happens in one transaction, and every change is a conditional
+    UPDATE with F() expressions rather than a read-modify-write. A buy only
+    goes through while the balance covers it, and a sell only while enough
+    shares are held, so concurrent trades on one portfolio cannot overdraw it
+    or lose each other's updates. The portfolio instance passed in is not
+    modified; refresh it to read the new balance.
+
+    Args:
+        portfolio (Portfolio): The portfolio trading.
+        trade_type (str): "buy" or "sell".
+        symbol (str): Stock ticker symbol.
+        quantity (int): Number of shares.
+        price (float): Execution price per share.
+        price_floor (Optional[float]): Stop-loss level to store on the trade.
+        price_ceiling (Optional[float]): Take-profit level to store on the trade.
+
+    Returns:
+        Trade: The recorded trade.
+
+    Raises:
+        ValueError: If the portfolio cannot afford a buy or does not hold enough shares to sell.
+    """
+    total_value = quantity * price
+    cash = Decimal(str(total_value))
+    portfolios = Portfolio.objects.filter(pk=portfolio.pk)
+    holdings = Holding.objects.filter(portfolio_id=portfolio.pk, symbol=symbol)
+
+    with transaction.atomic():
+        if trade_type == "buy":
+            if not portfolios.filter(balance__gte=cash).update(
+                balance=F("balance") - cash,
+                invested_amount=F("invested_amount") + total_value,
+                trade_count=F("trade_count") + 1,
+            ):
+                raise ValueError("Insufficient funds for this trade.")
+            _add_shares(portfolio, holdings, symbol, quantity, price)
+        else:
+            if not holdings.filter(quantity__gte=quantity).update(quantity=F("quantity") - quantity):
+                raise ValueError("You do not have enough shares to sell.")
+            average_price, remaining = holdings.values_list("average_price", "quantity").get()
+            if remaining == 0:
+                holdings.delete()
+            cost_basis = quantity * average_price
+            portfolios.update(
+                balance=F("balance") + cash,
+                invested_amount=F("invested_amount") - cost_basis,
+                realized_profit_loss=F("realized_profit_loss") + (total_value - cost_basis),
+                trade_count=F("trade_count") + 1,
+            )
+
+        return Trade.objects.create(
+            portfolio=portfolio,
+            symbol=symbol,
+            quantity=quantity,
+            trade_type=trade_type,
+            trade_price=price,
+            price_floor=price_floor,
+            price_ceiling=price_ceiling
+        )
+
+
+def _add_shares(portfolio: Portfolio, holdings, symbol: str, quantity: int, price: float) -> None:
+    """Add bought shares to a holding, averaging the price in SQL, or create the holding."""
+    # Every SET expression reads the row's values from before the update.
+    add = lambda: holdings.update(
+        average_price=(F("average_price") * F("quantity") + quantity * price) / (F("quantity") + quantity),
+        quantity=F("quantity") + quantity,
+    )
+    if add():
+        return
+    try:
+        with transaction.atomic():
+            Holding.objects.create(portfolio=portfolio, symbol=symbol, quantity=quantity, average_price=price)
+    except IntegrityError:
+        # Another trade created the holding first.
+        add()
+
+
+def claim_orders(worker: str, batch_size: int = 100) -> List[MockOrder]:
+    """
+    Mark up to batch_size pending orders as processing by this worker and return them, oldest first.
+
+    Rows are locked with SKIP LOCKED where the database supports it, so
+    concurrent workers pick different orders instead of waiting on each other.
+    Elsewhere the claim is a conditional UPDATE, and only the rows this worker
+    actually moved to processing are returned.
+    """
+    with transaction.atomic():
+        pending = MockOrder.objects.filter(status="pending").order_by("id")
+        if connection.features.has_select_for_update_skip_locked:
+            pending = pending.select_for_update(skip_locked=True)
+        ids = list(pending.values_list("id", flat=True)[:batch_size])
+        if not ids:
+            return []
+        MockOrder.objects.filter(id__in=ids, status="pending").update(
+            status="processing", claimed_by=worker, claimed_at=timezone.now()
+        )
+    return list(MockOrder.objects.filter(id__in=ids, status="processing", claimed_by=worker).order_by("id"))
+
+
+def settle_orders(orders: List[MockOrder]) -> int:
+    """
+    Execute claimed orders with one batched quote lookup and one transaction.
+
+    Each order runs in its own savepoint, so a failed order is marked failed
+    with its error without undoing the rest of the batch.
+
+    Returns:
+        int: Number of orders completed.
+    """
+    if not orders:
+        return 0
+
+    prices = get_stock_prices({order.symbol for order in orders})
+    completed = 0
+    with transaction.atomic():
+        portfolios: Dict[int, Portfolio] = Portfolio.objects.in_bulk({order.portfolio_id for order in orders})
+        for order in orders:
+            order.price_at_execution = prices.get(order.symbol)
+            portfolio = portfolios.get(order.portfolio_id)
+            try:
+                if portfolio is None:
+                    raise ValueError("Portfolio no longer exists.")
+                if order.price_at_execution is None:
+                    raise ValueError("Could not retrieve stock price.")
+                validate_limits(order.price_at_execution, order.price_floor, order.price_ceiling)
+                with transaction.atomic():
+                    execute_trade(portfolio, order.order_type, order.symbol, order.quantity,
+                                  order.price_at_execution, order.price_floor, order.price_ceiling)
+            except ValueError as e:
+                order.status, order.error = "failed", str(e)
+            else:
+                order.status, order.error = "completed", ""
+                completed += 1
+
+        MockOrder.objects.bulk_update(orders, ["status", "error", "price_at_execution"])
+    return completed
+
+
+def requeue_stale_orders(older_than: timedelta) -> int:
+    """Return orders stuck in processing, e.g. after a worker crashed, to the pending queue."""
+    return MockOrder.objects.filter(status="processing", claimed_at__lt=timezone.now() - older_than).update(
+        status="pending", claimed_by="", claimed_at=None
+    )
+
+
+def process_orders(worker: str, batch_size: int = 100) -> int:
+    """Claim and settle one batch of pending orders. Returns how many orders were claimed."""
+    orders = claim_orders(worker, batch_size)
+    settle_orders(orders)
+    return len(orders)
+
+
+def replay_trades(portfolio: Portfolio) -> List[Holding]:
+    """
+    Recompute a portfolio's trade aggregates in memory by replaying its trade history.
+
+    Trades are streamed ordered by symbol, so each symbol is replayed in one
+    pass with only its running position in memory. Nothing is saved.
+
+    Returns:
+        List[Holding]: Unsaved holdings for the positions still open, at average cost.
+    """
+    portfolio.invested_amount = 0
+    portfolio.realized_profit_loss = 0
+    portfolio.trade_count = 0
+    holdings = []
+
+    trades = (
+        Trade.objects.filter(portfolio=portfolio)
+        .order_by("symbol", "timestamp", "id")
+        .values_list("symbol", "trade_type", "quantity", "trade_price")
+    )
+    for symbol, rows in groupby(trades.iterator(chunk_size=5000), key=itemgetter(0)):
+        shares, average_price = 0, 0.0
+        for _, trade_type, quantity, price in rows:
+            if trade_type == "buy":
+                portfolio.record_trade(trade_type, quantity, price)
+                average_price = (shares * average_price + quantity * price) / (shares + quantity)
+                shares += quantity
+            else:
+                portfolio.record_trade(trade_type, quantity, price, average_price)
+                shares = max(shares - quantity, 0)
+        if shares:
+            holdings.append(Holding(portfolio=portfolio, symbol=symbol, quantity=shares, average_price=average_price))
+    return holdings
+
+
+def rebuild_positions(portfolio: Portfolio, symbols: Optional[Iterable[str]] = None) -> None:
+    """
+    Recompute and save a portfolio's trade aggregates and holdings with replay_trades.
+
+    The aggregates always cover every symbol; holdings are rewritten only for
+    `symbols`, or for all of them when it is None.
+    """
+    rewrite = None if symbols is None else set(symbols)
+    holdings = [h for h in replay_trades(portfolio) if rewrite is None or h.symbol in rewrite]
+
+    with transaction.atomic():
+        stale = Holding.objects.filter(portfolio=portfolio)
+        if rewrite is not None:
+            stale = stale.filter(symbol__in=rewrite)
+        stale.delete()
+        Holding.objects.bulk_create(holdings)
+        portfolio.save(update_fields=["invested_amount", "realized_profit_loss", "trade_count"])
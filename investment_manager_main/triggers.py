@@ -0,0 +1,182 @@
+"""
+Stop-loss and take-profit triggers.
+
+Every buy trade with a price_floor or price_ceiling that has not fired yet is
+held in memory in two sorted ladders per symbol. A price update bisects each
+ladder once, so finding the crossed triggers costs O(log n + fired) however
+many triggers are open. Fired triggers are queued and their sells executed
+later in batched transactions, away from the thread receiving prices.
+"""
+
+import threading
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Holding, Portfolio, Trade
+from .trading import execute_trade
+
+BATCH_SIZE = 100
+
+
+class Trigger(NamedTuple):
+    trade_id: int
+    portfolio_id: int
+    symbol: str
+    quantity: int
+    floor: Optional[float]
+    ceiling: Optional[float]
+
+
+class PriceLadder:
+    """Price levels for one symbol, kept sorted as (level, id) so ranges can be taken by bisection."""
+
+    __slots__ = ("entries",)
+
+    def __init__(self):
+        self.entries: List[Tuple[float, int]] = []
+
+    def add(self, level: float, item_id: int) -> None:
+        insort(self.entries, (level, item_id))
+
+    def remove(self, level: float, item_id: int) -> None:
+        i = bisect_left(self.entries, (level, item_id))
+        if i < len(self.entries) and self.entries[i] == (level, item_id):
+            del self.entries[i]
+
+    def take_at_or_above(self, price: float) -> List[Tuple[float, int]]:
+        i = bisect_left(self.entries, (price, -1))
+        taken, self.entries[i:] = self.entries[i:], []
+        return taken
+
+    def take_at_or_below(self, price: float) -> List[Tuple[float, int]]:
+        i = bisect_right(self.entries, (price, float("inf")))
+        taken, self.entries[:i] = self.entries[:i], []
+        return taken
+
+    def take_between(self, low: float, high: float) -> List[Tuple[float, int]]:
+        i = bisect_left(self.entries, (low, -1))
+        j = bisect_right(self.entries, (high, float("inf")), i)
+        taken, self.entries[i:j] = self.entries[i:j], []
+        return taken
+
+
+class TriggerEngine:
+    """
+    In-memory index of open price triggers.
+
+    A trade's floor and ceiling are one-cancels-the-other: when either is
+    crossed, both are removed and a single sell is queued.
+    """
+
+    def __init__(self):
+        self._floors: Dict[str, PriceLadder] = defaultdict(PriceLadder)
+        self._ceilings: Dict[str, PriceLadder] = defaultdict(PriceLadder)
+        self._triggers: Dict[int, Trigger] = {}
+        self._pending: List[Tuple[Trigger, float]] = []
+        self._lock = threading.Lock()
+        self.last_trade_id = 0
+
+    def __len__(self) -> int:
+        return len(self._triggers)
+
+    def add(self, trigger: Trigger) -> None:
+        with self._lock:
+            if trigger.trade_id in self._triggers:
+                return
+            self._triggers[trigger.trade_id] = trigger
+            if trigger.floor is not None:
+                self._floors[trigger.symbol].add(trigger.floor, trigger.trade_id)
+            if trigger.ceiling is not None:
+                self._ceilings[trigger.symbol].add(trigger.ceiling, trigger.trade_id)
+
+    def load(self) -> int:
+        """Add open triggers from trades created since the last load. Returns how many were added."""
+        rows = (
+            Trade.objects.filter(trade_type="buy", trigger_fired_at__isnull=True, id__gt=self.last_trade_id)
+            .filter(Q(price_floor__isnull=False) | Q(price_ceiling__isnull=False))
+            .order_by("id")
+            .values_list("id", "portfolio_id", "symbol", "quantity", "price_floor", "price_ceiling")
+        )
+        added = 0
+        for row in rows.iterator(chunk_size=5000):
+            self.add(Trigger(*row))
+            self.last_trade_id = row[0]
+            added += 1
+        return added
+
+    def check(self, symbol: str, price: float) -> List[Trigger]:
+        """
+        Remove and queue every trigger for symbol that price has crossed.
+
+        A floor fires when the price falls to or below it, a ceiling when the
+        price rises to or above it.
+        """
+        floors, ceilings = self._floors.get(symbol), self._ceilings.get(symbol)
+        if floors is None and ceilings is None:
+            return []
+
+        with self._lock:
+            crossed = (floors.take_at_or_above(price) if floors else []) + \
+                      (ceilings.take_at_or_below(price) if ceilings else [])
+            fired = []
+            for _, trade_id in crossed:
+                trigger = self._triggers.pop(trade_id, None)
+                if trigger is None:
+                    continue
+                if trigger.floor is not None:
+                    self._floors[symbol].remove(trigger.floor, trade_id)
+                if trigger.ceiling is not None:
+                    self._ceilings[symbol].remove(trigger.ceiling, trade_id)
+                fired.append(trigger)
+                self._pending.append((trigger, price))
+        return fired
+
+    def fire_pending(self, batch_size: int = BATCH_SIZE) -> int:
+        """Execute the sells for every queued trigger. Returns how many triggers were fired."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for start in range(0, len(pending), batch_size):
+            fire_triggers(pending[start:start + batch_size])
+        return len(pending)
+
+
+def fire_triggers(fired: List[Tuple[Trigger, float]]) -> None:
+    """
+    Sell the shares bought by each fired trigger's trade, in one transaction.
+
+    Each sell is capped at the shares still held, and a sell that fails only
+    rolls back itself. Every trigger in the batch is marked fired either way,
+    so it is not loaded again.
+    """
+    if not fired:
+        return
+
+    with transaction.atomic():
+        portfolios = Portfolio.objects.in_bulk({trigger.portfolio_id for trigger, _ in fired})
+        held = {
+            (portfolio_id, symbol): quantity
+            for portfolio_id, symbol, quantity in Holding.objects.filter(
+                portfolio_id__in=portfolios, symbol__in={trigger.symbol for trigger, _ in fired}
+            ).values_list("portfolio_id", "symbol", "quantity")
+        }
+
+        for trigger, price in fired:
+            portfolio = portfolios.get(trigger.portfolio_id)
+            key = (trigger.portfolio_id, trigger.symbol)
+            quantity = min(trigger.quantity, held.get(key, 0))
+            if portfolio is None or quantity <= 0:
+                continue
+            try:
+                with transaction.atomic():
+                    execute_trade(portfolio, "sell", trigger.symbol, quantity, price)
+            except ValueError as e:
+                print(f"Error firing trigger for trade {trigger.trade_id}: {e}")
+                continue
+            held[key] -= quantity
+
+        Trade.objects.filter(id__in=[trigger.trade_id for trigger, _ in fired]).update(trigger_fired_at=timezone.now())
@@ -13,11 +13,18 @@ urlpatterns = [
     path('portfolio/<int:portfolio_id>/', views.portfolio_details, name='portfolio_details'),  
     path('portfolio/<int:portfolio_id>/delete/', views.delete_portfolio, name='delete_portfolio'), 
     path('portfolio/<int:portfolio_id>/mock-trade/', views.mock_trade, name='mock_trade'),
+    path('portfolio/<int:portfolio_id>/analytics/', views.portfolio_analytics_view, name='portfolio_analytics'),
+    path('portfolio/<int:portfolio_id>/analytics/data/', views.portfolio_analytics_data, name='portfolio_analytics_data'),
+    path('portfolio/<int:portfolio_id>/export/<str:dataset>/', views.export_portfolio_view, name='export_portfolio'),
+    path('portfolio/<int:portfolio_id>/import/', views.import_trades_view, name='import_trades'),
+    path('portfolio/<int:portfolio_id>/trade-distribution/', views.portfolio_trade_distribution, name='portfolio_trade_distribution'),
+    path('portfolio/<int:portfolio_id>/performance/', views.portfolio_performance_data, name='portfolio_performance_data'),
     path("get-stock-price/", views.get_stock_price_view, name="get_stock_price"),
     path("api/holdings/", views.get_user_holding, name="get_user_holding"),
     path("get-stock-history/", views.get_stock_history, name="get_stock_history"),
     path("contact/", views.contact, name="contact"),
     path("about/", views.about, name="about"),
+    path("metrics", views.metrics_view, name="metrics"),
     path("stock-search/", views.stock_search, name="stock_search"),
     path("stock-history/<str:symbol>/", views.stock_history_display, name="stock_history_display"),
     path("external-information/", views.external_information, name="external_information"),
@@ -0,0 +1,99 @@
+"""
+Portfolio valuation.
+
+Values any number of portfolios with one holdings query and one batched quote
+lookup, so portfolios that share tickers only pay for each quote once.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+
+import pytz
+from asgiref.sync import sync_to_async
+
+from .alpaca_api import Quote, aget_stock_quotes, get_stock_quotes
+from .models import Holding, Portfolio
+
+
+@dataclass
+class PortfolioValuation:
+    portfolio: Portfolio
+    holdings: List[Holding]
+    total_value: float
+    total_profit_loss: float
+    gains_percentage: float
+
+
+@dataclass
+class Valuation:
+    portfolios: List[PortfolioValuation]
+    total_value: float
+    prices: Dict[str, Optional[float]]
+    priced_at: datetime
+
+    def for_portfolio(self, portfolio_id: int) -> Optional[PortfolioValuation]:
+        return next((v for v in self.portfolios if v.portfolio.id == portfolio_id), None)
+
+
+def value_portfolios(portfolios) -> Valuation:
+    """
+    Price every holding in the given portfolios in one pass.
+
+    Holdings are prefetched in a single query, symbols are deduplicated across
+    portfolios and priced with one get_stock_quotes call. Each holding gets
+    current_price and current_value attributes for display.
+
+    Args:
+        portfolios: A Portfolio queryset.
+
+    Returns:
+        Valuation: Per-portfolio and total values, the prices used, and the
+        fetch time of the oldest quote used.
+    """
+    portfolios = _load(portfolios)
+    return _assemble(portfolios, get_stock_quotes(_symbols(portfolios)))
+
+
+async def avalue_portfolios(portfolios) -> Valuation:
+    """Async version of value_portfolios."""
+    portfolios = await sync_to_async(_load)(portfolios)
+    return _assemble(portfolios, await aget_stock_quotes(_symbols(portfolios)))
+
+
+def _load(portfolios) -> List[Portfolio]:
+    return list(portfolios.prefetch_related("holdings"))
+
+
+def _symbols(portfolios: List[Portfolio]) -> Set[str]:
+    return {h.symbol for p in portfolios for h in p.holdings.all()}
+
+
+def _assemble(portfolios: List[Portfolio], quotes: Dict[str, Quote]) -> Valuation:
+    prices = {symbol: quote.price for symbol, quote in quotes.items()}
+    priced_at = min((quote.as_of for quote in quotes.values()), default=datetime.now(pytz.UTC))
+
+    valuations = []
+    for portfolio in portfolios:
+        holdings = list(portfolio.holdings.all())
+        for holding in holdings:
+            holding.current_price = prices.get(holding.symbol)
+            holding.current_value = holding.current_price * holding.quantity if holding.current_price else 0
+        valuations.append(PortfolioValuation(
+            portfolio=portfolio,
+            holdings=holdings,
+            total_value=portfolio.total_value(prices),
+            total_profit_loss=portfolio.total_profit_loss(prices),
+            gains_percentage=portfolio.gains_percentage(prices),
+        ))
+
+    return Valuation(
+        portfolios=valuations,
+        total_value=sum(v.total_value for v in valuations),
+        prices=prices,
+        priced_at=priced_at,
+    )
+
+
+def value_user_portfolios(user) -> Valuation:
+    return value_portfolios(Portfolio.objects.filter(user=user).order_by("id"))
@@ -1,14 +1,32 @@
-
+import asyncio
+import hashlib
+import io
+import json
+from functools import wraps
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
 from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required
-from django.db.models import Sum
-import pandas as pd
-from .alpaca_api import get_stock_price, get_historical_data
-from .models import Portfolio, Holding, Trade, ContactMessage
-from decimal import Decimal
-from django.http import JsonResponse
+from django.contrib.auth.views import redirect_to_login
+from django.db.models import Q, Sum
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.crypto import constant_time_compare
+from django.utils.http import quote_etag
+from django.utils.dateparse import parse_datetime
+from datetime import timedelta
+from .alpaca_api import get_stock_price, aget_stock_price
+from .exports import export_portfolio
+from .imports import import_trades
+from .metrics import render_metrics
+from .bar_store import get_daily_bars, aget_daily_bars
+from .intraday import get_intraday_bars, aget_intraday_bars, last_session
+from .models import Portfolio, Holding, Trade, MockOrder, ContactMessage
+from .trading import execute_trade, validate_limits
+from .valuation import value_portfolios, avalue_portfolios, value_user_portfolios
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 
 def home(request):
     if request.user.is_authenticated:
@@ -19,14 +37,14 @@ def home(request):
 
 @login_required
 def dashboard(request):
-    portfolios = Portfolio.objects.filter(user=request.user)
-    total_value = sum(p.total_value() for p in portfolios)  
+    valuation = value_user_portfolios(request.user)
 
     return render(request, "dashboard.html", {
         "user": request.user, 
-        "portfolios": portfolios,
-        "total_value": total_value,
-        "no_portfolios": len(portfolios) == 0
+        "portfolios": valuation.portfolios,
+        "total_value": valuation.total_value,
+        "priced_at": valuation.priced_at,
+        "no_portfolios": len(valuation.portfolios) == 0
     })
 def register(request):
     if request.method == 'POST':
@@ -53,63 +71,34 @@ def mock_trade(request, portfolio_id):
             qty = int(qty)
             if qty <= 0:
                 raise ValueError("Quantity must be greater than zero.")
+            if trade_type not in ("buy", "sell"):
+                raise ValueError("Invalid trade type.")
 
-            current_price = get_stock_price(symbol)
-            if current_price is None:
-                raise ValueError("Could not retrieve stock price.")
-
-            total_value = qty * current_price
             price_floor = float(price_floor) if price_floor and price_floor.strip() else None
             price_ceiling = float(price_ceiling) if price_ceiling and price_ceiling.strip() else None
 
-            if price_floor and price_floor > current_price:
-                raise ValueError("Price floor must be lower than the current price.")
-            if price_ceiling and price_ceiling < current_price:
-                raise ValueError("Price ceiling must be higher than the current price.")
-            if price_floor and price_ceiling and price_floor >= price_ceiling:
-                raise ValueError("Price floor must be less than price ceiling.")
-
-            if trade_type == "buy":
-                if portfolio.balance < total_value:
-                    raise ValueError("Insufficient funds for this trade.")
-                portfolio.balance -= Decimal(str(total_value))
-            elif trade_type == "sell":
-                holding = Holding.objects.filter(portfolio=portfolio, symbol=symbol).first()
-                if not holding or holding.quantity < qty:
-                    raise ValueError("You do not have enough shares to sell.")
-                portfolio.balance += Decimal(str(total_value))
-                holding.quantity -= qty
-                if holding.quantity == 0:
-                    holding.delete()
-                else:
-                    holding.save()
-            else:
-                raise ValueError("Invalid trade type.")
-
-            portfolio.save()
-
-            Trade.objects.create(
-                portfolio=portfolio,
-                symbol=symbol,
-                quantity=qty,
-                trade_type=trade_type,
-                trade_price=current_price,
-                price_floor=price_floor,
-                price_ceiling=price_ceiling
-            )
-
-            if trade_type == "buy":
-                holding, created = Holding.objects.get_or_create(
+            if settings.MOCK_TRADE_QUEUE:
+                # Priced and settled by the process_mock_orders worker.
+                if not symbol:
+                    raise ValueError("Please enter a stock symbol.")
+                MockOrder.objects.create(
+                    user=request.user,
                     portfolio=portfolio,
                     symbol=symbol,
-                    defaults={"quantity": qty, "average_price": current_price}
+                    quantity=qty,
+                    order_type=trade_type,
+                    price_floor=price_floor,
+                    price_ceiling=price_ceiling,
                 )
-                if not created:
-                    total_shares = holding.quantity + qty
-                    new_avg = ((holding.average_price * holding.quantity) + (current_price * qty)) / total_shares
-                    holding.quantity = total_shares
-                    holding.average_price = new_avg
-                    holding.save()
+                return redirect("portfolio_details", portfolio_id=portfolio.id)
+
+            current_price = get_stock_price(symbol)
+            if current_price is None:
+                raise ValueError("Could not retrieve stock price.")
+
+            validate_limits(current_price, price_floor, price_ceiling)
+
+            execute_trade(portfolio, trade_type, symbol, qty, current_price, price_floor, price_ceiling)
 
             return redirect("portfolio_details", portfolio_id=portfolio.id)
 
@@ -150,49 +139,183 @@ def login_view(request):
 
     return render(request, "registration/login.html", {"form": form})
 
-@login_required
-def portfolio_details(request, portfolio_id):
-    portfolio = get_object_or_404(Portfolio, id=portfolio_id, user=request.user)
-    holdings = portfolio.holdings.all()
-    trades = portfolio.trades.all()
+def async_login_required(view):
+    """login_required for async views; Django 4.2's decorator only wraps sync views."""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if not await sync_to_async(lambda: request.user.is_authenticated)():
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    return wrapper
 
-    trade_symbols = list(trades.values_list("symbol", flat=True))
-    trade_quantity = list(trades.values_list("quantity", flat=True))
+TRADE_PAGE_SIZE = 50
 
+def encode_trade_cursor(trade):
+    return f"{trade.timestamp.isoformat()}|{trade.id}"
 
-    for holding in holdings:
-        holding.current_price = get_stock_price(holding.symbol)
-        holding.current_value = holding.current_price * holding.quantity if holding.current_price else 0
+def decode_trade_cursor(cursor):
+    """Parse a "timestamp|id" cursor, returning None if it is missing or malformed."""
+    timestamp, _, trade_id = (cursor or "").rpartition("|")
+    try:
+        timestamp = parse_datetime(timestamp)
+        trade_id = int(trade_id)
+    except ValueError:
+        return None
+    return (timestamp, trade_id) if timestamp else None
+
+def load_trade_history(portfolio_id, user, cursor=None, page_size=TRADE_PAGE_SIZE):
+    """
+    One page of a portfolio's trades, newest first, keyed on (timestamp, id).
+
+    Returns the trades and the cursor for the next (older) page, or None on the last page.
+    """
+    trades = Trade.objects.filter(portfolio_id=portfolio_id, portfolio__user=user)
+    position = decode_trade_cursor(cursor)
+    if position:
+        timestamp, trade_id = position
+        trades = trades.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=trade_id))
+    trades = list(trades.order_by("-timestamp", "-id")[:page_size + 1])
+    if len(trades) > page_size:
+        return trades[:page_size], encode_trade_cursor(trades[page_size - 1])
+    return trades, None
+
+def load_open_orders(portfolio_id, user):
+    """Queued orders that are still waiting to settle or failed in the last day."""
+    if not settings.MOCK_TRADE_QUEUE:
+        return []
+    recent = timezone.now() - timedelta(days=1)
+    return list(
+        MockOrder.objects.filter(portfolio_id=portfolio_id, user=user, timestamp__gte=recent)
+        .exclude(status="completed")
+        .order_by("-id")
+    )
+
+@async_login_required
+async def portfolio_details(request, portfolio_id):
+    cursor = request.GET.get("cursor")
+    valuation, (trades, next_cursor), open_orders = await asyncio.gather(
+        avalue_portfolios(Portfolio.objects.filter(id=portfolio_id, user=request.user)),
+        sync_to_async(load_trade_history)(portfolio_id, request.user, cursor),
+        sync_to_async(load_open_orders)(portfolio_id, request.user),
+    )
+    if not valuation.portfolios:
+        raise Http404("No Portfolio matches the given query.")
+    portfolio_valuation = valuation.portfolios[0]
+    portfolio = portfolio_valuation.portfolio
 
     context = {
         "portfolio": portfolio,
-        "holdings": holdings,
+        "holdings": portfolio_valuation.holdings,
         "trades": trades,
         "balance": portfolio.balance,
         "total_invested": portfolio.total_invested(),  
-        "total_profit_loss": portfolio.total_profit_loss(),  
-        "gains_percentage": portfolio.gains_percentage(), 
-        "trade_symbols":trade_symbols,
-        "trade_quantity":trade_quantity, 
-
+        "total_profit_loss": portfolio_valuation.total_profit_loss,  
+        "gains_percentage": portfolio_valuation.gains_percentage, 
+        "priced_at": valuation.priced_at,
+        "next_cursor": next_cursor,
+        "open_orders": open_orders,
+        "is_first_page": not cursor,
     }
 
-    return render(request, "portfolio_details.html", context)
+    return await sync_to_async(render)(request, "portfolio_details.html", context)
 
 def portfolio_statistics_view(request, portfolio_id):
     portfolio = get_object_or_404(Portfolio, id=portfolio_id, user=request.user)
+    valuation = value_portfolios(Portfolio.objects.filter(id=portfolio.id)).portfolios[0]
 
     context = {
         'portfolio': portfolio,
         'balance': portfolio.balance,
         'total_invested': portfolio.total_invested(), 
-        'total_profit_loss': portfolio.total_profit_loss(),
-        'gains_percentage': portfolio.gains_percentage(),
+        'total_profit_loss': valuation.total_profit_loss,
+        'gains_percentage': valuation.gains_percentage,
     }
     
     
     return render(request, 'portfolio_details.html', context)
 
+ANALYTICS_TIMEFRAMES = {"3M": 90, "6M": 180, "1Y": 365, "3Y": 1095, "5Y": 1825}
+
+def _load_analytics(request, portfolio_id):
+    # analytics pulls in NumPy and pandas; import it here so loading the URLconf stays cheap.
+    from .analytics import portfolio_analytics
+
+    portfolio = get_object_or_404(Portfolio, id=portfolio_id, user=request.user)
+    timeframe = request.GET.get("timeframe", "1Y")
+    if timeframe not in ANALYTICS_TIMEFRAMES:
+        timeframe = "1Y"
+    return portfolio, timeframe, portfolio_analytics(portfolio, days=ANALYTICS_TIMEFRAMES[timeframe])
+
+@login_required
+def portfolio_analytics_view(request, portfolio_id):
+    portfolio, timeframe, analytics = _load_analytics(request, portfolio_id)
+    return render(request, "analytics.html", {
+        "portfolio": portfolio,
+        "analytics": analytics,
+        "correlation_rows": list(zip(analytics.get("symbols", []), analytics.get("correlation", []))),
+        "timeframes": ANALYTICS_TIMEFRAMES,
+        "timeframe": timeframe,
+    })
+
+@login_required
+def portfolio_analytics_data(request, portfolio_id):
+    _, _, analytics = _load_analytics(request, portfolio_id)
+    return JsonResponse(analytics, status=422 if "error" in analytics else 200)
+
+@login_required
+def import_trades_view(request, portfolio_id):
+    portfolio = get_object_or_404(Portfolio, id=portfolio_id, user=request.user)
+    context = {"portfolio": portfolio}
+
+    if request.method == "POST":
+        upload = request.FILES.get("file")
+        if upload is None:
+            context["error"] = "Please choose a CSV file to import."
+        else:
+            stream = io.TextIOWrapper(upload.file, encoding="utf-8-sig", newline="")
+            try:
+                context["result"] = import_trades(portfolio, stream,
+                                                  adjust_balance=bool(request.POST.get("adjust_balance")),
+                                                  arm_triggers=bool(request.POST.get("arm_triggers")))
+            except (UnicodeDecodeError, ValueError) as e:
+                context["error"] = str(e)
+
+    return render(request, "import_trades.html", context)
+
+@login_required
+def export_portfolio_view(request, portfolio_id, dataset):
+    portfolio = get_object_or_404(Portfolio, id=portfolio_id, user=request.user)
+    fmt = request.GET.get("format", "csv")
+    try:
+        chunks, content_type = export_portfolio(portfolio, dataset, fmt)
+    except KeyError:
+        raise Http404("Unknown export.")
+
+    response = StreamingHttpResponse(chunks, content_type=content_type)
+    response["Content-Disposition"] = f'attachment; filename="portfolio-{portfolio.id}-{dataset}.{fmt}"'
+    return response
+
+@login_required
+def portfolio_trade_distribution(request, portfolio_id):
+    portfolio = get_object_or_404(Portfolio, id=portfolio_id, user=request.user)
+    rows = (
+        Trade.objects.filter(portfolio=portfolio)
+        .values("symbol")
+        .annotate(quantity=Sum("quantity"))
+        .order_by("symbol")
+    )
+    return JsonResponse({
+        "symbols": [row["symbol"] for row in rows],
+        "quantities": [row["quantity"] for row in rows],
+    })
+
+@login_required
+def portfolio_performance_data(request, portfolio_id):
+    from .performance import performance_series
+
+    portfolio = get_object_or_404(Portfolio, id=portfolio_id, user=request.user)
+    return JsonResponse(performance_series(portfolio))
+
 @login_required
 def delete_portfolio(request, portfolio_id):
     portfolio = get_object_or_404(Portfolio, id=portfolio_id, user=request.user)
@@ -203,13 +326,13 @@ def delete_portfolio(request, portfolio_id):
 
     return render(request, "confirm_delete.html", {"portfolio": portfolio})
 
-@login_required
-def get_stock_price_view(request):
+@async_login_required
+async def get_stock_price_view(request):
     symbol = request.GET.get("symbol", "").strip().upper()
     if not symbol:
         return JsonResponse({"error": "Stock symbol is required."}, status=400)
 
-    price = get_stock_price(symbol)
+    price = await aget_stock_price(symbol)
     if price is None:
         return JsonResponse({"error": "Could not retrieve stock price."}, status=404)
 
@@ -228,33 +351,95 @@ def get_user_holding(request):
         return JsonResponse({"quantity": holding.quantity})
     return JsonResponse({"quantity": 0})
 
-@login_required
-def get_stock_history(request):
+# Points sent to history charts unless the client asks for a different max_points.
+HISTORY_MAX_POINTS = 1000
+HISTORY_MAX_POINTS_LIMIT = 10000
+
+# Chart timeframe -> (calendar days, bar size). "1D" looks back far enough to
+# reach the last trading session over a long weekend, then keeps only that session.
+HISTORY_TIMEFRAMES = {
+    "1D": (5, "1Min"),
+    "1W": (7, "5Min"),
+    "1M": (30, "1Hour"),
+    "3M": (90, "1Day"),
+    "6M": (180, "1Day"),
+    "1Y": (365, "1Day"),
+}
+
+def _trim_history(timeframe, bars):
+    if timeframe == "1D" and bars is not None:
+        return last_session(bars)
+    return bars
+
+def load_history(symbol, timeframe):
+    """Bars for a chart timeframe: daily ones from the bar store, intraday ones from the chunk cache."""
+    days, bar_size = HISTORY_TIMEFRAMES[timeframe]
+    if bar_size == "1Day":
+        return get_daily_bars(symbol, days=days)
+    return _trim_history(timeframe, get_intraday_bars(symbol, bar_size, days))
+
+async def aload_history(symbol, timeframe):
+    days, bar_size = HISTORY_TIMEFRAMES[timeframe]
+    if bar_size == "1Day":
+        return await aget_daily_bars(symbol, days=days)
+    return _trim_history(timeframe, await aget_intraday_bars(symbol, bar_size, days))
+
+@async_login_required
+async def get_stock_history(request):
+    """
+    Closing prices as columns: "start" in epoch seconds, "offsets" in
+    seconds from it, and "prices", with "bar_size" the bar each point
+    stands for. Series longer than max_points are
+    downsampled with LTTB. The response has an ETag, and a request whose
+    If-None-Match still matches gets a 304.
+    """
+    # charts pulls in NumPy and pandas; import it here so loading the URLconf stays cheap.
+    from .charts import columnar_series
+
     symbol = request.GET.get("symbol", "").upper()
     timeframe = request.GET.get("timeframe", "1Y")
-
-    timeframe_days = {
-        "1D": 1,
-        "1W": 7,
-        "1M": 30,
-        "3M": 90,
-        "6M": 180,
-        "1Y": 365
-    }.get(timeframe, 365)
+    if timeframe not in HISTORY_TIMEFRAMES:
+        timeframe = "1Y"
+    try:
+        max_points = int(request.GET.get("max_points", HISTORY_MAX_POINTS))
+    except ValueError:
+        return JsonResponse({"error": "max_points must be an integer."}, status=400)
+    if not 3 <= max_points <= HISTORY_MAX_POINTS_LIMIT:
+        return JsonResponse({"error": f"max_points must be between 3 and {HISTORY_MAX_POINTS_LIMIT}."}, status=400)
 
     try:
-        df = get_historical_data(symbol, days=timeframe_days)
+        df = await aload_history(symbol, timeframe)
         if df is None or df.empty:
             raise ValueError("No historical data found.")
 
-        df = df.sort_index()
-        return JsonResponse({
-            "dates": df.index.strftime('%Y-%m-%d').tolist(),
-            "prices": df['close'].tolist()
-        })
+        payload = {"symbol": symbol, "timeframe": timeframe, "bar_size": HISTORY_TIMEFRAMES[timeframe][1],
+                   **columnar_series(df.sort_index(), "close", max_points)}
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=400)
 
+    body = json.dumps(payload, separators=(",", ":"))
+    etag = quote_etag(hashlib.md5(body.encode(), usedforsecurity=False).hexdigest())
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(body, content_type="application/json")
+    response["ETag"] = etag
+    # Private: the view requires a login. no-cache: revalidate every time, which is cheap with the ETag.
+    response["Cache-Control"] = "private, no-cache"
+    return response
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint. Requires the METRICS_TOKEN bearer token when one
+    is configured; without one, only staff users and loopback clients may read it.
+    """
+    token = settings.METRICS_TOKEN
+    if token:
+        if not constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}"):
+            return HttpResponse("Unauthorized", status=401, content_type="text/plain")
+    elif not (request.user.is_staff or request.META.get("REMOTE_ADDR") in ("127.0.0.1", "::1")):
+        return HttpResponse("Forbidden", status=403, content_type="text/plain")
+    return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
 def about(request):
     return render(request, "about.html")
 
@@ -283,34 +468,30 @@ def stock_search(request):
 @login_required
 def stock_history_display(request, symbol):
     timeframe = request.GET.get("timeframe", "1Y")
-    timeframe_days = {
-        "1D": 1, "1W": 7, "1M": 30, "3M": 90, "6M": 180, "1Y": 365
-    }.get(timeframe, 365)
+    if timeframe not in HISTORY_TIMEFRAMES:
+        timeframe = "1Y"
 
-    history = get_historical_data(symbol, days=timeframe_days)
+    history = load_history(symbol, timeframe)
     if history is None or history.empty:
         return render(request, "stock_history.html", {
             "symbol": symbol,
             "error": "No data available for this stock."
         })
 
+    # The chart loads its series from get_stock_history; the page only shows
+    # the timeframe's summary. For 1D, history is already the last session.
     metrics = {
-        "open": round(history['open'].iloc[-1], 2),
+        "open": round(history['open'].iloc[0], 2),
         "high": round(history['high'].max(), 2),
         "low": round(history['low'].min(), 2),
         "volume": int(history['volume'].sum()),
     }
 
-    dates = history.index.strftime('%Y-%m-%d').tolist()
-    prices = history['close'].tolist()
-
     return render(request, "stock_history.html", {
         "symbol": symbol,
         "company_name": f"{symbol} Inc",
         "overview": f"{symbol} is a major company in the industry.",
         "metrics": metrics,
-        "dates": dates,
-        "prices": prices,
         "initial_timeframe": timeframe
     })
 